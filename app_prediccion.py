@@ -6,11 +6,23 @@ from datetime import datetime, timedelta
 
 # IMPORTAMOS TUS HERRAMIENTAS
 from data.scraper_prediccion import obtener_media_barcelona
+from data.almacen_maestro import leer_maestro, guardar_maestro
+from data.esquema import ESQUEMA_MAESTRO, aplicar_esquema
 from models.modelo_temperatura import entrenar_modelo_temperatura 
 from models.modelo_lluvia import entrenar_modelo_lluvia
+from models.backends import BACKEND_POR_DEFECTO
+from models.prediccion import (
+    DIR_MODELOS, cargar_modelos, modelos_disponibles, calcular_prediccion_manana, publicar_prediccion
+)
+from models import monitor_drift, indice_analogos
+from data.global_feature_engineering import recalcular_features_maestro
+from perfil_memoria import perfil
 
 # === CONFIGURACIÓN ===
 RUTA_HISTORICO = "data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv" 
+# Backend de cada modelo (ver models/backends.py y models/comparar_backends.py)
+BACKEND_TEMPERATURA = BACKEND_POR_DEFECTO
+BACKEND_LLUVIA = BACKEND_POR_DEFECTO
 
 def pipeline_mantenimiento():
     """
@@ -18,100 +30,164 @@ def pipeline_mantenimiento():
     1. Lee el histórico para ver dónde nos quedamos.
     2. Decide QUÉ fecha pedir (siguiente día o actualizar hoy).
     3. Llama al scraper con esa fecha específica.
+    4. Compara la predicción de ayer con el dato real y vigila el drift.
+    5. Re-entrena solo si el error o el drift pasan de los umbrales.
+    6. Publica la predicción de mañana (prediccion_manana.json).
+    7. Añade el día al índice de días análogos.
     """
     print(" INICIANDO PIPELINE DE MANTENIMIENTO")
     print("========================================")
-    
-    # -------------------------------------------------------------------------
-    # 1. LEER EL HISTÓRICO (Para saber qué fecha pedir)
-    # -------------------------------------------------------------------------
-    if not os.path.exists(RUTA_HISTORICO):
-        print(" Error crítico: No existe el dataset maestro.")
-        return
-
-    df_historico = pd.read_csv(RUTA_HISTORICO)
-    df_historico['Fecha'] = pd.to_datetime(df_historico['Fecha'])
-    df_historico = df_historico.sort_values('Fecha')
-    
-    ultima_fecha = df_historico['Fecha'].iloc[-1].date() # Solo la fecha, sin hora
-    hoy = datetime.now().date()
-    
-    print(f" Última fecha en CSV: {ultima_fecha}")
-    print(f" Fecha real de hoy:   {hoy}")
-
-    # -------------------------------------------------------------------------
-    # 2. CALCULAR LA FECHA OBJETIVO (String)
-    # -------------------------------------------------------------------------
-    # Lógica:
-    # - Si la última fecha es menor que hoy (ayer o antes) -> Toca pedir el SIGUIENTE día.
-    # - Si la última fecha es HOY -> Toca pedir HOY otra vez (para actualizar dato).
-    
-    if ultima_fecha < hoy:
-        # Caso normal: Vamos a por el día siguiente
-        fecha_target = ultima_fecha + timedelta(days=1)
-    else:
-        # Caso actualización: Vamos a refrescar el dato de hoy
-        fecha_target = ultima_fecha
-
-    # Convertimos a String 'YYYY-MM-DD' que es lo que pide tu función
-    fecha_str = fecha_target.strftime('%Y-%m-%d')
-    
-    print(f" Fecha calculada para scrapear: {fecha_str}")
-
-    # -------------------------------------------------------------------------
-    # 3. LLAMAR AL SCRAPER (Ahora sí, con el argumento)
-    # -------------------------------------------------------------------------
+    memoria = perfil("pipeline_mantenimiento")  # Nulo salvo con METEO_PERFIL_MEMORIA=1
     try:
-        print(f" Llamando a obtener_media_barcelona('{fecha_str}')...")
-        
-        # AQUÍ ESTABA EL ERROR: Ahora le pasamos el argumento obligatorio
-        nuevos_datos = obtener_media_barcelona(fecha_str)
-        
-        datos_guardados = False
-
-        if nuevos_datos is not None and not nuevos_datos.empty:
-            # Aseguramos formato fecha en el dato recibido
-            nuevos_datos['Fecha'] = pd.to_datetime(nuevos_datos['Fecha'])
-            fecha_recibida = nuevos_datos['Fecha'].iloc[0].date()
-            
-            print(f" Dato recibido correctamente para: {fecha_recibida}")
-
-            # --- Lógica de Guardado ---
-            if fecha_recibida > ultima_fecha:
-                print(" ES UN DÍA NUEVO. Añadiendo al final...")
-                df_actualizado = pd.concat([df_historico, nuevos_datos], ignore_index=True)
-                df_actualizado.to_csv(RUTA_HISTORICO, index=False)
-                datos_guardados = True
-                
-            elif fecha_recibida == ultima_fecha:
-                print(" ES EL MISMO DÍA. Actualizando/Sobreescribiendo...")
-                # Borramos la fila vieja y ponemos la nueva
-                df_historico = df_historico[df_historico['Fecha'].dt.date != fecha_recibida]
-                df_actualizado = pd.concat([df_historico, nuevos_datos], ignore_index=True)
-                df_actualizado.to_csv(RUTA_HISTORICO, index=False)
-                datos_guardados = True
+        memoria.marca("1_leer_historico")
+
+        # -------------------------------------------------------------------------
+        # 1. LEER EL HISTÓRICO (Para saber qué fecha pedir)
+        # -------------------------------------------------------------------------
+        if not os.path.exists(RUTA_HISTORICO):
+            print(" Error crítico: No existe el dataset maestro.")
+            return
+
+        df_historico, version = leer_maestro(RUTA_HISTORICO)
+        df_historico = df_historico.sort_values('Fecha')
+
+        ultima_fecha = df_historico['Fecha'].iloc[-1].date() # Solo la fecha, sin hora
+        hoy = datetime.now().date()
+
+        print(f" Snapshot del maestro: {version}")
+        print(f" Última fecha en CSV: {ultima_fecha}")
+        print(f" Fecha real de hoy:   {hoy}")
+
+        # -------------------------------------------------------------------------
+        # 2. CALCULAR LA FECHA OBJETIVO (String)
+        # -------------------------------------------------------------------------
+        memoria.marca("2_3_scraping_y_features")
+        # Lógica:
+        # - Si la última fecha es menor que hoy (ayer o antes) -> Toca pedir el SIGUIENTE día.
+        # - Si la última fecha es HOY -> Toca pedir HOY otra vez (para actualizar dato).
+
+        if ultima_fecha < hoy:
+            # Caso normal: Vamos a por el día siguiente
+            fecha_target = ultima_fecha + timedelta(days=1)
         else:
-            print(f" El scraper funcionó, pero Meteocat no tiene datos para {fecha_str} todavía.")
-
-    except Exception as e:
-        print(f" Error crítico durante el scraping: {e}")
-        datos_guardados = False
-
-    # -------------------------------------------------------------------------
-    # 4. RE-ENTRENAMIENTO (Si hubo cambios)
-    # -------------------------------------------------------------------------
-    es_lunes = datetime.today().weekday() == 0
-    
-    if  es_lunes:
-        print("\n Es lunes, Actualizando modelos...")
+            # Caso actualización: Vamos a refrescar el dato de hoy
+            fecha_target = ultima_fecha
+
+        # Convertimos a String 'YYYY-MM-DD' que es lo que pide tu función
+        fecha_str = fecha_target.strftime('%Y-%m-%d')
+
+        print(f" Fecha calculada para scrapear: {fecha_str}")
+
+        # -------------------------------------------------------------------------
+        # 3. LLAMAR AL SCRAPER (Ahora sí, con el argumento)
+        # -------------------------------------------------------------------------
         try:
-            entrenar_modelo_temperatura()
-            entrenar_modelo_lluvia()
-            print(" Modelos re-entrenados.")
+            print(f" Llamando a obtener_media_barcelona('{fecha_str}')...")
+
+            # AQUÍ ESTABA EL ERROR: Ahora le pasamos el argumento obligatorio
+            nuevos_datos = obtener_media_barcelona(fecha_str)
+
+            datos_guardados = False
+
+            if nuevos_datos is not None and not nuevos_datos.empty:
+                # Mismos tipos que el histórico (float32 + fecha) para que el concat no suba a float64
+                nuevos_datos = aplicar_esquema(nuevos_datos, ESQUEMA_MAESTRO)
+                fecha_recibida = nuevos_datos['Fecha'].iloc[0].date()
+
+                print(f" Dato recibido correctamente para: {fecha_recibida}")
+
+                # --- Lógica de Guardado ---
+                if fecha_recibida > ultima_fecha:
+                    print(" ES UN DÍA NUEVO. Añadiendo al final...")
+                    df_actualizado = pd.concat([df_historico, nuevos_datos], ignore_index=True)
+                    datos_guardados = True
+
+                elif fecha_recibida == ultima_fecha:
+                    print(" ES EL MISMO DÍA. Actualizando/Sobreescribiendo...")
+                    # Borramos la fila vieja y ponemos la nueva
+                    df_previo = df_historico[df_historico['Fecha'].dt.date != fecha_recibida]
+                    df_actualizado = pd.concat([df_previo, nuevos_datos], ignore_index=True)
+                    datos_guardados = True
+
+                if datos_guardados:
+                    # El scraper solo trae medidas: recalculamos features y targets de la cola
+                    df_historico = recalcular_features_maestro(df_actualizado)
+                    version = guardar_maestro(df_historico, RUTA_HISTORICO, index=False)
+            else:
+                print(f" El scraper funcionó, pero Meteocat no tiene datos para {fecha_str} todavía.")
+
         except Exception as e:
-            print(f" Error re-entrenando: {e}")
-    else:
-        print("\n No se requiere re-entrenamiento.")
+            print(f" Error crítico durante el scraping: {e}")
+            datos_guardados = False
+
+        # -------------------------------------------------------------------------
+        # 4. MONITORIZACIÓN (Predicción vs Real + Distribución de variables)
+        # -------------------------------------------------------------------------
+        memoria.marca("4_monitorizacion")
+        estado = monitor_drift.cargar_estado()
+        fila_dia = df_historico.iloc[-1]
+
+        if datos_guardados:
+            monitor_drift.registrar_observacion(estado, fila_dia)
+            monitor_drift.actualizar_distribucion(estado, fila_dia)
+
+        mae, brier, n_dias = monitor_drift.errores_recientes(estado)
+        if n_dias:
+            print(f"\n Error reciente ({n_dias} días): MAE {mae:.2f} °C | Brier lluvia {brier:.3f}")
+
+        # -------------------------------------------------------------------------
+        # 5. RE-ENTRENAMIENTO (Solo si hay drift o el error se dispara)
+        # -------------------------------------------------------------------------
+        memoria.marca("5_reentreno")
+        reentrenar, motivos = monitor_drift.decidir_reentreno(
+            estado, hoy, modelos_presentes=modelos_disponibles()
+        )
+        for motivo in motivos:
+            print(f"   - {motivo}")
+
+        if reentrenar:
+            print("\n Drift o degradación detectados, Actualizando modelos...")
+            try:
+                entrenar_modelo_temperatura(BACKEND_TEMPERATURA)
+                entrenar_modelo_lluvia(BACKEND_LLUVIA)
+                monitor_drift.marcar_reentreno(estado, df_historico, hoy)
+                print(" Modelos re-entrenados.")
+            except Exception as e:
+                print(f" Error re-entrenando: {e}")
+        else:
+            print("\n No se requiere re-entrenamiento.")
+
+        # -------------------------------------------------------------------------
+        # 6. PREDICCIÓN PARA MAÑANA (Se publica ya: el dashboard solo lee el JSON)
+        # -------------------------------------------------------------------------
+        memoria.marca("6_prediccion")
+        if modelos_disponibles(DIR_MODELOS):
+            # La versión publicada se calcula del mismo directorio del que se cargan los modelos
+            registro = calcular_prediccion_manana(df_historico, cargar_modelos(DIR_MODELOS), version, DIR_MODELOS)
+            publicar_prediccion(registro)
+            # Queda pendiente en el monitor hasta que llegue el dato real
+            monitor_drift.registrar_prediccion(
+                estado, registro['fecha_prediccion'], registro['temp_media_c'], registro['prob_lluvia']
+            )
+            print(f" Predicción publicada para {registro['fecha_prediccion']}: "
+                  f"{registro['temp_media_c']:.1f} °C | Lluvia {registro['prob_lluvia']*100:.0f} % "
+                  f"(modelo {registro['version_modelo']})")
+
+        monitor_drift.guardar_estado(estado)
+
+        # -------------------------------------------------------------------------
+        # 7. ÍNDICE DE DÍAS ANÁLOGOS (Incremental: solo la cola nueva)
+        # -------------------------------------------------------------------------
+        memoria.marca("7_indice_analogos")
+        if datos_guardados:
+            try:
+                nuevos, actualizados = indice_analogos.actualizar_indice_guardado(df_historico)
+                print(f" Índice de análogos: {nuevos} días nuevos, {actualizados} actualizados.")
+            except Exception as e:
+                print(f" Error actualizando el índice de análogos: {e}")
+    finally:
+        # También en las salidas anticipadas: si no, el perfil queda abierto
+        memoria.fin()
 
 if __name__ == "__main__":
     pipeline_mantenimiento()
\ No newline at end of file
@@ -0,0 +1,211 @@
+import os
+import argparse
+import hashlib
+import tempfile
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from data.esquema import ESQUEMA_ESTACION, COLUMNA_FECHA, aplicar_esquema, leer_csv_tipado
+
+# =================================================================
+# ALMACÉN DE ESTACIONES (Parquet particionado por estación y año)
+# =================================================================
+# Los CSV de histórico completo obligaban a leer (y reescribir) 17 años
+# para tocar un día. Ahora cada capa guarda un Parquet por año:
+#     data/estaciones/<capa>/<estacion>/<año>.parquet   (capa: raw | clean)
+#   - Lectura: solo se abren los años del rango pedido, y dentro de cada
+#     fichero se empujan al lector el filtro de fechas y las columnas.
+#   - Escritura: upsert por fecha en los años afectados (commit atómico
+#     por fichero, igual que el maestro). Un día nuevo = un año reescrito.
+#   - Huella: cada partición guarda en su metadata un hash de su contenido
+#     y, si se deriva de otra capa, las huellas de origen. Así la limpieza
+#     y la fusión saben qué años han cambiado leyendo solo los footers.
+
+HERE = Path(__file__).resolve().parent
+DIR_ESTACIONES = HERE / "estaciones"
+CAPAS = ("raw", "clean")
+
+# CSV de histórico completo (formato anterior): solo para --migrar
+CSV_ANTERIORES = {
+    "raw": HERE / "raw_datasets" / "meteocat_{estacion}_resumen_historico.csv",
+    "clean": HERE / "clean_datasets" / "clean_meteocat_{estacion}_resumen_historico.csv",
+}
+
+CLAVE_HUELLA = b"huella"
+CLAVE_ORIGEN = b"origen"
+
+
+def dir_estacion(capa, estacion):
+    if capa not in CAPAS:
+        raise ValueError(f"Capa desconocida '{capa}'. Disponibles: {CAPAS}")
+    return DIR_ESTACIONES / capa / estacion
+
+
+def ruta_particion(capa, estacion, anio):
+    return dir_estacion(capa, estacion) / f"{anio}.parquet"
+
+
+def anios_disponibles(capa, estacion):
+    carpeta = dir_estacion(capa, estacion)
+    if not carpeta.exists():
+        return []
+    return sorted(int(p.stem) for p in carpeta.glob("*.parquet"))
+
+
+def estaciones_disponibles(capa):
+    carpeta = DIR_ESTACIONES / capa
+    return sorted(p.name for p in carpeta.iterdir() if p.is_dir()) if carpeta.exists() else []
+
+
+# -----------------------------------------------------------
+# HUELLAS (Solo se lee el footer de cada Parquet)
+# -----------------------------------------------------------
+def _metadata(ruta):
+    return pq.read_schema(ruta).metadata or {}
+
+
+def huellas(capa, estacion):
+    """Salida: dict año -> huella de contenido de esa partición."""
+    return {
+        anio: _metadata(ruta_particion(capa, estacion, anio)).get(CLAVE_HUELLA, b"").decode()
+        for anio in anios_disponibles(capa, estacion)
+    }
+
+
+def origenes(capa, estacion):
+    """Salida: dict año -> huella de origen guardada al derivar la partición."""
+    return {
+        anio: _metadata(ruta_particion(capa, estacion, anio)).get(CLAVE_ORIGEN, b"").decode()
+        for anio in anios_disponibles(capa, estacion)
+    }
+
+
+def _huella_df(df):
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes()).hexdigest()[:16]
+
+
+# -----------------------------------------------------------
+# LECTURA CON FILTROS EMPUJADOS
+# -----------------------------------------------------------
+def leer_estacion(capa, estacion, desde=None, hasta=None, columnas=None):
+    """
+    Entrada: capa, estación, rango de fechas (incluido; None = sin límite)
+             y columnas de medida a leer (None = todas).
+    Salida: DataFrame indexado por Fecha (ordenado) con el esquema de estación.
+    """
+    desde = pd.Timestamp(desde) if desde is not None else None
+    hasta = pd.Timestamp(hasta) if hasta is not None else None
+
+    anios = [a for a in anios_disponibles(capa, estacion)
+             if (desde is None or a >= desde.year) and (hasta is None or a <= hasta.year)]
+
+    filtros = []
+    if desde is not None:
+        filtros.append((COLUMNA_FECHA, ">=", desde.to_pydatetime()))
+    if hasta is not None:
+        filtros.append((COLUMNA_FECHA, "<=", hasta.to_pydatetime()))
+    cols = None if columnas is None else [COLUMNA_FECHA] + [c for c in columnas if c != COLUMNA_FECHA]
+
+    tablas = [
+        pq.read_table(ruta_particion(capa, estacion, a), columns=cols, filters=filtros or None)
+        for a in anios
+    ]
+    if not tablas:
+        vacio = pd.DataFrame(columns=cols or [COLUMNA_FECHA, *ESQUEMA_ESTACION])
+        return aplicar_esquema(vacio, ESQUEMA_ESTACION).set_index(COLUMNA_FECHA)
+
+    tabla = pa.concat_tables(tablas).replace_schema_metadata(None)
+    df = tabla.to_pandas()
+    return df.set_index(COLUMNA_FECHA).sort_index()
+
+
+def ultima_fecha(capa, estacion):
+    anios = anios_disponibles(capa, estacion)
+    if not anios:
+        return None
+    fechas = pq.read_table(ruta_particion(capa, estacion, anios[-1]), columns=[COLUMNA_FECHA])
+    return pd.Timestamp(fechas.column(0).to_pandas().max())
+
+
+# -----------------------------------------------------------
+# ESCRITURA (Upsert por fecha en los años afectados)
+# -----------------------------------------------------------
+def _guardar_particion(df, ruta, origen=None):
+    """Commit atómico de un año: temporal en la misma carpeta + os.replace()."""
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    metadata = {CLAVE_HUELLA: _huella_df(df).encode()}
+    if origen is not None:
+        metadata[CLAVE_ORIGEN] = origen.encode()
+
+    tabla = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+    tabla = tabla.replace_schema_metadata(metadata)
+
+    fd, ruta_tmp = tempfile.mkstemp(prefix=f".{ruta.name}.", suffix=".tmp", dir=ruta.parent)
+    os.close(fd)
+    try:
+        pq.write_table(tabla, ruta_tmp, compression="zstd")
+        os.chmod(ruta_tmp, 0o644)
+        os.replace(ruta_tmp, ruta)
+    except BaseException:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+        raise
+
+
+def escribir_estacion(df, capa, estacion, origenes_por_anio=None):
+    """
+    Upsert: las fechas de df sustituyen a las guardadas; el resto se conserva.
+    Solo se reescriben los años que aparecen en df.
+    Entrada: DataFrame indexado por Fecha (medidas de estación).
+             origenes_por_anio: dict año -> huella de origen (capas derivadas).
+    Salida: lista de años reescritos.
+    """
+    df = aplicar_esquema(df.copy(), ESQUEMA_ESTACION)
+    # Parquet guarda las fechas en ms: misma unidad en todas las particiones
+    df.index = pd.to_datetime(df.index).as_unit("ms").rename(COLUMNA_FECHA)
+    origenes_por_anio = origenes_por_anio or {}
+
+    anios = sorted(df.index.year.unique())
+    for anio in anios:
+        nuevo = df[df.index.year == anio]
+        ruta = ruta_particion(capa, estacion, anio)
+        if ruta.exists():
+            previo = pq.read_table(ruta).replace_schema_metadata(None).to_pandas().set_index(COLUMNA_FECHA)
+            previo = previo[~previo.index.isin(nuevo.index)]
+            nuevo = pd.concat([previo, nuevo])
+        nuevo = aplicar_esquema(nuevo.sort_index(), ESQUEMA_ESTACION)
+        nuevo.index = nuevo.index.as_unit("ms")
+        _guardar_particion(nuevo, ruta, origenes_por_anio.get(anio))
+    return anios
+
+
+def migrar_desde_csv(capa, estacion, ruta_csv=None):
+    """Pasa un CSV de histórico completo (formato anterior) al almacén particionado."""
+    ruta_csv = Path(ruta_csv or str(CSV_ANTERIORES[capa]).format(estacion=estacion))
+    df = leer_csv_tipado(ruta_csv, ESQUEMA_ESTACION, indice_fecha=True)
+    anios = escribir_estacion(df, capa, estacion)
+    print(f" {ruta_csv.name} -> {dir_estacion(capa, estacion)} ({len(anios)} años, {len(df)} filas)")
+    return anios
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Almacén particionado de estaciones.")
+    parser.add_argument("--migrar", nargs="+", metavar="ESTACION", help="Migra los CSV raw/clean de estas estaciones")
+    parser.add_argument("--info", action="store_true", help="Años y última fecha por estación")
+    args = parser.parse_args()
+
+    if args.migrar:
+        for capa in CAPAS:
+            for est in args.migrar:
+                migrar_desde_csv(capa, est)
+        # Las particiones limpias quedan enlazadas a las raw de las que salieron
+        for est in args.migrar:
+            escribir_estacion(
+                leer_estacion("clean", est), "clean", est, huellas("raw", est)
+            )
+    if args.info:
+        for capa in CAPAS:
+            for est in estaciones_disponibles(capa):
+                anios = anios_disponibles(capa, est)
+                print(f" {capa:5s} {est}: {anios[0]}-{anios[-1]} | última fecha {ultima_fecha(capa, est).date()}")
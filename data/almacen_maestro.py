@@ -0,0 +1,90 @@
+import os
+import json
+import tempfile
+from data.esquema import ESQUEMA_MAESTRO, leer_csv_tipado
+
+# =================================================================
+# ALMACÉN DEL DATASET MAESTRO (Lecturas aisladas por snapshot)
+# =================================================================
+# El pipeline reescribe el CSV maestro mientras el dashboard y los
+# entrenadores lo leen. Para que nadie vea un fichero a medias:
+#   - Escritura: se vuelca a un temporal en la MISMA carpeta y se hace
+#     os.replace(), que es atómico. Un lector ve el fichero viejo o el
+#     nuevo, nunca uno truncado.
+#   - Versión: cada commit crea un inode nuevo, así que (inode, mtime,
+#     tamaño) identifica de forma única el snapshot. No hace falta lock.
+
+
+def _version_desde_stat(st):
+    return f"{st.st_ino}-{st.st_mtime_ns}-{st.st_size}"
+
+
+def version_maestro(ruta):
+    """
+    Devuelve el sello de versión del snapshot actual (o None si no existe).
+    Es un simple stat(): barato para comprobar en cada carga de página.
+    """
+    try:
+        return _version_desde_stat(os.stat(ruta))
+    except FileNotFoundError:
+        return None
+
+
+def leer_maestro(ruta):
+    """
+    Lee un snapshot consistente del maestro sin bloquear al escritor.
+    Salida: (DataFrame, version) -> la versión es la del fichero que
+    realmente se ha parseado (fstat sobre el descriptor abierto).
+    Los tipos salen del esquema central (float32 / Int8 / datetime).
+    """
+    with open(ruta, "rb") as f:
+        version = _version_desde_stat(os.fstat(f.fileno()))
+        df = leer_csv_tipado(f, ESQUEMA_MAESTRO)
+    return df, version
+
+
+def guardar_maestro(df, ruta, **kwargs_to_csv):
+    """
+    Commit atómico: escribe en un temporal y lo renombra encima del destino.
+    Devuelve la versión del nuevo snapshot.
+    """
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(carpeta, exist_ok=True)
+
+    fd, ruta_tmp = tempfile.mkstemp(
+        prefix=f".{os.path.basename(ruta)}.", suffix=".tmp", dir=carpeta
+    )
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            df.to_csv(f, **kwargs_to_csv)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp crea el fichero con permisos 0600: conservamos los del original
+        modo = os.stat(ruta).st_mode & 0o777 if os.path.exists(ruta) else 0o644
+        os.chmod(ruta_tmp, modo)
+        os.replace(ruta_tmp, ruta)
+    except BaseException:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+        raise
+
+    return version_maestro(ruta)
+
+
+def guardar_json_atomico(datos, ruta):
+    """Mismo commit atómico que el maestro, para los JSON pequeños de estado."""
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(carpeta, exist_ok=True)
+
+    fd, ruta_tmp = tempfile.mkstemp(
+        prefix=f".{os.path.basename(ruta)}.", suffix=".tmp", dir=carpeta
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(datos, f, indent=2, ensure_ascii=False)
+        os.chmod(ruta_tmp, 0o644)
+        os.replace(ruta_tmp, ruta)
+    except BaseException:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+        raise
@@ -0,0 +1,388 @@
+import os
+import argparse
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from data.esquema import COLUMNA_FECHA
+
+# =================================================================
+# CLIMATOLOGÍA POR DÍA DEL AÑO (Tablas persistidas + anomalías O(1))
+# =================================================================
+# "¿Es raro este día?", la previsión climatológica y las anomalías
+# necesitaban un groupby sobre todo el histórico en cada llamada. Aquí
+# se guarda, por serie (ciudad o estación), una tabla de 365 días con
+# media, desviación, cuantiles y frecuencia de lluvia por variable:
+#   - Acumuladores por (día del año, variable): n, suma, suma de
+#     cuadrados e histograma de rangos fijos. Un día nuevo suma O(1).
+#   - Registro de lo ya acumulado por fecha: si llega otra vez un día
+#     (re-scrapeo, limpieza incremental) se resta lo viejo y se suma lo
+#     nuevo. Actualizar es idempotente.
+#   - Suavizado circular (gaussiana de 7 días) entre días del año: con
+#     17 años, un solo día del año tiene muy pocas muestras. Es lineal,
+#     así que se aplica al acumular: cada día suma su peso a las ~43
+#     casillas vecinas y las tablas salen directamente de los acumuladores.
+#   - El 29 de febrero comparte casilla con el 1 de marzo.
+#   - Las features del maestro (anomalías, clima de mañana) NO usan estas
+#     tablas: con el núcleo de ±3σ, la media del día incluiría el propio
+#     día y el de mañana (el target). Se calculan con una climatología
+#     EXPANDIDA, solo con los días anteriores a cada fila, así que las
+#     filas pasadas no cambian cuando llega un día nuevo.
+#     data/climatologia/<serie>.npz es una caché local (no se versiona: se
+#     reconstruye desde el maestro o la capa raw si no existe).
+# Uso: python -m data.climatologia --serie barcelona
+
+HERE = Path(__file__).resolve().parent
+DIR_CLIMATOLOGIA = HERE / "climatologia"
+RUTA_MAESTRO = HERE / "training_datasets" / "dataset_entrenamiento_barcelona_MASTER.csv"
+
+# Rango físico fijo de cada histograma (lo que quede fuera va a los extremos)
+RANGOS = {
+    "Temp_Media_C": (-15.0, 45.0),
+    "Temp_Maxima_C": (-10.0, 50.0),
+    "Temp_Minima_C": (-20.0, 40.0),
+    "Humedad_Media_Pct": (0.0, 100.0),
+    "Precip_Total_mm": (0.0, 150.0),
+    "Viento_Maximo_kmh": (0.0, 180.0),
+    "Presion_Media_hPa": (960.0, 1050.0),
+    "Irrad_Solar_MJm2": (0.0, 40.0),
+}
+VARIABLES_CLIMA = list(RANGOS)
+
+# Variables cuya anomalía entra como feature en el maestro
+VARIABLES_ANOMALIA = ["Temp_Media_C", "Temp_Maxima_C", "Temp_Minima_C", "Humedad_Media_Pct",
+                      "Presion_Media_hPa", "Irrad_Solar_MJm2"]
+
+DIAS = 365
+N_BINS = 120
+SIGMA_DIAS = 7.0
+CUANTILES = (0.1, 0.5, 0.9)
+UMBRAL_LLUVIA_MM = 0.1   # Mismo criterio que Lluvia_Binaria
+
+
+def dia_clima(fechas):
+    """Fechas -> casilla 0..364 (el 29-F comparte casilla con el 1-M)."""
+    fechas = pd.DatetimeIndex(fechas)
+    bisiesto_tras_febrero = fechas.is_leap_year & (fechas.month > 2)
+    return np.asarray(fechas.dayofyear - 1 - bisiesto_tras_febrero, dtype=np.intp)
+
+
+def _nucleo_circular():
+    offsets = np.arange(-int(3 * SIGMA_DIAS), int(3 * SIGMA_DIAS) + 1)
+    pesos = np.exp(-0.5 * (offsets / SIGMA_DIAS) ** 2)
+    return offsets, pesos / pesos.sum()
+
+
+OFFSETS_NUCLEO, PESOS_NUCLEO = _nucleo_circular()
+
+
+class Climatologia:
+    """Acumuladores + tablas suavizadas de una serie diaria."""
+
+    def __init__(self, variables=VARIABLES_CLIMA):
+        self.variables = list(variables)
+        V = len(self.variables)
+        self.bordes = np.stack([np.linspace(*RANGOS[v], N_BINS + 1) for v in self.variables])
+        # Registro: días (desde 1970) ya acumulados y sus valores
+        self.dias = np.empty(0, dtype=np.int64)
+        self.valores = np.empty((0, V), dtype=np.float32)
+        # Acumuladores (ya suavizados) por casilla del año
+        self.n = np.zeros((DIAS, V))
+        self.suma = np.zeros((DIAS, V))
+        self.suma2 = np.zeros((DIAS, V))
+        self.hist = np.zeros((DIAS, V, N_BINS))
+        self.n_lluvia = np.zeros(DIAS)
+        self.dias_lluvia = np.zeros(DIAS)
+        self._calcular_tablas()
+
+    # -----------------------------------------------------------
+    # ACUMULACIÓN
+    # -----------------------------------------------------------
+    def _acumular(self, dias, valores, signo):
+        # Cada día reparte su peso entre las casillas vecinas (núcleo gaussiano circular)
+        casilla = dia_clima(dias.astype("datetime64[D]"))
+        vecinas = (casilla[:, None] + OFFSETS_NUCLEO[None, :]) % DIAS       # (días, taps)
+        pesos = np.broadcast_to(signo * PESOS_NUCLEO, vecinas.shape)
+        for j, var in enumerate(self.variables):
+            x = valores[:, j].astype(np.float64)
+            ok = ~np.isnan(x)
+            c, w, x = vecinas[ok], pesos[ok], x[ok][:, None]
+            np.add.at(self.n[:, j], c, w)
+            np.add.at(self.suma[:, j], c, w * x)
+            np.add.at(self.suma2[:, j], c, w * x * x)
+            bins = np.clip(np.searchsorted(self.bordes[j], x, side="right") - 1, 0, N_BINS - 1)
+            np.add.at(self.hist[:, j, :], (c, np.broadcast_to(bins, c.shape)), w)
+            if var == "Precip_Total_mm":
+                np.add.at(self.n_lluvia, c, w)
+                np.add.at(self.dias_lluvia, c, w * (x > UMBRAL_LLUVIA_MM))
+
+    def actualizar(self, df):
+        """
+        Upsert de días (DataFrame con índice o columna Fecha).
+        Salida: número de días que han cambiado o son nuevos.
+        """
+        fechas = df.index if COLUMNA_FECHA not in df.columns else df[COLUMNA_FECHA]
+        dias = pd.DatetimeIndex(fechas).to_numpy().astype("datetime64[D]").astype(np.int64)
+        valores = df.reindex(columns=self.variables).to_numpy(dtype=np.float32, na_value=np.nan)
+
+        pos = np.searchsorted(self.dias, dias)
+        existe = pos < len(self.dias)
+        existe[existe] = self.dias[pos[existe]] == dias[existe]
+        previos = np.full_like(valores, np.nan)
+        previos[existe] = self.valores[pos[existe]]
+        iguales = existe & ((previos == valores) | (np.isnan(previos) & np.isnan(valores))).all(axis=1)
+
+        cambiados = existe & ~iguales
+        if cambiados.any():
+            self._acumular(dias[cambiados], previos[cambiados], -1.0)
+            self.valores[pos[cambiados]] = valores[cambiados]
+            self._acumular(dias[cambiados], valores[cambiados], 1.0)
+
+        nuevos = ~existe
+        if nuevos.any():
+            self._acumular(dias[nuevos], valores[nuevos], 1.0)
+            self.dias = np.concatenate([self.dias, dias[nuevos]])
+            self.valores = np.concatenate([self.valores, valores[nuevos]])
+            orden = np.argsort(self.dias, kind="stable")
+            self.dias, self.valores = self.dias[orden], self.valores[orden]
+
+        total = int(cambiados.sum() + nuevos.sum())
+        if total:
+            self._calcular_tablas()
+        return total
+
+    # -----------------------------------------------------------
+    # TABLAS SUAVIZADAS
+    # -----------------------------------------------------------
+    def _calcular_tablas(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.media = self.suma / self.n
+            varianza = self.suma2 / self.n - self.media ** 2
+            self.std = np.sqrt(np.clip(varianza, 0, None))
+            self.frec_lluvia = self.dias_lluvia / self.n_lluvia
+
+            # Cuantiles: CDF del histograma suavizado, interpolando dentro del bin
+            cdf = np.cumsum(self.hist, axis=2) / self.hist.sum(axis=2, keepdims=True)
+        self._cdf = cdf
+        anchura = (self.bordes[:, 1] - self.bordes[:, 0])[None, :]
+        self.cuantiles = np.full((DIAS, len(self.variables), len(CUANTILES)), np.nan)
+        for q_i, q in enumerate(CUANTILES):
+            b = np.minimum((cdf < q).sum(axis=2), N_BINS - 1)
+            cdf_antes = np.where(b > 0, np.take_along_axis(cdf, np.maximum(b - 1, 0)[..., None], 2)[..., 0], 0.0)
+            cdf_bin = np.take_along_axis(cdf, b[..., None], 2)[..., 0]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fraccion = np.clip((q - cdf_antes) / (cdf_bin - cdf_antes), 0, 1)
+            self.cuantiles[:, :, q_i] = self.bordes[:, 0][None, :] + (b + fraccion) * anchura
+
+    def _j(self, variable):
+        return self.variables.index(variable)
+
+    def valor(self, estadistico, variable, fechas):
+        """
+        Lookup O(1) por fila. estadistico: 'media' | 'std' | 'p10' | 'p50' | 'p90'.
+        Salida: array alineado con fechas.
+        """
+        c, j = dia_clima(fechas), self._j(variable)
+        if estadistico in ("media", "std"):
+            return getattr(self, estadistico)[c, j]
+        return self.cuantiles[c, j, CUANTILES.index(int(estadistico[1:]) / 100)]
+
+    def frecuencia_lluvia(self, fechas):
+        return self.frec_lluvia[dia_clima(fechas)]
+
+    def percentil(self, variable, fechas, valores):
+        """Posición (0-1) de cada valor en la distribución de su día del año."""
+        c, j = dia_clima(fechas), self._j(variable)
+        x = np.asarray(valores, dtype=np.float64)
+        b = np.clip(np.searchsorted(self.bordes[j], x, side="right") - 1, 0, N_BINS - 1)
+        cdf_antes = np.where(b > 0, self._cdf[c, j, np.maximum(b - 1, 0)], 0.0)
+        fraccion = np.clip((x - self.bordes[j][b]) / (self.bordes[j][1] - self.bordes[j][0]), 0, 1)
+        return cdf_antes + fraccion * (self._cdf[c, j, b] - cdf_antes)
+
+    def tabla(self):
+        """DataFrame de 365 filas (casilla del año) con todas las estadísticas."""
+        datos = {"dia": np.arange(1, DIAS + 1), "frec_lluvia": self.frec_lluvia}
+        for j, var in enumerate(self.variables):
+            datos[f"{var}_media"] = self.media[:, j]
+            datos[f"{var}_std"] = self.std[:, j]
+            for q_i, q in enumerate(CUANTILES):
+                datos[f"{var}_p{int(q * 100)}"] = self.cuantiles[:, j, q_i]
+        return pd.DataFrame(datos).set_index("dia")
+
+    # -----------------------------------------------------------
+    # PERSISTENCIA
+    # -----------------------------------------------------------
+    def guardar(self, ruta):
+        """Commit atómico (temporal en la misma carpeta + os.replace)."""
+        ruta = Path(ruta)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        fd, ruta_tmp = tempfile.mkstemp(prefix=f".{ruta.stem}.", suffix=".tmp.npz", dir=ruta.parent)
+        os.close(fd)
+        try:
+            np.savez_compressed(
+                ruta_tmp, variables=np.array(self.variables), dias=self.dias, valores=self.valores,
+                n=self.n, suma=self.suma, suma2=self.suma2, hist=self.hist,
+                n_lluvia=self.n_lluvia, dias_lluvia=self.dias_lluvia,
+            )
+            os.chmod(ruta_tmp, 0o644)
+            os.replace(ruta_tmp, ruta)
+        except BaseException:
+            if os.path.exists(ruta_tmp):
+                os.remove(ruta_tmp)
+            raise
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta) as d:
+            clima = cls(list(d["variables"]))
+            for campo in ("dias", "valores", "n", "suma", "suma2", "hist", "n_lluvia", "dias_lluvia"):
+                setattr(clima, campo, d[campo])
+        clima._calcular_tablas()
+        return clima
+
+
+def ruta_serie(serie):
+    return DIR_CLIMATOLOGIA / f"{serie}.npz"
+
+
+def cargar_climatologia(serie):
+    """La climatología guardada de la serie, o None si aún no existe."""
+    ruta = ruta_serie(serie)
+    return Climatologia.cargar(ruta) if ruta.exists() else None
+
+
+def actualizar_climatologia(serie, df):
+    """
+    Carga (o crea) la climatología de la serie, hace upsert de los días de
+    df y la guarda si algo ha cambiado. Salida: la climatología al día.
+    """
+    clima = cargar_climatologia(serie) or Climatologia()
+    if clima.actualizar(df) or not ruta_serie(serie).exists():
+        clima.guardar(ruta_serie(serie))
+    return clima
+
+
+# -----------------------------------------------------------
+# FEATURES DE ANOMALÍA (Climatología expandida: solo días anteriores)
+# -----------------------------------------------------------
+def _sumas(dias, valores, j_lluvia):
+    """n y suma suavizados (casilla, variable) + los de lluvia, de golpe con np.add.at."""
+    V = valores.shape[1]
+    n, suma = np.zeros((DIAS, V)), np.zeros((DIAS, V))
+    n_lluvia, dias_lluvia = np.zeros(DIAS), np.zeros(DIAS)
+    if len(dias):
+        casilla = dia_clima(dias.astype("datetime64[D]"))
+        vecinas = ((casilla[:, None] + OFFSETS_NUCLEO[None, :]) % DIAS).ravel()
+        for j in range(V):
+            x = np.repeat(valores[:, j].astype(np.float64), len(OFFSETS_NUCLEO))
+            w = np.tile(PESOS_NUCLEO, len(dias)) * ~np.isnan(x)
+            np.add.at(n[:, j], vecinas, w)
+            np.add.at(suma[:, j], vecinas, w * np.nan_to_num(x))
+            if j == j_lluvia:
+                n_lluvia, dias_lluvia = n[:, j].copy(), np.zeros(DIAS)
+                np.add.at(dias_lluvia, vecinas, w * (x > UMBRAL_LLUVIA_MM))
+    return n, suma, n_lluvia, dias_lluvia
+
+
+def climatologia_previa(clima, fechas):
+    """
+    Para cada fecha t (ordenadas), con los días del registro ANTERIORES a t:
+    (media del día de t (filas, variables), media del día de t+1 (filas,
+    variables), frecuencia de lluvia del día de t+1 (filas,)). NaN sin datos.
+    Los días previos a la primera fecha entran de golpe; el resto, uno a uno.
+    """
+    dias_f = pd.DatetimeIndex(fechas).to_numpy().astype("datetime64[D]").astype(np.int64)
+    j_lluvia = clima.variables.index("Precip_Total_mm") if "Precip_Total_mm" in clima.variables else -1
+    k = int(np.searchsorted(clima.dias, dias_f[0])) if len(dias_f) else 0
+    n, suma, n_lluvia, dias_lluvia = _sumas(clima.dias[:k], clima.valores[:k], j_lluvia)
+
+    casillas = dia_clima(dias_f.astype("datetime64[D]"))
+    casillas_manana = dia_clima((dias_f + 1).astype("datetime64[D]"))
+    casillas_reg = dia_clima(clima.dias.astype("datetime64[D]"))
+    media_hoy = np.full((len(dias_f), len(clima.variables)), np.nan)
+    media_manana = np.full_like(media_hoy, np.nan)
+    frec_manana = np.full(len(dias_f), np.nan)
+    pesos = PESOS_NUCLEO[:, None]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for i, dia in enumerate(dias_f):
+            # Entran los días del registro hasta el anterior a esta fila
+            while k < len(clima.dias) and clima.dias[k] < dia:
+                x = clima.valores[k].astype(np.float64)
+                ok = ~np.isnan(x)
+                vecinas = (casillas_reg[k] + OFFSETS_NUCLEO) % DIAS
+                n[vecinas] += pesos * ok
+                suma[vecinas] += pesos * np.where(ok, x, 0.0)
+                if j_lluvia >= 0 and ok[j_lluvia]:
+                    n_lluvia[vecinas] += PESOS_NUCLEO
+                    dias_lluvia[vecinas] += PESOS_NUCLEO * (x[j_lluvia] > UMBRAL_LLUVIA_MM)
+                k += 1
+            media_hoy[i] = suma[casillas[i]] / n[casillas[i]]
+            media_manana[i] = suma[casillas_manana[i]] / n[casillas_manana[i]]
+            frec_manana[i] = dias_lluvia[casillas_manana[i]] / n_lluvia[casillas_manana[i]]
+    return media_hoy, media_manana, frec_manana
+
+
+def columnas_anomalia(clima, variables=VARIABLES_ANOMALIA):
+    nombres = [f"{var}_Anomalia" for var in variables if var in clima.variables]
+    if "Temp_Media_C" in clima.variables:
+        nombres.append("Temp_Media_C_Clima_Manana")
+    return nombres + ["Frec_Lluvia_Clima_Manana"]
+
+
+def anadir_anomalias(df, clima, variables=VARIABLES_ANOMALIA, incremental=False):
+    """
+    Entrada: DataFrame indexado por Fecha (ordenado) con las medidas del día
+    y la climatología de la serie, con esos días ya acumulados (actualizar).
+    Añade <var>_Anomalia (valor - media climatológica del día) y la
+    climatología de MAÑANA: Temp_Media_C_Clima_Manana y Frec_Lluvia_Clima_Manana,
+    todo con los días ANTERIORES a cada fila (sin fuga del target).
+    incremental=True -> solo las filas del final que aún no las tienen.
+    """
+    nombres = columnas_anomalia(clima, variables)
+    inicio = 0
+    if incremental and all(c in df.columns for c in nombres):
+        completas = np.flatnonzero(df[nombres[-1]].notna().to_numpy())
+        inicio = 0 if len(completas) == 0 else int(completas[-1]) + 1
+    if inicio >= len(df):
+        return df
+
+    media_hoy, media_manana, frec_manana = climatologia_previa(clima, df.index[inicio:])
+    nuevas = {}
+    for var in variables:
+        if var in df.columns and var in clima.variables:
+            j = clima._j(var)
+            nuevas[f"{var}_Anomalia"] = df[var].to_numpy(dtype=np.float64)[inicio:] - media_hoy[:, j]
+    if "Temp_Media_C" in clima.variables:
+        nuevas["Temp_Media_C_Clima_Manana"] = media_manana[:, clima._j("Temp_Media_C")]
+    nuevas["Frec_Lluvia_Clima_Manana"] = frec_manana
+
+    # float32 como el resto de features del esquema: así las filas pasadas
+    # se reescriben con los mismos dígitos que se leyeron
+    for nombre, valores in nuevas.items():
+        columna = (df[nombre].to_numpy(dtype=np.float32, copy=True) if nombre in df.columns and inicio > 0
+                   else np.full(len(df), np.nan, dtype=np.float32))
+        columna[inicio:] = valores
+        df[nombre] = columna
+    return df
+
+
+if __name__ == "__main__":
+    from data.almacen_maestro import leer_maestro
+
+    parser = argparse.ArgumentParser(description="Tablas de climatología por día del año.")
+    parser.add_argument("--serie", default="barcelona", help="'barcelona' (maestro) o id de estación (capa raw)")
+    parser.add_argument("--salida", default=None, help="CSV con la tabla de 365 días")
+    args = parser.parse_args()
+
+    if args.serie == "barcelona":
+        df, _ = leer_maestro(RUTA_MAESTRO)
+    else:
+        from data import almacen_estaciones
+        df = almacen_estaciones.leer_estacion("raw", args.serie)
+    clima = actualizar_climatologia(args.serie, df)
+    print(f" Climatología '{args.serie}': {len(clima.dias)} días -> {ruta_serie(args.serie)}")
+    tabla = clima.tabla()
+    print(tabla[["frec_lluvia", "Temp_Media_C_media", "Temp_Media_C_p10", "Temp_Media_C_p90"]].iloc[::30].round(2))
+    if args.salida:
+        tabla.to_csv(args.salida)
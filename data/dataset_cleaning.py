@@ -1,34 +1,63 @@
+import sys
 import pandas as pd
 import numpy as np
-import os
-from pathlib import Path
-HERE = Path(__file__).resolve().parent
+from data import almacen_estaciones as almacen
+from data.climatologia import actualizar_climatologia, ruta_serie
 
 
 # =================================================================
 # CONFIGURACIÓN
 # =================================================================
-ARCHIVOS_ENTRADA = [
-    HERE / "raw_datasets"/"meteocat_D5_resumen_historico.csv",
-    HERE / "raw_datasets"/"meteocat_X4_resumen_historico.csv",
-    HERE / "raw_datasets"/"meteocat_X8_resumen_historico.csv"
-]
+ESTACIONES = ["D5", "X4", "X8"]
 
+# Al limpiar de forma incremental se re-limpia desde el último día raw
+# COMPLETO anterior al cambio (ancla de la interpolación). Si no hay
+# ninguno en este margen, se limpia la estación entera.
+MARGEN_ANCLA_DIAS = 62
 
-print(" INICIANDO AUDITORÍA Y LIMPIEZA DE DATOS")
-print("===========================================")
 
-for archivo in ARCHIVOS_ENTRADA:
-    if not os.path.exists(archivo):
-        print(f"  Saltando {archivo} (No existe)")
-        continue
+def _desde_incremental(estacion):
+    """
+    Primer día a re-limpiar según las huellas (None = nada que hacer,
+    'completo' = no hay limpieza previa utilizable).
+    """
+    raw, limpio = almacen.huellas("raw", estacion), almacen.origenes("clean", estacion)
+    if not limpio:
+        return "completo"
+    cambiados = [a for a, h in raw.items() if limpio.get(a) != h]
+    if not cambiados:
+        return None
 
-    print(f"\nPROCESANDO: {archivo}")
-    df = pd.read_csv(archivo)
-    
-    # Preparar Fecha (Esencial para ordenar)
-    df['Fecha'] = pd.to_datetime(df['Fecha'])
-    df = df.sort_values('Fecha').set_index('Fecha')
+    inicio = pd.Timestamp(year=min(cambiados), month=1, day=1)
+    previos = almacen.leer_estacion("raw", estacion, desde=inicio - pd.Timedelta(days=MARGEN_ANCLA_DIAS),
+                                    hasta=inicio - pd.Timedelta(days=1))
+    completos = previos.dropna()
+    if completos.empty:
+        return "completo"
+    return completos.index.max()
+
+
+def limpiar_estacion(estacion, completo=False):
+    """
+    Entrada: id de la estación (lee su capa raw del almacén particionado).
+    completo=False -> solo re-limpia los años raw que han cambiado desde la
+    última limpieza (más el tramo desde el último día completo anterior).
+    Salida: carpeta de la capa clean de la estación (None si no hay raw).
+    """
+    if not almacen.anios_disponibles("raw", estacion):
+        print(f"  Saltando {estacion} (No hay datos raw)")
+        return None
+
+    desde = "completo" if completo else _desde_incremental(estacion)
+    if desde is None:
+        print(f"\n{estacion}: la capa clean ya está al día")
+        if not ruta_serie(estacion).exists():
+            actualizar_climatologia(estacion, almacen.leer_estacion("raw", estacion))
+        return almacen.dir_estacion("clean", estacion)
+
+    print(f"\nPROCESANDO: {estacion} " + ("(completa)" if desde == "completo" else f"(desde {desde.date()})"))
+    # Lectura tipada: float32 + índice de fechas ya ordenado (Esencial para interpolar)
+    df = almacen.leer_estacion("raw", estacion, desde=None if desde == "completo" else desde)
 
     # -----------------------------------------------------------
     # PASO 1: AUDITORÍA DE CALIDAD 
@@ -50,6 +79,13 @@ for archivo in ARCHIVOS_ENTRADA:
         print("   - Estado: PERFECTO ")
     print(f"   ---------------------------------------------")
 
+    # Climatología de la estación con las medidas REALES (antes de imputar).
+    # Si aún no existe y la limpieza es parcial, se construye con todo el raw.
+    if desde == "completo" or ruta_serie(estacion).exists():
+        clima = actualizar_climatologia(estacion, df)
+    else:
+        clima = actualizar_climatologia(estacion, almacen.leer_estacion("raw", estacion))
+
     # -----------------------------------------------------------
     # PASO 2: LIMPIEZA E IMPUTACIÓN (RELLENAR HUECOS)
     # -----------------------------------------------------------
@@ -68,22 +104,40 @@ for archivo in ARCHIVOS_ENTRADA:
                       if 'Direccion' not in c and 'Precip' not in c]
     df[cols_continuas] = df[cols_continuas].interpolate(method='time')
 
-    # D) Red de Seguridad: Medias Mensuales
-    # Si interpolación falla, usar media del mes
-    df['Mes_Aux'] = df.index.month
-    for col in df.select_dtypes(include=np.number).columns:
-        if col != 'Mes_Aux':
-            media_mensual = df.groupby('Mes_Aux')[col].transform('mean')
-            df[col] = df[col].fillna(media_mensual)
-    df = df.drop(columns=['Mes_Aux'])
+    # D) Red de Seguridad: Climatología del día del año (tabla persistida)
+    # Si la interpolación falla (huecos en los extremos), media de ese día del año
+    for col in clima.variables:
+        if col in df.columns and df[col].isna().any():
+            df[col] = df[col].fillna(pd.Series(clima.valor("media", col, df.index), index=df.index))
+
+    # E) Último recurso: Medias Mensuales (climatología sin datos para ese día)
+    # Sobre TODO el raw (medidas reales), no sobre el tramo re-limpiado: así
+    # la limpieza incremental imputa lo mismo que la completa
+    restantes = [c for c in df.select_dtypes(include=np.number).columns if df[c].isna().any()]
+    if restantes:
+        historico = almacen.leer_estacion("raw", estacion, columnas=restantes)
+        medias_mensuales = historico.groupby(historico.index.month).mean()
+        for col in restantes:
+            df[col] = df[col].fillna(pd.Series(medias_mensuales[col].reindex(df.index.month).to_numpy(),
+                                               index=df.index))
 
     # -----------------------------------------------------------
-    # PASO 3: GUARDADO
+    # PASO 3: GUARDADO (Solo los años tocados, enlazados a su raw)
     # -----------------------------------------------------------
-    nombre_limpio = f"clean_{archivo.name}"
-    ruta_carpeta = HERE / "clean_datasets"
-    ruta_completa = ruta_carpeta / nombre_limpio
-    df.to_csv(ruta_completa)
-    print(f"    Archivo limpio guardado: {nombre_limpio}")
+    anios = almacen.escribir_estacion(df, "clean", estacion, almacen.huellas("raw", estacion))
+    print(f"    Capa clean actualizada: {estacion} (años {anios[0]}-{anios[-1]})")
+    return almacen.dir_estacion("clean", estacion)
+
+
+def limpiar_todas(estaciones=ESTACIONES, completo=False):
+    print(" INICIANDO AUDITORÍA Y LIMPIEZA DE DATOS")
+    print("===========================================")
+
+    for estacion in estaciones:
+        limpiar_estacion(estacion, completo)
+
+    print("\n FASE 1 COMPLETADA.")
+
 
-print("\n FASE 1 COMPLETADA.")
+if __name__ == "__main__":
+    limpiar_todas(completo="--completo" in sys.argv)
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+# =================================================================
+# ESQUEMA CENTRAL DE COLUMNAS (Tipos compactos para todos los lectores)
+# =================================================================
+# Por defecto pandas lee todo como float64 y las fechas como texto.
+# Aquí se fija UN solo esquema para raw, clean, maestro y matrices de
+# entrenamiento:
+#   - Medidas y features continuas -> float32 (los árboles de sklearn
+#     trabajan internamente en float32, no se pierde nada al entrenar)
+#   - Flags binarios -> Int8 (nullable: las filas recién añadidas por
+#     el pipeline todavía no tienen target)
+#   - Fecha -> datetime64 (índice en estaciones, columna en el maestro)
+
+COLUMNA_FECHA = "Fecha"
+
+COLUMNAS_MEDIDAS = [
+    "Temp_Media_C",
+    "Temp_Maxima_C",
+    "Temp_Minima_C",
+    "Humedad_Media_Pct",
+    "Precip_Total_mm",
+    "Viento_Maximo_kmh",
+    "Viento_Direccion_Grados",
+    "Presion_Media_hPa",
+    "Irrad_Solar_MJm2",
+]
+
+COLUMNAS_FLAG = ["Lluvia_Binaria", "TARGET_Lluvia_Manana"]
+
+# Datos de estación (capas raw / clean del almacén de estaciones)
+ESQUEMA_ESTACION = {col: "float32" for col in COLUMNAS_MEDIDAS}
+
+# Dataset maestro: medidas + features. Las columnas que no aparecen aquí
+# (medias móviles, deltas, senos/cosenos...) se bajan a float32 al leer.
+ESQUEMA_MAESTRO = {
+    **ESQUEMA_ESTACION,
+    "Dia_Del_Ano": "Int16",
+    **{col: "Int8" for col in COLUMNAS_FLAG},
+}
+
+
+def aplicar_esquema(df, esquema):
+    """
+    Convierte un DataFrame ya cargado al esquema indicado.
+    Cualquier float64 no declarado pasa a float32.
+    """
+    tipos = {c: t for c, t in esquema.items() if c in df.columns}
+    for col in df.columns:
+        if col not in tipos and df[col].dtype == np.float64:
+            tipos[col] = "float32"
+
+    # Los flags pueden venir como float (0.0 / 1.0 / NaN): redondeo antes de Int8
+    for col, tipo in tipos.items():
+        if tipo.startswith("Int") and df[col].dtype.kind == "f":
+            df[col] = df[col].round()
+    df = df.astype(tipos)
+
+    if COLUMNA_FECHA in df.columns:
+        df[COLUMNA_FECHA] = pd.to_datetime(df[COLUMNA_FECHA])
+    return df
+
+
+# Traducción del esquema (nombres pandas) a tipos Arrow para el parser
+_TIPOS_ARROW = {
+    "float32": pa.float32(),
+    "Int8": pa.int8(),
+    "Int16": pa.int16(),
+}
+_TIPOS_PANDAS = {
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+}
+
+
+def _tipos_parser(esquema):
+    # Los flags se parsean como float ("1.0") y se castean a entero en Arrow
+    tipos = {c: pa.float32() for c in esquema}
+    tipos[COLUMNA_FECHA] = pa.timestamp("s")
+    return pv.ConvertOptions(column_types=tipos)
+
+
+def _tipar_columnas(nombres, columnas, esquema):
+    salida = []
+    for nombre, col in zip(nombres, columnas):
+        if nombre in esquema:
+            col = pc.cast(col, _TIPOS_ARROW[esquema[nombre]])
+        elif pa.types.is_floating(col.type) or pa.types.is_integer(col.type):
+            # Features no declaradas (medias móviles, deltas...) -> float32
+            col = pc.cast(col, pa.float32())
+        salida.append(col)
+    return salida
+
+
+def leer_csv_tipado(fuente, esquema, indice_fecha=False):
+    """
+    Lee un CSV con el parser multihilo de Arrow y el esquema aplicado
+    directamente (sin pasar por float64 ni por fechas en texto).
+    indice_fecha=True -> devuelve un DatetimeIndex 'Fecha' ordenado.
+    """
+    tabla = pv.read_csv(fuente, convert_options=_tipos_parser(esquema))
+    columnas = _tipar_columnas(tabla.column_names, tabla.columns, esquema)
+    tabla = pa.Table.from_arrays(columnas, names=tabla.column_names)
+
+    df = tabla.to_pandas(types_mapper=_TIPOS_PANDAS.get)
+
+    if indice_fecha:
+        df = df.set_index(COLUMNA_FECHA).sort_index()
+    return df
+
+
+def iterar_csv_tipado(fuente, esquema, tam_bloque=1 << 20):
+    """
+    Versión en streaming de leer_csv_tipado: genera RecordBatch de Arrow
+    ya tipados, de ~tam_bloque bytes de CSV cada uno (memoria acotada).
+    """
+    lector = pv.open_csv(
+        fuente,
+        read_options=pv.ReadOptions(block_size=tam_bloque),
+        convert_options=_tipos_parser(esquema),
+    )
+    for lote in lector:
+        columnas = _tipar_columnas(lote.schema.names, lote.columns, esquema)
+        yield pa.RecordBatch.from_arrays(columnas, names=lote.schema.names)
+
+
+def matriz_float32(X):
+    """
+    Matriz lista para los bosques: float32 y C-contigua.
+    sklearn convierte a este formato de todos modos; dándoselo hecho
+    evitamos una copia completa en cada fit/predict.
+    """
+    if isinstance(X, pd.DataFrame):
+        X = X.to_numpy(dtype=np.float32, na_value=np.nan)
+    return np.ascontiguousarray(X, dtype=np.float32)
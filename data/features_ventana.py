@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import argparse
+import warnings
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from data.almacen_maestro import guardar_json_atomico, leer_maestro
+
+# =================================================================
+# FEATURES DE VENTANA (Lags, medias móviles, std, min/max, deltas)
+# =================================================================
+# La sección "Inercia y Tendencias" era un bucle columna x ventana con
+# rolling().mean() y diff(). Aquí se describe en una especificación
+# declarativa {variable: {operación: [n, ...]}} y se calcula de golpe:
+#   - Todas las variables forman un bloque (filas, variables) en float64.
+#   - Una sola vista con strides (sliding_window_view, sin copiar) de la
+#     ventana más larga. Cada ventana más corta es un corte de esa vista,
+#     y cada estadístico es una reducción sobre el último eje.
+#   - Mismo criterio que pandas: rolling(v, min_periods=1) ignora los NaN,
+#     std con ddof=1 (NaN con menos de 2 datos), delta = diff(n).fillna(0),
+#     lag = shift(n).
+#   - Camino incremental: solo se recalculan las filas pendientes, leyendo
+#     antes las contexto_necesario() filas anteriores. Lo usan el maestro
+#     completo (construir_dataset_maestro) y la fila diaria
+#     (recalcular_features_maestro), así que las dos salidas coinciden.
+# Probar otra especificación: python -m data.features_ventana --espec mi_espec.json
+# (con --guardar queda en data/espec_ventanas.json para el próximo maestro)
+
+HERE = Path(__file__).resolve().parent
+RUTA_ESPEC = HERE / "espec_ventanas.json"
+RUTA_MAESTRO = HERE / "training_datasets" / "dataset_entrenamiento_barcelona_MASTER.csv"
+
+# La especificación histórica (mismas columnas que el bucle anterior)
+ESPEC_POR_DEFECTO = {
+    "Temp_Media_C": {"media": [3, 7], "delta": [1]},
+    "Presion_Media_hPa": {"media": [3, 7], "delta": [1]},
+    "Viento_Maximo_kmh": {"media": [3, 7], "delta": [1]},
+}
+
+OPERACIONES_VENTANA = ("media", "std", "min", "max")
+OPERACIONES_DESPLAZAMIENTO = ("lag", "delta")
+SUFIJOS = {"media": "Media", "std": "Std", "min": "Min", "max": "Max", "lag": "Lag", "delta": "Delta"}
+
+
+# -----------------------------------------------------------
+# ESPECIFICACIÓN
+# -----------------------------------------------------------
+def validar_espec(espec):
+    """Lanza ValueError si hay operaciones desconocidas o tamaños no válidos."""
+    for col, operaciones in espec.items():
+        for op, tamanos in operaciones.items():
+            if op not in SUFIJOS:
+                raise ValueError(f"{col}: operación '{op}' desconocida (válidas: {', '.join(SUFIJOS)})")
+            if not tamanos or any(int(n) != n or n < 1 for n in tamanos):
+                raise ValueError(f"{col}.{op}: los tamaños deben ser enteros >= 1, no {tamanos}")
+    return espec
+
+
+def cargar_espec(ruta=RUTA_ESPEC):
+    """La especificación guardada con --guardar, o la de por defecto."""
+    if not os.path.exists(ruta):
+        return ESPEC_POR_DEFECTO
+    with open(ruta, encoding="utf-8") as f:
+        return validar_espec(json.load(f))
+
+
+def guardar_espec(espec, ruta=RUTA_ESPEC):
+    guardar_json_atomico(validar_espec(espec), ruta)
+
+
+def nombre_columna(col, op, n):
+    # El delta de 1 día conserva el nombre histórico (Temp_Media_C_Delta)
+    if op == "delta" and n == 1:
+        return f"{col}_Delta"
+    return f"{col}_{SUFIJOS[op]}_{n}dias"
+
+
+def columnas_espec(espec):
+    """Nombres de todas las columnas que genera la especificación, en orden."""
+    return [nombre_columna(col, op, n) for col, ops in espec.items() for op, tamanos in ops.items() for n in tamanos]
+
+
+def contexto_necesario(espec):
+    """Filas anteriores que hacen falta para calcular una fila sin sesgo."""
+    return max([n - 1 if op in OPERACIONES_VENTANA else n
+                for ops in espec.values() for op, tamanos in ops.items() for n in tamanos], default=0)
+
+
+# -----------------------------------------------------------
+# CÁLCULO VECTORIZADO
+# -----------------------------------------------------------
+def _estadistico(ventanas, op):
+    """Reducción sobre el último eje de (filas, variables, v), ignorando NaN."""
+    validos = ~np.isnan(ventanas)
+    n = validos.sum(axis=-1)
+    if op == "min":
+        return np.fmin.reduce(ventanas, axis=-1)
+    if op == "max":
+        return np.fmax.reduce(ventanas, axis=-1)
+
+    ceros = np.where(validos, ventanas, 0.0)
+    suma = ceros.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = np.where(n > 0, suma / n, np.nan)
+        if op == "media":
+            return media
+        # std muestral (ddof=1) en dos pasadas: más estable que suma de cuadrados
+        desvio = np.where(validos, ventanas - media[..., None], 0.0)
+        return np.where(n > 1, np.sqrt((desvio ** 2).sum(axis=-1) / (n - 1)), np.nan)
+
+
+def _agrupar(espec, columnas, operaciones):
+    """{(operación, tamaño): [variables]} para reducir varias variables a la vez."""
+    grupos = {}
+    for col in columnas:
+        for op, tamanos in espec[col].items():
+            if op in operaciones:
+                for n in tamanos:
+                    grupos.setdefault((op, n), []).append(col)
+    return grupos
+
+
+def calcular_bloque(X, espec, columnas, inicio=0):
+    """
+    Entrada: bloque X (filas, len(columnas)) en float64, la especificación
+    y desde qué fila del bloque hay que devolver resultados (las anteriores
+    solo sirven de contexto).
+    Salida: {nombre_columna: array de len(X) - inicio}.
+    """
+    pos = {c: j for j, c in enumerate(columnas)}
+    filas = len(X)
+    salida = {}
+
+    # Ventanas: una vista con strides de la más larga, con NaN delante
+    grupos = _agrupar(espec, columnas, OPERACIONES_VENTANA)
+    if grupos:
+        W = max(n for _, n in grupos)
+        relleno = np.vstack([np.full((W - 1, X.shape[1]), np.nan), X])
+        vista = sliding_window_view(relleno, W, axis=0)[inicio:]  # (filas - inicio, variables, W)
+        for (op, n), cols in grupos.items():
+            resultado = _estadistico(vista[:, [pos[c] for c in cols], W - n:], op)
+            for k, c in enumerate(cols):
+                salida[nombre_columna(c, op, n)] = resultado[:, k]
+
+    # Desplazamientos (lag / delta): un corte del bloque por tamaño
+    for (op, n), cols in _agrupar(espec, columnas, OPERACIONES_DESPLAZAMIENTO).items():
+        idx = [pos[c] for c in cols]
+        previo = np.full((filas, len(idx)), np.nan)
+        if n < filas:
+            previo[n:] = X[:-n, idx]
+        resultado = previo if op == "lag" else np.nan_to_num(X[:, idx] - previo, nan=0.0)
+        for k, c in enumerate(cols):
+            salida[nombre_columna(c, op, n)] = resultado[inicio:, k]
+
+    # Mismo orden de columnas que la especificación
+    return {nombre: salida[nombre] for nombre in columnas_espec({c: espec[c] for c in columnas})}
+
+
+def filas_pendientes(df, espec):
+    """
+    Posición de la primera fila a recalcular: 0 si falta alguna columna de
+    la especificación; si no, la primera del tramo final con features NaN
+    (la fila que acaba de traer el scraper). len(df) = nada pendiente.
+    """
+    nombres = columnas_espec({c: ops for c, ops in espec.items() if c in df.columns})
+    if any(nombre not in df.columns for nombre in nombres):
+        return 0
+    if not nombres:
+        return len(df)
+    completas = np.flatnonzero(~df[nombres].isna().any(axis=1).to_numpy())
+    return 0 if len(completas) == 0 else int(completas[-1]) + 1
+
+
+def anadir_ventanas(df, espec=None, incremental=False):
+    """
+    Entrada: DataFrame ordenado por fecha con las medidas diarias.
+    incremental=True -> solo se recalculan las filas pendientes.
+    Salida: el mismo DataFrame con las columnas de la especificación.
+    """
+    espec = cargar_espec() if espec is None else validar_espec(espec)
+    columnas = [c for c in espec if c in df.columns]
+    inicio = filas_pendientes(df, espec) if incremental else 0
+    if not columnas or inicio >= len(df):
+        return df
+
+    lectura = max(0, inicio - contexto_necesario({c: espec[c] for c in columnas}))
+    X = df[columnas].iloc[lectura:].to_numpy(dtype=np.float64)
+    nuevas = calcular_bloque(X, espec, columnas, inicio=inicio - lectura)
+
+    if inicio == 0:
+        with warnings.catch_warnings():
+            # Con especificaciones grandes pandas avisa de fragmentación: se asume (se escribe una vez)
+            warnings.simplefilter("ignore", category=pd.errors.PerformanceWarning)
+            for nombre, valores in nuevas.items():
+                df[nombre] = valores
+        return df
+
+    for nombre, valores in nuevas.items():
+        columna = df[nombre].to_numpy(dtype=np.float64, copy=True)
+        columna[inicio:] = valores
+        df[nombre] = columna
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calcula features de ventana con una especificación JSON.")
+    parser.add_argument("--espec", default=None, help="JSON {variable: {operación: [n, ...]}} (defecto: la actual)")
+    parser.add_argument("--maestro", default=str(RUTA_MAESTRO))
+    parser.add_argument("--guardar", action="store_true", help=f"Usarla a partir de ahora ({RUTA_ESPEC.name})")
+    args = parser.parse_args()
+
+    if args.espec:
+        with open(args.espec, encoding="utf-8") as f:
+            espec = validar_espec(json.load(f))
+    else:
+        espec = cargar_espec()
+
+    df, _ = leer_maestro(args.maestro)
+    df = df.set_index("Fecha").sort_index()
+    faltan = [c for c in espec if c not in df.columns]
+    if faltan:
+        print(f" ⚠️ Variables que no están en el maestro (se ignoran): {faltan}")
+
+    t0 = time.perf_counter()
+    anadir_ventanas(df, espec)
+    ms = (time.perf_counter() - t0) * 1000
+    generadas = columnas_espec({c: o for c, o in espec.items() if c in df.columns})
+    print(f" {len(generadas)} columnas de ventana para {len(df)} días en {ms:.1f} ms "
+          f"(contexto incremental: {contexto_necesario(espec)} días)")
+    print(df[generadas].describe().T[["mean", "std", "min", "max"]].round(3).to_string())
+
+    if args.guardar:
+        guardar_espec(espec)
+        print(f" ✅ Especificación guardada en {RUTA_ESPEC}: el próximo maestro la usará")
@@ -1,111 +1,221 @@
+import os
+import json
 from pathlib import Path
 import pandas as pd
 import numpy as np
-import glob
+from data import almacen_estaciones as almacen
+from data.almacen_maestro import guardar_maestro, leer_maestro, guardar_json_atomico
+from data.esquema import COLUMNAS_MEDIDAS
+from data.climatologia import actualizar_climatologia, anadir_anomalias
+from data.features_ventana import anadir_ventanas
 HERE = Path(__file__).resolve().parent
 
 # =================================================================
 # CONFIGURACIÓN
 # =================================================================
-PATRON_ARCHIVOS = HERE / "clean_datasets" / "clean_meteocat_*.csv" # Busca automáticamente los archivos limpios
 ARCHIVO_FINAL = HERE / "training_datasets" / "dataset_entrenamiento_barcelona_MASTER.csv"
+# Huellas de las particiones clean con las que se fusionó el maestro (estación -> año -> huella)
+ARCHIVO_ORIGEN = HERE / "training_datasets" / "origen_maestro.json"
+# Serie de la climatología de la ciudad (caché local data/climatologia/barcelona.npz)
+SERIE_CLIMA = "barcelona"
 
-print("INICIANDO INGENIERÍA DE CARACTERÍSTICAS (FEATURE ENGINEERING)")
-print("==============================================================")
 
 # -----------------------------------------------------------
 # PASO 1: FUSIÓN INTELIGENTE (MEDIA DE BARCELONA)
 # -----------------------------------------------------------
-archivos = glob.glob(str(PATRON_ARCHIVOS))
-if not archivos:
-    print("No encuentro archivos 'clean_...'.")
-    exit()
+def fusionar_estaciones(estaciones, desde=None):
+    """
+    Entrada: ids de estación (capa clean del almacén) y fecha inicial opcional.
+    Salida: DataFrame indexado por Fecha con la MEDIA de Barcelona.
+    """
+    lista_dfs = []
+    for est in estaciones:
+        df = almacen.leer_estacion("clean", est, desde=desde)
+        lista_dfs.append(df)
 
-print(f" Fusionando {len(archivos)} estaciones: {archivos}")
+    df_total = pd.concat(lista_dfs)
 
-lista_dfs = []
-for a in archivos:
-    df = pd.read_csv(a)
-    df['Fecha'] = pd.to_datetime(df['Fecha'])
-    lista_dfs.append(df)
+    # Pre-procesamiento de Viento Vectorial (Antes de hacer la media)
+    if 'Viento_Direccion_Grados' in df_total.columns:
+        rads = np.deg2rad(df_total['Viento_Direccion_Grados'])
+        df_total['v_sin'] = np.sin(rads)
+        df_total['v_cos'] = np.cos(rads)
 
-df_total = pd.concat(lista_dfs)
+    # FUSIÓN: Agrupar por fecha y calcular media de todo
+    df_media = df_total.groupby('Fecha').mean()
 
-# Pre-procesamiento de Viento Vectorial (Antes de hacer la media)
-if 'Viento_Direccion_Grados' in df_total.columns:
-    rads = np.deg2rad(df_total['Viento_Direccion_Grados'])
-    df_total['v_sin'] = np.sin(rads)
-    df_total['v_cos'] = np.cos(rads)
+    # Recuperar Grados del Viento (Desde vectores medios)
+    if 'v_sin' in df_media.columns:
+        angulo = np.arctan2(df_media['v_sin'], df_media['v_cos'])
+        df_media['Viento_Direccion_Grados'] = (np.rad2deg(angulo) + 360) % 360
+        df_media = df_media.drop(columns=['v_sin', 'v_cos'])
 
-# FUSIÓN: Agrupar por fecha y calcular media de todo
-df_media = df_total.groupby('Fecha').mean()
+    return df_media
 
-# Recuperar Grados del Viento (Desde vectores medios)
-if 'v_sin' in df_media.columns:
-    angulo = np.arctan2(df_media['v_sin'], df_media['v_cos'])
-    df_media['Viento_Direccion_Grados'] = (np.rad2deg(angulo) + 360) % 360
-    df_media = df_media.drop(columns=['v_sin', 'v_cos'])
 
 # -----------------------------------------------------------
 # PASO 2: CREACIÓN DE FEATURES (VARIABLES PARA IA)
 # -----------------------------------------------------------
-print(" Generando variables predictivas...")
-
-# A) Fechas Cíclicas (Calendario Circular)
-df_media['Dia_Del_Ano'] = df_media.index.dayofyear
-df_media['Dia_Sin'] = np.sin(2 * np.pi * df_media['Dia_Del_Ano'] / 365.0)
-df_media['Dia_Cos'] = np.cos(2 * np.pi * df_media['Dia_Del_Ano'] / 365.0)
-
-# B) Viento Cíclico (Para que el modelo entienda la dirección)
-if 'Viento_Direccion_Grados' in df_media.columns:
-    rads = np.deg2rad(df_media['Viento_Direccion_Grados'])
-    df_media['Viento_Dir_Sin'] = np.sin(rads)
-    df_media['Viento_Dir_Cos'] = np.cos(rads)
-
-# C) Lluvia Binaria (¿Llovió? 1=Si, 0=No)
-if 'Precip_Total_mm' in df_media.columns:
-    df_media['Lluvia_Binaria'] = (df_media['Precip_Total_mm'] > 0.1).astype(int)
-
-# D) Inercia y Tendencias (Medias Móviles y Deltas)
-cols_tendencia = ['Temp_Media_C', 'Presion_Media_hPa', 'Viento_Maximo_kmh']
-ventanas = [3, 7]
-
-for col in cols_tendencia:
-    if col in df_media.columns:
-        # Medias móviles (Rolling Window)
-        for v in ventanas:
-            df_media[f'{col}_Media_{v}dias'] = df_media[col].rolling(window=v, min_periods=1).mean()
-        
-        # Delta (Cambio diario: Hoy - Ayer)
-        df_media[f'{col}_Delta'] = df_media[col].diff().fillna(0)
+def generar_features(df_media, clima=None, espec=None, incremental=False):
+    """
+    Entrada: DataFrame indexado por Fecha con las medidas diarias y,
+             opcionalmente, su climatología (data/climatologia.py) y la
+             especificación de ventanas (data/features_ventana.py).
+    incremental=True -> ventanas y anomalías solo se calculan en las filas nuevas.
+    Salida: el mismo DataFrame con las features añadidas.
+    """
+    # A) Fechas Cíclicas (Calendario Circular)
+    df_media['Dia_Del_Ano'] = df_media.index.dayofyear
+    df_media['Dia_Sin'] = np.sin(2 * np.pi * df_media['Dia_Del_Ano'] / 365.0)
+    df_media['Dia_Cos'] = np.cos(2 * np.pi * df_media['Dia_Del_Ano'] / 365.0)
+
+    # B) Viento Cíclico (Para que el modelo entienda la dirección)
+    if 'Viento_Direccion_Grados' in df_media.columns:
+        rads = np.deg2rad(df_media['Viento_Direccion_Grados'])
+        df_media['Viento_Dir_Sin'] = np.sin(rads)
+        df_media['Viento_Dir_Cos'] = np.cos(rads)
+
+    # C) Lluvia Binaria (¿Llovió? 1=Si, 0=No)
+    if 'Precip_Total_mm' in df_media.columns:
+        df_media['Lluvia_Binaria'] = (df_media['Precip_Total_mm'] > 0.1).astype('int8')
+
+    # D) Inercia y Tendencias: medias móviles, deltas, lags... según la
+    #    especificación declarativa, en una sola pasada vectorizada
+    df_media = anadir_ventanas(df_media, espec, incremental=incremental)
+
+    # E) Anomalías frente al día del año + climatología de mañana, solo con
+    #    los días anteriores a cada fila (incremental: solo las filas nuevas)
+    if clima is not None:
+        df_media = anadir_anomalias(df_media, clima, incremental=incremental)
+
+    return df_media
 
-# -----------------------------------------------------------
-# PASO 3: TARGETS (EL FUTURO A PREDECIR)
-# -----------------------------------------------------------
-print(" Generando Targets (Futuro)...")
-
-# Target 1: Temperatura de Mañana
-df_media['TARGET_Temp_Manana'] = df_media['Temp_Media_C'].shift(-1)
-
-# Target 2: Lluvia de Mañana (Binario 0/1) <-- NUEVO
-if 'Lluvia_Binaria' in df_media.columns:
-    df_media['TARGET_Lluvia_Manana'] = df_media['Lluvia_Binaria'].shift(-1)
-
-# LIMPIEZA FINAL: Borrar la última fila (no tiene futuro conocido)
-# Nos aseguramos de borrar si falta CUALQUIERA de los targets importantes
-cols_targets = ['TARGET_Temp_Manana']
-if 'TARGET_Lluvia_Manana' in df_media.columns:
-    cols_targets.append('TARGET_Lluvia_Manana')
-
-df_media = df_media.dropna(subset=cols_targets)
 
 # -----------------------------------------------------------
-# PASO 4: GUARDADO
+# PASO 3: TARGETS (EL FUTURO A PREDECIR)
 # -----------------------------------------------------------
-df_media.to_csv(ARCHIVO_FINAL)
-
-print(f"\n EXCELENTE. Dataset Maestro guardado en: {ARCHIVO_FINAL}")
-print(f"   - Dimensiones finales: {df_media.shape}")
-print(f"   - Listo para entrenar Random Forest.")
-print(f"   - IMPORTANTE: En el entrenamiento, ELIMINA de X estas columnas:")
-print(f"     ['Fecha, TARGET_Temp_Manana, Dia_Del_Ano, Viento_Direccion_Grados, Precip_Total_mm, TARGET_Lluvia_Manana']")
\ No newline at end of file
+def generar_targets(df_media):
+    """Añade los targets de mañana. La última fila queda con target NaN."""
+    # Target 1: Temperatura de Mañana
+    df_media['TARGET_Temp_Manana'] = df_media['Temp_Media_C'].shift(-1)
+
+    # Target 2: Lluvia de Mañana (Binario 0/1) <-- NUEVO
+    if 'Lluvia_Binaria' in df_media.columns:
+        df_media['TARGET_Lluvia_Manana'] = df_media['Lluvia_Binaria'].shift(-1)
+
+    return df_media
+
+
+def recalcular_features_maestro(df_maestro):
+    """
+    Para el pipeline diario: el scraper solo trae las medidas del día,
+    así que tras añadir la fila se recalculan features y targets
+    (la fila de ayer recibe su target y la de hoy sus features).
+    Entrada/Salida: DataFrame con columna 'Fecha' (formato del maestro).
+    """
+    df = df_maestro.set_index('Fecha').sort_index()
+    # Upsert: solo los días nuevos o cambiados tocan los acumuladores
+    clima = actualizar_climatologia(SERIE_CLIMA, df)
+    df = generar_targets(generar_features(df, clima, incremental=True))
+    return df.reset_index()
+
+
+def _huellas_clean(estaciones):
+    return {est: {str(a): h for a, h in almacen.huellas("clean", est).items()} for est in estaciones}
+
+
+def _desde_incremental(estaciones, ruta_salida):
+    """
+    Primer día a re-fusionar: inicio del primer año cuya partición clean
+    ha cambiado desde la última fusión. None = fusión completa, 'al día' = nada.
+    """
+    if not os.path.exists(ruta_salida) or not os.path.exists(ARCHIVO_ORIGEN):
+        return None
+    with open(ARCHIVO_ORIGEN, encoding="utf-8") as f:
+        origen = json.load(f)
+    if sorted(origen) != sorted(estaciones):
+        return None
+
+    actuales = _huellas_clean(estaciones)
+    cambiados = [int(a) for est in estaciones for a, h in actuales[est].items()
+                 if origen[est].get(a) != h]
+    if not cambiados:
+        return "al día"
+    return pd.Timestamp(year=min(cambiados), month=1, day=1)
+
+
+def construir_dataset_maestro(estaciones=None, ruta_salida=ARCHIVO_FINAL, completo=False):
+    """
+    Fusión + features + targets + guardado atómico del maestro.
+    completo=False -> solo se vuelven a leer y fusionar los años de la
+    capa clean que han cambiado; el resto sale del propio maestro.
+    """
+    print("INICIANDO INGENIERÍA DE CARACTERÍSTICAS (FEATURE ENGINEERING)")
+    print("==============================================================")
+
+    estaciones = estaciones or almacen.estaciones_disponibles("clean")
+    if not estaciones:
+        print("No hay estaciones en la capa clean del almacén.")
+        return None
+
+    desde = None if completo else _desde_incremental(estaciones, ruta_salida)
+    if desde == "al día":
+        print(" El maestro ya está al día con la capa clean.")
+        return None
+
+    print(f" Fusionando {len(estaciones)} estaciones: {estaciones}"
+          + (f" (desde {desde.date()})" if desde is not None else " (histórico completo)"))
+    df_media = fusionar_estaciones(estaciones, desde)
+
+    if os.path.exists(ruta_salida):
+        df_previo, _ = leer_maestro(ruta_salida)
+        cols_medidas = [c for c in COLUMNAS_MEDIDAS if c in df_previo.columns]
+        # Fusión incremental: lo anterior a 'desde' ya estaba fusionado en el maestro
+        if desde is not None:
+            anterior = df_previo[df_previo['Fecha'] < desde].set_index('Fecha')[cols_medidas]
+            df_media = pd.concat([anterior.astype('float32'), df_media])
+
+        # El pipeline diario añade al maestro días que NO están en la capa clean.
+        # Al reconstruir se conservan (solo sus medidas: las features se recalculan abajo).
+        cola = df_previo[df_previo['Fecha'] > df_media.index.max()]
+        if not cola.empty:
+            print(f" Conservando {len(cola)} días añadidos por el pipeline diario")
+            cola = cola.set_index('Fecha')[cols_medidas]
+            df_media = pd.concat([df_media, cola.astype('float32')])
+
+    print(" Actualizando climatología de la ciudad...")
+    clima = actualizar_climatologia(SERIE_CLIMA, df_media)
+
+    print(" Generando variables predictivas...")
+    df_media = generar_features(df_media, clima)
+
+    print(" Generando Targets (Futuro)...")
+    df_media = generar_targets(df_media)
+
+    # LIMPIEZA FINAL: Borrar filas sin futuro conocido...
+    # Nos aseguramos de borrar si falta CUALQUIERA de los targets importantes
+    cols_targets = ['TARGET_Temp_Manana']
+    if 'TARGET_Lluvia_Manana' in df_media.columns:
+        cols_targets.append('TARGET_Lluvia_Manana')
+
+    # ...salvo la última: es la entrada de la predicción de mañana y la
+    # referencia del pipeline diario (los entrenadores ya descartan targets NaN)
+    con_target = df_media[cols_targets].notna().all(axis=1)
+    df_media = df_media[con_target | (df_media.index == df_media.index.max())]
+
+    # -----------------------------------------------------------
+    # PASO 4: GUARDADO
+    # -----------------------------------------------------------
+    guardar_maestro(df_media, ruta_salida)
+    guardar_json_atomico(_huellas_clean(estaciones), ARCHIVO_ORIGEN)
+
+    print(f"\n EXCELENTE. Dataset Maestro guardado en: {ruta_salida}")
+    print(f"   - Dimensiones finales: {df_media.shape}")
+    print(f"   - Listo para entrenar Random Forest.")
+    print(f"   - IMPORTANTE: En el entrenamiento, ELIMINA de X estas columnas:")
+    print(f"     ['Fecha, TARGET_Temp_Manana, Dia_Del_Ano, Viento_Direccion_Grados, Precip_Total_mm, TARGET_Lluvia_Manana']")
+    return df_media
+
+
+if __name__ == "__main__":
+    construir_dataset_maestro()
@@ -1,3 +1,5 @@
+import io
+import os
 import pandas as pd
 import requests
 import numpy as np
@@ -11,7 +13,8 @@ warnings.filterwarnings("ignore")
 ESTACIONES_ID = ["D5", "X4", "X8"] 
 
 # URL Base idéntica al script que funciona
-URL_BASE = "https://www.meteo.cat/observacions/xema/dades?"
+# (METEOCAT_URL_BASE permite apuntar al servidor simulado: data/xema_simulado.py)
+URL_BASE = os.environ.get("METEOCAT_URL_BASE", "https://www.meteo.cat/observacions/xema/dades?")
 
 # Mapeo idéntico al script que funciona
 MAPEO_COLUMNAS = {
@@ -25,17 +28,84 @@ MAPEO_COLUMNAS = {
     'Irradiació solar global': 'Irrad_Solar_MJm2'
 }
 
-def obtener_media_barcelona(fecha_str):
+def parsear_resumen(texto_html):
+    """
+    Entrada: HTML de la página de una estación y día.
+    Salida: dict con las medidas (NaN si 'Sense dades') o None si no hay tabla.
+    """
+    try:
+        tablas_encontradas = pd.read_html(io.StringIO(texto_html), flavor="lxml")
+    except ValueError:
+        return None  # Página sin ninguna tabla
+
+    # Si encontramos tablas (usamos índice 0 como en tu script original)
+    if len(tablas_encontradas) == 0:
+        return None
+
+    df_resumen = tablas_encontradas[0].copy()
+
+    # --- APLICAMOS LA LÓGICA DEL SCRIPT QUE FUNCIONA ---
+    # 1. Seleccionar columnas 0 y 1 y transponer
+    df_resumen = df_resumen[[0, 1]]
+    df_resumen.columns = ['Variable', 'Valor']
+    df_pivotado = df_resumen.set_index('Variable').T
+    columnas_reales = df_pivotado.columns.tolist()
+
+    # Diccionario para guardar los datos de ESTA estación
+    fila_datos = {}
+    # Inicializar dirección viento en NaN
+    fila_datos['Viento_Direccion_Grados'] = np.nan
+
+    # 2. Iterar y limpiar
+    for col_cat, col_final in MAPEO_COLUMNAS.items():
+        # Buscar columna que contenga el texto (ej: "Temperatura mitjana")
+        col_encontrada = next((c for c in columnas_reales if col_cat in c), None)
+        val_final = np.nan
+
+        if col_encontrada:
+            valor_serie = df_pivotado[col_encontrada].iloc[0]
+            texto_bruto = str(valor_serie).strip()
+
+            if texto_bruto.lower() != "sense dades":
+                # Separar valor de extras (ej: "50.5 - 180º")
+                partes = texto_bruto.split('-')
+                parte_valor = partes[0]
+
+                # Limpieza Regex (Vital para quitar '°C', '%', etc.)
+                limpio_str = (
+                    pd.Series(parte_valor)
+                    .str.replace(r'[^\d\.\-]+', '', regex=True)
+                    .str.strip()
+                )
+                try:
+                    val_final = float(limpio_str.iloc[0])
+                except (ValueError, IndexError):
+                    val_final = np.nan
+
+                # Lógica especial Dirección Viento (Parte derecha del guion)
+                if "Ratxa" in col_cat and len(partes) > 1:
+                    try:
+                        dir_str = partes[1].replace('º', '').strip()
+                        fila_datos['Viento_Direccion_Grados'] = float(dir_str)
+                    except ValueError:
+                        pass
+
+        fila_datos[col_final] = val_final
+
+    return fila_datos
+
+
+def obtener_media_barcelona(fecha_str, estaciones=ESTACIONES_ID):
     """
     Entrada: "2025-12-19" (String YYYY-MM-DD)
-    Salida: DataFrame de 1 fila con la MEDIA de las 3 estaciones.
+    Salida: DataFrame de 1 fila con la MEDIA de las estaciones (por defecto, las 3).
     """
     print(f" Conectando a Meteocat para el día {fecha_str}...")
     
     dfs_estaciones = []
 
     # 1. BUCLE DE EXTRACCIÓN (3 Estaciones)
-    for codigo in ESTACIONES_ID:
+    for codigo in estaciones:
         # Usamos la MISMA estructura de URL que en dataset_extraction.py
         # El servidor espera: dia=YYYY-MM-DDT00:00Z
         url = f"{URL_BASE}codi={codigo}&dia={fecha_str}T00:00Z"
@@ -49,60 +119,9 @@ def obtener_media_barcelona(fecha_str):
                 print(f"    Error bajando estación {codigo} (Status {response.status_code})")
                 continue
 
-            tablas_encontradas = pd.read_html(response.text)
-            
-            # Si encontramos tablas (usamos índice 0 como en tu script original)
-            if len(tablas_encontradas) > 0:
-                df_resumen = tablas_encontradas[0].copy()
-                
-                # --- APLICAMOS LA LÓGICA DEL SCRIPT QUE FUNCIONA ---
-                # 1. Seleccionar columnas 0 y 1 y transponer
-                df_resumen = df_resumen[[0, 1]]
-                df_resumen.columns = ['Variable', 'Valor']
-                df_pivotado = df_resumen.set_index('Variable').T 
-                columnas_reales = df_pivotado.columns.tolist()
-
-                # Diccionario para guardar los datos de ESTA estación
-                fila_datos = {}
-                # Inicializar dirección viento en NaN
-                fila_datos['Viento_Direccion_Grados'] = np.nan 
-
-                # 2. Iterar y limpiar
-                for col_cat, col_final in MAPEO_COLUMNAS.items():
-                    # Buscar columna que contenga el texto (ej: "Temperatura mitjana")
-                    col_encontrada = next((c for c in columnas_reales if col_cat in c), None)
-                    val_final = np.nan
+            fila_datos = parsear_resumen(response.text)
 
-                    if col_encontrada:
-                        valor_serie = df_pivotado[col_encontrada].iloc[0]
-                        texto_bruto = str(valor_serie).strip()
-
-                        if texto_bruto.lower() != "sense dades":
-                            # Separar valor de extras (ej: "50.5 - 180º")
-                            partes = texto_bruto.split('-')
-                            parte_valor = partes[0]
-
-                            # Limpieza Regex (Vital para quitar '°C', '%', etc.)
-                            limpio_str = (
-                                pd.Series(parte_valor)
-                                .str.replace(r'[^\d\.\-]+', '', regex=True)
-                                .str.strip()
-                            )
-                            try:
-                                val_final = float(limpio_str.iloc[0])
-                            except (ValueError, IndexError):
-                                val_final = np.nan
-
-                            # Lógica especial Dirección Viento (Parte derecha del guion)
-                            if "Ratxa" in col_cat and len(partes) > 1:
-                                try:
-                                    dir_str = partes[1].replace('º', '').strip()
-                                    fila_datos['Viento_Direccion_Grados'] = float(dir_str)
-                                except ValueError:
-                                    pass 
-
-                    fila_datos[col_final] = val_final
-                
+            if fila_datos is not None:
                 # Convertimos a DataFrame temporal y añadimos a la lista
                 df_temp = pd.DataFrame([fila_datos])
                 dfs_estaciones.append(df_temp)
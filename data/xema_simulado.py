@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import random
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+# =================================================================
+# SERVIDOR XEMA SIMULADO (Sustituto local de meteo.cat)
+# =================================================================
+# Sirve observacions/xema/dades?codi=..&dia=.. con la MISMA tabla resumen
+# que parsean scraper_prediccion.py y dataset_extraction.py, para poder
+# hacer pruebas de carga sin tocar Meteocat.
+#   - Cualquier código de estación y cualquier fecha: los valores salen
+#     de un clima sintético de Barcelona (estacional + ruido), y son
+#     deterministas por (estación, día): dos peticiones dan la misma página.
+#   - Configurable: latencia (media + jitter), errores HTTP 503,
+#     celdas "Sense dades" y días sin tabla.
+# Uso: python -m data.xema_simulado --puerto 8765 --latencia-ms 80 --prob-error 0.01
+#      METEOCAT_URL_BASE="http://127.0.0.1:8765/observacions/xema/dades?" python app_prediccion.py
+
+RUTA = "/observacions/xema/dades"
+
+# Etiquetas y unidades tal como aparecen en la página real
+FILAS_RESUMEN = [
+    ("Temperatura mitjana", "Temp_Media_C", "°C"),
+    ("Temperatura màxima", "Temp_Maxima_C", "°C"),
+    ("Temperatura mínima", "Temp_Minima_C", "°C"),
+    ("Humitat relativa mitjana", "Humedad_Media_Pct", "%"),
+    ("Precipitació acumulada", "Precip_Total_mm", "mm"),
+    ("Ratxa màxima del vent (10 m)", "Viento_Maximo_kmh", "km/h"),
+    ("Pressió atmosfèrica mitjana", "Presion_Media_hPa", "hPa"),
+    ("Irradiació solar global", "Irrad_Solar_MJm2", "MJ/m²"),
+]
+
+
+def _semilla(*partes):
+    return int.from_bytes(hashlib.blake2b("|".join(partes).encode(), digest_size=8).digest(), "little")
+
+
+def generar_dia(codigo, dia):
+    """
+    Entrada: código de estación y fecha (date).
+    Salida: dict variable -> valor (clima sintético de Barcelona).
+    """
+    rng = np.random.default_rng(_semilla(codigo, dia.isoformat()))
+    # Cada estación tiene su microclima: un desplazamiento fijo
+    desplazamiento = (_semilla(codigo) % 200) / 100 - 1.0
+
+    fase = 2 * np.pi * (dia.timetuple().tm_yday - 110) / 365.0
+    temp = 16.0 + 7.0 * np.sin(fase) + desplazamiento + rng.normal(0, 1.8)
+    llueve = rng.random() < 0.2 - 0.08 * np.sin(fase)
+
+    return {
+        "Temp_Media_C": temp,
+        "Temp_Maxima_C": temp + rng.uniform(2.5, 6.0),
+        "Temp_Minima_C": temp - rng.uniform(2.5, 6.0),
+        "Humedad_Media_Pct": float(np.clip(rng.normal(78 if llueve else 66, 9), 20, 100)),
+        "Precip_Total_mm": rng.gamma(1.2, 6.0) if llueve else 0.0,
+        "Viento_Maximo_kmh": rng.gamma(6.0, 5.5),
+        "Viento_Direccion_Grados": float(rng.integers(0, 360)),
+        "Presion_Media_hPa": 1015.0 + rng.normal(0, 5 if llueve else 3) - (6 if llueve else 0),
+        "Irrad_Solar_MJm2": max(0.5, (16.0 + 10.0 * np.sin(fase)) * (0.45 if llueve else 1.0) + rng.normal(0, 1.5)),
+    }
+
+
+def pagina_resumen(codigo, dia, prob_sense_dades=0.0, prob_sin_tabla=0.0):
+    """HTML con la tabla resumen (tabla 0, sin cabecera: columnas 0 y 1)."""
+    rng = random.Random(_semilla("huecos", codigo, dia.isoformat()))
+    if rng.random() < prob_sin_tabla:
+        return "<html><body><p>No hi ha dades per a aquesta estació.</p></body></html>"
+
+    valores = generar_dia(codigo, dia)
+    filas = []
+    for etiqueta, variable, unidad in FILAS_RESUMEN:
+        if rng.random() < prob_sense_dades:
+            texto = "Sense dades"
+        elif variable == "Viento_Maximo_kmh":
+            texto = f"{valores[variable]:.1f} {unidad} - {valores['Viento_Direccion_Grados']:.0f}º"
+        else:
+            texto = f"{valores[variable]:.1f} {unidad}"
+        filas.append(f"<tr><td>{etiqueta}</td><td>{texto}</td></tr>")
+
+    return (
+        f"<html><head><meta charset='utf-8'><title>XEMA {codigo} {dia}</title></head><body>"
+        f"<table class='tblperiode'>{''.join(filas)}</table>"
+        f"<table><tr><td>Estació</td><td>{codigo}</td></tr></table>"
+        "</body></html>"
+    )
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    config = {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        cfg = self.config
+
+        # Latencia simulada (media + jitter uniforme)
+        retardo = cfg["latencia_ms"] + random.uniform(-cfg["jitter_ms"], cfg["jitter_ms"])
+        if retardo > 0:
+            time.sleep(retardo / 1000)
+
+        if url.path != RUTA or "codi" not in params or "dia" not in params:
+            self._responder(404, "<html><body>Not found</body></html>")
+            return
+        if random.random() < cfg["prob_error"]:
+            self._responder(503, "<html><body>Service Unavailable</body></html>")
+            return
+        try:
+            dia = date.fromisoformat(params["dia"][0][:10])  # dia=YYYY-MM-DDT00:00Z
+        except ValueError:
+            self._responder(400, "<html><body>Bad date</body></html>")
+            return
+
+        html = pagina_resumen(params["codi"][0], dia, cfg["prob_sense_dades"], cfg["prob_sin_tabla"])
+        self._responder(200, html)
+
+    def _responder(self, estado, html):
+        cuerpo = html.encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass  # Sin una línea por petición: en pruebas de carga son miles
+
+
+def crear_servidor(puerto=8765, latencia_ms=0.0, jitter_ms=0.0, prob_error=0.0,
+                   prob_sense_dades=0.0, prob_sin_tabla=0.0, host="127.0.0.1"):
+    """
+    Servidor multihilo listo para serve_forever().
+    Salida: (servidor, url_base) -> url_base es lo que va en METEOCAT_URL_BASE.
+    """
+    manejador = type("Manejador", (_Manejador,), {"config": {
+        "latencia_ms": latencia_ms, "jitter_ms": jitter_ms, "prob_error": prob_error,
+        "prob_sense_dades": prob_sense_dades, "prob_sin_tabla": prob_sin_tabla,
+    }})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    url_base = f"http://{host}:{servidor.server_address[1]}{RUTA}?"
+    return servidor, url_base
+
+
+def arrancar_en_segundo_plano(**kwargs):
+    """Para las pruebas de carga: arranca el servidor en un hilo. Salida: (servidor, url_base)."""
+    servidor, url_base = crear_servidor(**kwargs)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, url_base
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor XEMA simulado (sustituto local de meteo.cat).")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Latencia media por petición")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Variación uniforme (+/-) de la latencia")
+    parser.add_argument("--prob-error", type=float, default=0.0, help="Probabilidad de HTTP 503")
+    parser.add_argument("--prob-sense-dades", type=float, default=0.0, help="Probabilidad de 'Sense dades' por celda")
+    parser.add_argument("--prob-sin-tabla", type=float, default=0.0, help="Probabilidad de día sin tabla")
+    args = parser.parse_args()
+
+    servidor, url_base = crear_servidor(
+        args.puerto, args.latencia_ms, args.jitter_ms, args.prob_error,
+        args.prob_sense_dades, args.prob_sin_tabla,
+    )
+    print(f" Servidor XEMA simulado en {url_base}")
+    print(f" export METEOCAT_URL_BASE=\"{url_base}\"")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.shutdown()
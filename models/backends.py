@@ -0,0 +1,102 @@
+import numpy as np
+from sklearn.ensemble import (
+    RandomForestRegressor,
+    RandomForestClassifier,
+    HistGradientBoostingRegressor,
+    HistGradientBoostingClassifier,
+)
+from sklearn.linear_model import Ridge, LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler
+
+# =================================================================
+# BACKENDS DE MODELO (Intercambiables para temperatura y lluvia)
+# =================================================================
+# Cada backend es una fábrica sin argumentos que devuelve un estimador
+# sklearn sin entrenar. Los entrenadores, el dashboard y el comparador
+# solo hablan con este módulo, así cambiar de modelo es cambiar un nombre.
+
+BACKEND_POR_DEFECTO = "random_forest"
+
+# Columnas que NUNCA entran en X (targets, fecha y versiones "crudas"
+# de variables que ya están codificadas como seno/coseno o binario)
+COLS_A_BORRAR_DE_X = [
+    "Fecha",
+    "TARGET_Temp_Manana",
+    "TARGET_Lluvia_Manana",
+    "Dia_Del_Ano",
+    "Viento_Direccion_Grados",
+    "Precip_Total_mm",
+]
+
+BACKENDS = {
+    "temperatura": {
+        # Modelo histórico del proyecto
+        "random_forest": lambda: RandomForestRegressor(
+            n_estimators=200, n_jobs=-1, random_state=40
+        ),
+        # Bosque pequeño y poco profundo: mucha menos memoria y latencia
+        "bosque_ligero": lambda: RandomForestRegressor(
+            n_estimators=50, max_depth=12, min_samples_leaf=3, n_jobs=-1, random_state=40
+        ),
+        "hist_gradient_boosting": lambda: HistGradientBoostingRegressor(
+            max_iter=300, learning_rate=0.05, random_state=40
+        ),
+        # Baseline lineal (imputa por si llega alguna fila sin features)
+        "lineal": lambda: make_pipeline(
+            SimpleImputer(), StandardScaler(), Ridge(alpha=1.0)
+        ),
+    },
+    "lluvia": {
+        "random_forest": lambda: RandomForestClassifier(
+            n_estimators=200, n_jobs=-1, class_weight="balanced", random_state=40
+        ),
+        "bosque_ligero": lambda: RandomForestClassifier(
+            n_estimators=50, max_depth=12, min_samples_leaf=3,
+            n_jobs=-1, class_weight="balanced", random_state=40
+        ),
+        "hist_gradient_boosting": lambda: HistGradientBoostingClassifier(
+            max_iter=300, learning_rate=0.05, class_weight="balanced", random_state=40
+        ),
+        "lineal": lambda: make_pipeline(
+            SimpleImputer(), StandardScaler(),
+            LogisticRegression(class_weight="balanced", max_iter=1000)
+        ),
+    },
+}
+
+
+def crear_modelo(tarea, backend=BACKEND_POR_DEFECTO):
+    """
+    Entrada: tarea ('temperatura' | 'lluvia') y nombre del backend.
+    Salida: estimador sklearn sin entrenar.
+    """
+    try:
+        return BACKENDS[tarea][backend]()
+    except KeyError:
+        disponibles = ", ".join(BACKENDS.get(tarea, {})) or "-"
+        raise ValueError(
+            f"Backend '{backend}' no disponible para '{tarea}'. Opciones: {disponibles}"
+        )
+
+
+def separar_X(dt):
+    """Quita de X las columnas prohibidas (solo las que existen)."""
+    cols_borrar = [c for c in COLS_A_BORRAR_DE_X if c in dt.columns]
+    return dt.drop(columns=cols_borrar)
+
+
+def predecir_temperatura(modelo, X):
+    """Temperatura esperada (°C) para cada fila de X."""
+    return np.asarray(modelo.predict(X), dtype=np.float64)
+
+
+def probabilidad_lluvia(modelo, X):
+    """
+    Probabilidad de lluvia (clase 1) para cada fila de X.
+    Si el backend no da probabilidades, se usa la clase predicha (0/1).
+    """
+    if hasattr(modelo, "predict_proba"):
+        return modelo.predict_proba(X)[:, 1]
+    return np.asarray(modelo.predict(X), dtype=np.float64)
@@ -0,0 +1,138 @@
+import argparse
+import io
+import time
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.metrics import mean_absolute_error, accuracy_score, brier_score_loss
+
+from data.almacen_maestro import leer_maestro
+from data.esquema import matriz_float32
+from models.backends import BACKENDS, crear_modelo, separar_X, predecir_temperatura, probabilidad_lluvia
+
+# =================================================================
+# COMPARADOR DE BACKENDS (Precisión vs Coste)
+# =================================================================
+# Todos los backends se evalúan sobre los MISMOS folds temporales
+# (se entrena con el pasado, se valida con el futuro: sin fugas).
+# Por cada backend se mide:
+#   - Error: MAE (temperatura) | Accuracy + Brier (lluvia)
+#   - Tiempo de entrenamiento medio por fold
+#   - Tamaño del artefacto serializado con joblib
+#   - Latencia p50/p99 prediciendo UNA fila (el caso del botón del dashboard)
+
+RUTA_DATASET_MASTER = "data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv"
+TARGETS = {"temperatura": "TARGET_Temp_Manana", "lluvia": "TARGET_Lluvia_Manana"}
+UMBRAL_LLUVIA = 0.35  # Mismo umbral que el dashboard
+
+
+def _tamano_artefacto_mb(modelo):
+    buffer = io.BytesIO()
+    joblib.dump(modelo, buffer)
+    return buffer.tell() / 1e6
+
+
+def _latencia_una_fila_ms(modelo, tarea, X, repeticiones):
+    predecir = predecir_temperatura if tarea == "temperatura" else probabilidad_lluvia
+    tiempos = []
+    for i in range(repeticiones):
+        fila = X[[i % len(X)]]
+        t0 = time.perf_counter()
+        predecir(modelo, fila)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return np.percentile(tiempos, 50), np.percentile(tiempos, 99)
+
+
+def comparar_backends(tareas=("temperatura", "lluvia"), backends=None, n_folds=5, repeticiones=200):
+    """
+    Entrada: tareas y nombres de backend (None = todos los registrados).
+    Salida: DataFrame con una fila por (tarea, backend).
+    """
+    dt, _ = leer_maestro(RUTA_DATASET_MASTER)
+    dt = dt.dropna(subset=list(TARGETS.values())).sort_values("Fecha").reset_index(drop=True)
+    X = matriz_float32(separar_X(dt))
+    folds = list(TimeSeriesSplit(n_splits=n_folds).split(X))
+
+    print(f" Comparando backends sobre {len(X)} filas y {n_folds} folds temporales...")
+    resultados = []
+
+    for tarea in tareas:
+        y = dt[TARGETS[tarea]].to_numpy(dtype=np.float32 if tarea == "temperatura" else np.int8)
+
+        for backend in backends or BACKENDS[tarea]:
+            errores, aciertos, briers, tiempos_fit = [], [], [], []
+
+            for idx_train, idx_test in folds:
+                modelo = crear_modelo(tarea, backend)
+                t0 = time.perf_counter()
+                modelo.fit(X[idx_train], y[idx_train])
+                tiempos_fit.append(time.perf_counter() - t0)
+
+                if tarea == "temperatura":
+                    pred = predecir_temperatura(modelo, X[idx_test])
+                    errores.append(mean_absolute_error(y[idx_test], pred))
+                else:
+                    prob = probabilidad_lluvia(modelo, X[idx_test])
+                    aciertos.append(accuracy_score(y[idx_test], prob > UMBRAL_LLUVIA))
+                    briers.append(brier_score_loss(y[idx_test], prob))
+
+            # El modelo del último fold (el que más historia ha visto) da tamaño y latencia
+            p50, p99 = _latencia_una_fila_ms(modelo, tarea, X[idx_test], repeticiones)
+            fila = {
+                "tarea": tarea,
+                "backend": backend,
+                "mae": np.mean(errores) if errores else np.nan,
+                "accuracy": np.mean(aciertos) if aciertos else np.nan,
+                "brier": np.mean(briers) if briers else np.nan,
+                "entreno_s": np.mean(tiempos_fit),
+                "artefacto_mb": _tamano_artefacto_mb(modelo),
+                "latencia_p50_ms": p50,
+                "latencia_p99_ms": p99,
+            }
+            resultados.append(fila)
+            print(f"   - {tarea:<11} {backend:<24} listo ({fila['entreno_s']:.2f} s/fold)")
+
+    return pd.DataFrame(resultados)
+
+
+def recomendar_backend(resultados, tarea, objetivo):
+    """
+    El backend más barato (latencia p99 y luego tamaño) que cumple el objetivo:
+    MAE <= objetivo en temperatura, Brier <= objetivo en lluvia.
+    """
+    metrica = "mae" if tarea == "temperatura" else "brier"
+    candidatos = resultados[(resultados["tarea"] == tarea) & (resultados[metrica] <= objetivo)]
+    if candidatos.empty:
+        return None
+    return candidatos.sort_values(["latencia_p99_ms", "artefacto_mb"]).iloc[0]["backend"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara backends de modelo en folds temporales.")
+    parser.add_argument("--tareas", nargs="+", default=["temperatura", "lluvia"], choices=list(TARGETS))
+    parser.add_argument("--backends", nargs="+", default=None)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--objetivo-mae", type=float, default=1.2, help="MAE máximo aceptable (°C)")
+    parser.add_argument("--objetivo-brier", type=float, default=0.18, help="Brier máximo aceptable")
+    parser.add_argument("--salida", default=None, help="CSV donde guardar la tabla")
+    args = parser.parse_args()
+
+    tabla = comparar_backends(args.tareas, args.backends, args.folds)
+
+    print("\n RESULTADOS")
+    print("========================================")
+    with pd.option_context("display.width", 200, "display.float_format", "{:.4f}".format):
+        print(tabla.to_string(index=False))
+
+    objetivos = {"temperatura": args.objetivo_mae, "lluvia": args.objetivo_brier}
+    for tarea in args.tareas:
+        elegido = recomendar_backend(tabla, tarea, objetivos[tarea])
+        if elegido:
+            print(f"\n {tarea}: backend más barato que cumple el objetivo ({objetivos[tarea]}) -> '{elegido}'")
+        else:
+            print(f"\n {tarea}: ningún backend cumple el objetivo ({objetivos[tarea]})")
+
+    if args.salida:
+        tabla.to_csv(args.salida, index=False)
+        print(f"\n Tabla guardada en {args.salida}")
@@ -0,0 +1,303 @@
+import os
+import math
+import time
+import argparse
+import tempfile
+import joblib
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
+
+from data.esquema import ESQUEMA_MAESTRO, iterar_csv_tipado
+from models.backends import (
+    BACKEND_POR_DEFECTO, COLS_A_BORRAR_DE_X, crear_modelo, predecir_temperatura, probabilidad_lluvia,
+)
+from models.prediccion import DIR_MODELOS, UMBRAL_LLUVIA, rutas_modelos
+from models.seleccion_features import cargar_seleccion, TARGETS
+from perfil_memoria import rss_actual_mb, PicoRSS
+
+# =================================================================
+# ENTRENO POR BLOQUES (Memoria acotada para históricos grandes)
+# =================================================================
+# Los entrenadores normales cargan el maestro entero y hacen un único
+# fit(). Aquí el dataset nunca está entero en memoria:
+#   1. Se lee en streaming (bloques de Arrow desde CSV, Parquet o Arrow IPC)
+#      y cada fila va a una partición al azar, que se vuelca a disco en
+#      Arrow IPC. Al azar (no por fechas): cada partición ve todos los años.
+#   2. Se entrena un sub-bosque por partición, con un número de árboles
+#      proporcional a sus filas, y se fusionan los estimators_ en un solo
+#      bosque: el .pkl resultante es un RandomForest normal.
+#   3. El número de particiones sale del presupuesto de RAM: una partición
+#      en entrenamiento + el bosque fusionado tienen que caber. Un árbol
+#      completo tiene ~1,26 nodos por fila de su partición, así que partir
+#      en K también divide por K el tamaño del bosque final.
+# Solo para backends de bosque (random_forest, bosque_ligero).
+# Uso: python -m models.entreno_por_bloques temperatura lluvia --ram-mb 1024
+
+RUTA_DATASET_MASTER = "data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv"
+
+MB = 1 << 20
+TAM_BLOQUE_LECTURA = 1 << 22   # ~4 MB por lote leído de la fuente
+MIN_FILAS_PARTICION = 500      # Por debajo, los sub-bosques pierden demasiada calidad
+MARGEN_PRESUPUESTO = 0.8       # Holgura para fragmentación del allocator y buffers de Arrow
+BYTES_NODO = 64                # sizeof(Node) en los árboles de sklearn
+NODOS_POR_FILA = 1.26          # 2 * 0,632 filas distintas por bootstrap (árbol completo)
+RESERVA_FIT_MB = 32            # Pools de hilos (joblib/OpenMP) y módulos que carga el primer fit()
+
+
+# -----------------------------------------------------------
+# LECTURA EN STREAMING
+# -----------------------------------------------------------
+def iterar_lotes(ruta, tam_bloque=TAM_BLOQUE_LECTURA):
+    """RecordBatch de la fuente, sea CSV (maestro), Parquet o Arrow IPC."""
+    if ruta.endswith(".parquet"):
+        yield from pq.ParquetFile(ruta).iter_batches(batch_size=max(1, tam_bloque // 1024))
+    elif ruta.endswith((".arrow", ".feather")):
+        with pa.memory_map(ruta) as fuente:
+            lector = pa.ipc.open_file(fuente)
+            for i in range(lector.num_record_batches):
+                yield lector.get_batch(i)
+    else:
+        with open(ruta, "rb") as f:
+            yield from iterar_csv_tipado(f, ESQUEMA_MAESTRO, tam_bloque)
+
+
+def columnas_entreno(nombres, tarea):
+    """Columnas de X en el mismo orden que usaría el entrenador normal."""
+    cols = [c for c in nombres if c not in COLS_A_BORRAR_DE_X]
+    seleccion = cargar_seleccion(tarea, cols)
+    if seleccion is not None:
+        cols = [c for c in seleccion if c in cols]
+    return cols
+
+
+def _contar_filas(ruta, target):
+    filas, nombres = 0, None
+    for lote in iterar_lotes(ruta):
+        nombres = lote.schema.names
+        filas += len(lote) - lote.column(target).null_count
+    if nombres is None:
+        raise ValueError(f"'{ruta}' no tiene filas")
+    return filas, nombres
+
+
+# -----------------------------------------------------------
+# PRESUPUESTO DE MEMORIA
+# -----------------------------------------------------------
+def _bytes_por_fila(n_cols, n_arboles, min_muestras_hoja):
+    """
+    Bytes que cuesta cada fila de una partición mientras se entrena:
+      - X float32 (tabla Arrow + matriz NumPy: dos copias) e y.
+      - Buffers del constructor de árboles (índices, pesos del bootstrap y
+        valores de la feature en curso) en cada hilo.
+      - Su parte del bosque fusionado (nodos de n_arboles árboles).
+    """
+    datos = 2 * 4 * (n_cols + 1)
+    constructor = (8 + 8 + 4) * (os.cpu_count() or 1)
+    bosque = n_arboles * NODOS_POR_FILA * (BYTES_NODO + 16) / min_muestras_hoja
+    return datos + constructor + bosque
+
+
+def planificar_particiones(filas, n_cols, modelo, ram_mb, rss_base_mb):
+    """
+    Salida: (n_particiones, filas_por_particion, estimacion_mb) para que
+    una partición + el bosque fusionado quepan en ram_mb.
+    """
+    if math.isnan(rss_base_mb):
+        rss_base_mb = 0.0  # Sin medida de RSS (Windows sin psutil): solo cuenta la reserva
+    disponible = (ram_mb - rss_base_mb - RESERVA_FIT_MB) * MB * MARGEN_PRESUPUESTO
+    if disponible <= 0:
+        raise ValueError(
+            f"El presupuesto ({ram_mb} MB) no cubre ni el proceso en reposo ({rss_base_mb:.0f} MB)"
+        )
+    bytes_fila = _bytes_por_fila(n_cols, modelo.n_estimators, modelo.min_samples_leaf)
+    max_filas = int(disponible // bytes_fila)
+    if max_filas < min(MIN_FILAS_PARTICION, filas):
+        raise ValueError(
+            f"Con {ram_mb} MB caben {max_filas} filas por partición (mínimo {MIN_FILAS_PARTICION}). "
+            f"Sube --ram-mb o usa un backend más ligero (bosque_ligero)."
+        )
+    n_particiones = max(1, math.ceil(filas / max_filas))
+    filas_particion = math.ceil(filas / n_particiones)
+    estimacion_mb = rss_base_mb + RESERVA_FIT_MB + filas_particion * bytes_fila / MB
+    return n_particiones, filas_particion, estimacion_mb
+
+
+def _repartir_arboles(n_arboles, n_particiones):
+    base, resto = divmod(n_arboles, n_particiones)
+    return [max(1, base + (i < resto)) for i in range(n_particiones)]
+
+
+# -----------------------------------------------------------
+# VOLCADO A PARTICIONES (Arrow IPC en una carpeta temporal)
+# -----------------------------------------------------------
+def _volcar_particiones(ruta, columnas, target, n_particiones, fraccion_validacion, carpeta, semilla):
+    """
+    Cada fila con target va a una partición al azar (o a validación).
+    Salida: lista de rutas (la última es la de validación).
+    """
+    rng = np.random.default_rng(semilla)
+    rutas = [os.path.join(carpeta, f"particion_{i:04d}.arrow") for i in range(n_particiones)]
+    rutas.append(os.path.join(carpeta, "validacion.arrow"))
+    escritores = [None] * len(rutas)
+
+    try:
+        for lote in iterar_lotes(ruta):
+            lote = lote.select(columnas + [target])
+            lote = lote.filter(pc.is_valid(lote.column(target)))
+            if not len(lote):
+                continue
+            destino = rng.integers(0, n_particiones, len(lote))
+            destino[rng.random(len(lote)) < fraccion_validacion] = n_particiones
+
+            # Ordenar por destino y cortar: un take() por lote, no un filter() por partición
+            orden = np.argsort(destino, kind="stable")
+            lote = lote.take(pa.array(orden))
+            cortes = np.searchsorted(destino[orden], np.arange(len(rutas) + 1))
+            for i in range(len(rutas)):
+                if cortes[i + 1] > cortes[i]:
+                    if escritores[i] is None:
+                        escritores[i] = pa.ipc.new_file(rutas[i], lote.schema)
+                    escritores[i].write_batch(lote.slice(cortes[i], cortes[i + 1] - cortes[i]))
+    finally:
+        for escritor in escritores:
+            if escritor is not None:
+                escritor.close()
+    return [r if e is not None else None for r, e in zip(rutas, escritores)]
+
+
+def _leer_particion(ruta, columnas, target):
+    """(X float32 C-contigua, y) de una partición volcada."""
+    with pa.memory_map(ruta) as fuente:
+        tabla = pa.ipc.open_file(fuente).read_all()
+    X = np.empty((tabla.num_rows, len(columnas)), dtype=np.float32)
+    for j, col in enumerate(columnas):
+        X[:, j] = tabla.column(col).to_numpy(zero_copy_only=False)
+    y = tabla.column(target).to_numpy(zero_copy_only=False)
+    del tabla
+    return X, y
+
+
+# -----------------------------------------------------------
+# FUSIÓN DE BOSQUES
+# -----------------------------------------------------------
+def fusionar_bosques(bosques):
+    """
+    Un RandomForest con los árboles de todos. Un bosque predice la media
+    de sus árboles, así que juntar los estimators_ equivale a promediar
+    los sub-bosques ponderando por número de árboles.
+    """
+    final = bosques[0]
+    for bosque in bosques[1:]:
+        if hasattr(final, "classes_") and not np.array_equal(final.classes_, bosque.classes_):
+            raise ValueError("Los sub-bosques no han visto las mismas clases; no se pueden fusionar")
+        final.estimators_ += bosque.estimators_
+    final.n_estimators = len(final.estimators_)
+    return final
+
+
+def _evaluar(tarea, modelo, X, y):
+    if tarea == "temperatura":
+        pred = predecir_temperatura(modelo, X)
+        return {"mae": float(np.mean(np.abs(pred - y)))}
+    prob = probabilidad_lluvia(modelo, X)
+    return {
+        "brier": float(np.mean((prob - y) ** 2)),
+        "acierto": float(np.mean((prob > UMBRAL_LLUVIA) == (y == 1))),
+    }
+
+
+def entrenar_por_bloques(tarea, ram_mb, backend=BACKEND_POR_DEFECTO, fuente=RUTA_DATASET_MASTER,
+                         dir_modelos=DIR_MODELOS, fraccion_validacion=0.1, semilla=40, guardar=True):
+    """
+    Entrena el modelo de 'tarea' sin cargar nunca el dataset entero.
+    Entrada: presupuesto de RAM del proceso (MB), backend de bosque y
+             fuente (maestro CSV, Parquet o Arrow IPC con el target).
+    Salida: (modelo, informe) -> informe con particiones, pico de RSS de
+            esta tarea (no el de todo el proceso) y métricas.
+    """
+    target = TARGETS[tarea]
+    modelo_base = crear_modelo(tarea, backend)
+    if not isinstance(modelo_base, (RandomForestRegressor, RandomForestClassifier)):
+        raise ValueError(f"El entreno por bloques solo admite bosques; '{backend}' no lo es")
+
+    # Pico de esta tarea: ru_maxrss es de todo el proceso y arrastraría el de la anterior
+    with PicoRSS() as pico:
+        t0 = time.perf_counter()
+        rss_base = rss_actual_mb()
+        filas, nombres = _contar_filas(fuente, target)
+        columnas = columnas_entreno(nombres, tarea)
+        filas_train = int(filas * (1 - fraccion_validacion))
+        n_part, filas_part, estimacion = planificar_particiones(filas_train, len(columnas), modelo_base, ram_mb, rss_base)
+        arboles = _repartir_arboles(modelo_base.n_estimators, n_part)
+
+        print(f"\n🧱 ENTRENO POR BLOQUES '{tarea}' ({backend}) | presupuesto {ram_mb} MB")
+        print(f"   {filas} filas, {len(columnas)} columnas -> {n_part} particiones de ~{filas_part} filas "
+              f"(estimado {estimacion:.0f} MB)")
+
+        sub_bosques = []
+        with tempfile.TemporaryDirectory(prefix="entreno_bloques_") as carpeta:
+            rutas = _volcar_particiones(fuente, columnas, target, n_part, fraccion_validacion, carpeta, semilla)
+            for i, ruta in enumerate(rutas[:-1]):
+                if ruta is None:
+                    continue
+                X, y = _leer_particion(ruta, columnas, target)
+                if tarea == "lluvia":
+                    y = y.astype("int8")
+                    if len(np.unique(y)) < 2:
+                        print(f"   ⚠️ Partición {i} con una sola clase: se descarta")
+                        continue
+                sub = crear_modelo(tarea, backend).set_params(n_estimators=arboles[i], random_state=semilla + i)
+                sub.fit(X, y)
+                sub_bosques.append(sub)
+                del X, y
+                print(f"   Partición {i + 1}/{n_part}: {arboles[i]} árboles | RSS {rss_actual_mb():.0f} MB")
+
+            if not sub_bosques:
+                raise ValueError("Ninguna partición ha podido entrenarse")
+            modelo = fusionar_bosques(sub_bosques)
+
+            metricas = {}
+            if rutas[-1] is not None:
+                X_val, y_val = _leer_particion(rutas[-1], columnas, target)
+                metricas = _evaluar(tarea, modelo, X_val, y_val)
+                del X_val, y_val
+
+        if guardar:
+            r_temp, c_temp, r_lluvia, c_lluvia = rutas_modelos(dir_modelos)
+            ruta_modelo, ruta_cols = (r_temp, c_temp) if tarea == "temperatura" else (r_lluvia, c_lluvia)
+            os.makedirs(dir_modelos, exist_ok=True)
+            joblib.dump(modelo, ruta_modelo)
+            joblib.dump(columnas, ruta_cols)
+
+    informe = {
+        "tarea": tarea, "backend": backend, "filas": filas, "columnas": len(columnas),
+        "particiones": n_part, "filas_por_particion": filas_part, "arboles": modelo.n_estimators,
+        "presupuesto_mb": ram_mb, "estimado_mb": round(estimacion, 1),
+        "pico_rss_mb": round(pico.mb, 1), "segundos": round(time.perf_counter() - t0, 2),
+        **metricas,
+    }
+    aviso = "" if informe["pico_rss_mb"] <= ram_mb else "  ⚠️ SUPERA EL PRESUPUESTO"
+    print(f"   Pico de RSS: {informe['pico_rss_mb']:.0f} MB de {ram_mb} MB{aviso}")
+    print(f"   Validación: {metricas} | {informe['segundos']} s")
+    return modelo, informe
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entreno con memoria acotada (particiones + fusión de bosques).")
+    parser.add_argument("tareas", nargs="+", choices=list(TARGETS))
+    parser.add_argument("--ram-mb", type=int, required=True, help="Presupuesto de RAM del proceso")
+    parser.add_argument("--backend", default=BACKEND_POR_DEFECTO)
+    parser.add_argument("--fuente", default=RUTA_DATASET_MASTER, help="Maestro CSV, Parquet o Arrow IPC")
+    parser.add_argument("--dir-modelos", default=DIR_MODELOS)
+    parser.add_argument("--validacion", type=float, default=0.1, help="Fracción de filas apartadas")
+    parser.add_argument("--no-guardar", action="store_true", help="Solo mide, no sobrescribe los .pkl")
+    args = parser.parse_args()
+
+    for tarea in args.tareas:
+        entrenar_por_bloques(
+            tarea, args.ram_mb, args.backend, args.fuente, args.dir_modelos,
+            args.validacion, guardar=not args.no_guardar,
+        )
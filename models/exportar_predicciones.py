@@ -0,0 +1,152 @@
+import os
+import argparse
+import time
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from data.esquema import ESQUEMA_MAESTRO, COLUMNA_FECHA, iterar_csv_tipado
+from models.prediccion import DIR_MODELOS, UMBRAL_LLUVIA, cargar_modelos, version_modelos, predecir_filas
+
+# =================================================================
+# EXPORTACIÓN MASIVA DE PREDICCIONES (Arrow / Parquet)
+# =================================================================
+# Para sistemas que necesitan predicciones + features en bloque, sin
+# pasar por el dashboard ni por pandas.read_csv del maestro entero:
+#   - El maestro se lee en streaming (bloques de Arrow ya tipados).
+#   - Cada bloque se filtra por fechas, se predice con UNA llamada por
+#     modelo y se escribe enseguida: la memoria no crece con el rango.
+#   - Se puede fijar la versión de modelo (hash de contenido) y apuntar
+#     a otra carpeta de modelos para exportar con un modelo archivado.
+# Uso: python -m models.exportar_predicciones salida.parquet --desde 2025-01-01
+
+RUTA_DATASET_MASTER = "data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv"
+
+# Región -> dataset con sus features. De momento solo hay modelo de ciudad.
+REGIONES = {"barcelona": RUTA_DATASET_MASTER}
+
+FORMATOS = ("parquet", "arrow")
+TAM_BLOQUE_CSV = 1 << 20  # ~1 MB de CSV por lote (~2.000 días del maestro)
+
+# Columnas que no se exportan como features (targets = el futuro)
+COLS_NO_EXPORTADAS = ["TARGET_Temp_Manana", "TARGET_Lluvia_Manana"]
+
+
+def _filtrar_fechas(lote, desde, hasta):
+    fechas = lote.column(COLUMNA_FECHA)
+    mascara = None
+    if desde is not None:
+        mascara = pc.greater_equal(fechas, pa.scalar(desde, fechas.type))
+    if hasta is not None:
+        cond = pc.less_equal(fechas, pa.scalar(hasta, fechas.type))
+        mascara = cond if mascara is None else pc.and_(mascara, cond)
+    return lote if mascara is None else lote.filter(mascara)
+
+
+def lotes_prediccion(desde=None, hasta=None, region="barcelona", version_modelo=None,
+                     dir_modelos=DIR_MODELOS, features=True, tam_bloque=TAM_BLOQUE_CSV):
+    """
+    Generador de pa.RecordBatch con una fila por día del rango:
+      Fecha (datos), Fecha_Prediccion, region, version_modelo,
+      temp_pred, prob_lluvia, es_lluvia y (features=True) las features de entrada.
+    desde/hasta: fechas de los datos (datetime/Timestamp; None = sin límite).
+    version_modelo: si se indica, debe coincidir con el hash de dir_modelos.
+    """
+    if region not in REGIONES:
+        raise ValueError(f"Región desconocida '{region}'. Disponibles: {sorted(REGIONES)}")
+
+    version = version_modelos(dir_modelos)
+    if version_modelo is not None and version_modelo != version:
+        raise ValueError(
+            f"Los modelos de '{dir_modelos}' son la versión {version}, no {version_modelo}"
+        )
+    modelos = cargar_modelos(dir_modelos)
+    cols_modelo = sorted(set(modelos[1]) | set(modelos[3]))
+
+    with open(REGIONES[region], "rb") as f:
+        for lote in iterar_csv_tipado(f, ESQUEMA_MAESTRO, tam_bloque):
+            fechas = lote.column(COLUMNA_FECHA)
+            # El maestro está ordenado por fecha: pasado 'hasta' no queda nada
+            if hasta is not None and len(lote) and pc.min(fechas).as_py() > hasta:
+                break
+            lote = _filtrar_fechas(lote, desde, hasta)
+            if not len(lote):
+                continue
+
+            # Solo las columnas que usan los modelos pasan a pandas
+            presentes = [c for c in cols_modelo if c in lote.schema.names]
+            temps, probs = predecir_filas(lote.select(presentes).to_pandas(), modelos)
+
+            fechas = lote.column(COLUMNA_FECHA)
+            columnas = {
+                COLUMNA_FECHA: fechas,
+                "Fecha_Prediccion": pc.add(fechas, pa.scalar(86400, pa.duration("s"))),
+                "region": pa.array([region] * len(lote)).dictionary_encode(),
+                "version_modelo": pa.array([version] * len(lote)).dictionary_encode(),
+                "temp_pred": pa.array(temps, pa.float32()),
+                "prob_lluvia": pa.array(probs, pa.float32()),
+                "es_lluvia": pa.array(probs > UMBRAL_LLUVIA),
+            }
+            if features:
+                for nombre in lote.schema.names:
+                    if nombre not in columnas and nombre not in COLS_NO_EXPORTADAS:
+                        columnas[nombre] = lote.column(nombre)
+
+            yield pa.RecordBatch.from_arrays(list(columnas.values()), names=list(columnas))
+
+
+def exportar_predicciones(destino, formato="parquet", **kwargs):
+    """
+    Escribe lotes_prediccion(**kwargs) en un fichero Parquet o Arrow IPC.
+    Se escribe a un temporal y se renombra al final (nadie lee uno a medias).
+    Salida: número de filas exportadas.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido '{formato}'. Disponibles: {FORMATOS}")
+
+    ruta_tmp = f"{destino}.tmp"
+    escritor, filas = None, 0
+    try:
+        for lote in lotes_prediccion(**kwargs):
+            if escritor is None:
+                if formato == "parquet":
+                    escritor = pq.ParquetWriter(ruta_tmp, lote.schema, compression="zstd")
+                else:
+                    escritor = pa.ipc.new_file(ruta_tmp, lote.schema)
+            escritor.write_batch(lote)
+            filas += len(lote)
+        if escritor is None:
+            return 0
+        escritor.close()
+        os.replace(ruta_tmp, destino)
+    finally:
+        if os.path.exists(ruta_tmp):
+            if escritor is not None:
+                escritor.close()
+            os.remove(ruta_tmp)
+    return filas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta predicciones + features a Parquet o Arrow.")
+    parser.add_argument("destino", help="Fichero de salida (.parquet o .arrow)")
+    parser.add_argument("--desde", default=None, help="Fecha inicial de los datos (AAAA-MM-DD)")
+    parser.add_argument("--hasta", default=None, help="Fecha final de los datos (AAAA-MM-DD)")
+    parser.add_argument("--region", default="barcelona", choices=sorted(REGIONES))
+    parser.add_argument("--version-modelo", default=None, help="Hash de modelo esperado (falla si no coincide)")
+    parser.add_argument("--dir-modelos", default=DIR_MODELOS)
+    parser.add_argument("--formato", default=None, choices=FORMATOS, help="Por defecto, según la extensión")
+    parser.add_argument("--sin-features", action="store_true", help="Solo fechas y predicciones")
+    args = parser.parse_args()
+
+    formato = args.formato or ("arrow" if args.destino.endswith((".arrow", ".feather")) else "parquet")
+    t0 = time.perf_counter()
+    n = exportar_predicciones(
+        args.destino, formato,
+        desde=datetime.fromisoformat(args.desde) if args.desde else None,
+        hasta=datetime.fromisoformat(args.hasta) if args.hasta else None,
+        region=args.region, version_modelo=args.version_modelo,
+        dir_modelos=args.dir_modelos, features=not args.sin_features,
+    )
+    print(f" {n} filas exportadas a {args.destino} ({formato}) en {time.perf_counter() - t0:.2f} s")
@@ -0,0 +1,285 @@
+import os
+import time
+import argparse
+import tempfile
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+from data.almacen_maestro import leer_maestro
+
+# =================================================================
+# ÍNDICE DE DÍAS ANÁLOGOS (k-NN sobre features estandarizadas)
+# =================================================================
+# "¿Qué días del histórico se parecieron más a hoy?" -> explicación en
+# el dashboard y previsión base barata (media de lo que pasó al día
+# siguiente de los análogos).
+#   - KD-tree sobre las features estandarizadas (media/desviación fijadas
+#     al construir). Se construye una vez y se guarda junto a los modelos.
+#   - Incremental: los días nuevos van a un búfer pequeño que se busca por
+#     fuerza bruta; cuando crece se reconstruye el árbol (milisegundos).
+#   - Los días a menos de margen_dias del consultado no cuentan como
+#     análogos: ayer siempre se parece a hoy (medias móviles) y sería
+#     fuga de información en el replay.
+# Uso: python -m models.indice_analogos --construir
+#      python -m models.indice_analogos --fecha 2024-03-10 --k 10
+
+RUTA_DATASET_MASTER = "data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv"
+RUTA_INDICE = "data/model_memory/indice_analogos.pkl"
+
+# Estado del día: estación del año, medidas, tendencia de presión, viento y medias móviles
+FEATURES_ANALOGO = [
+    "Dia_Sin", "Dia_Cos",
+    "Temp_Media_C", "Temp_Maxima_C", "Temp_Minima_C", "Humedad_Media_Pct", "Irrad_Solar_MJm2",
+    "Presion_Media_hPa", "Presion_Media_hPa_Delta",
+    "Viento_Maximo_kmh", "Viento_Dir_Sin", "Viento_Dir_Cos",
+    "Temp_Media_C_Media_3dias", "Temp_Media_C_Media_7dias",
+    "Presion_Media_hPa_Media_3dias", "Presion_Media_hPa_Media_7dias",
+    "Viento_Maximo_kmh_Media_3dias",
+]
+TARGETS = ["TARGET_Temp_Manana", "TARGET_Lluvia_Manana"]
+
+MARGEN_DIAS = 7              # Días alrededor del consultado que no pueden ser análogos
+MIN_BUFER = 64               # El búfer se busca por fuerza bruta hasta este tamaño...
+FRACCION_BUFER = 0.02        # ...o este % del árbol, lo que sea mayor
+DIAS_REVISION = 3            # Cola que se re-sincroniza en cada actualización (targets de ayer)
+
+
+class IndiceAnalogos:
+    """KD-tree sobre los días completos del maestro + búfer de días añadidos."""
+
+    def __init__(self, columnas, media, escala, fechas, Z, targets):
+        self.columnas = list(columnas)
+        self.media = media
+        self.escala = escala
+        self.fechas = fechas      # datetime64[ns], una por fila indexada
+        self.Z = Z                # Features estandarizadas (float64)
+        self.targets = targets    # (filas, 2): temperatura y lluvia del día siguiente (NaN si aún no)
+        self._reconstruir()
+
+    @classmethod
+    def construir(cls, df, columnas=FEATURES_ANALOGO):
+        """Índice nuevo desde el maestro (solo días con todas las features)."""
+        columnas = [c for c in columnas if c in df.columns]
+        df = df.sort_values("Fecha")
+        X = df[columnas].to_numpy(dtype=np.float64, na_value=np.nan)
+        completas = ~np.isnan(X).any(axis=1)
+        X = X[completas]
+        media = X.mean(axis=0)
+        escala = X.std(axis=0)
+        escala[escala == 0] = 1.0
+        return cls(
+            columnas, media, escala,
+            fechas=df["Fecha"].to_numpy(dtype="datetime64[ns]")[completas],
+            Z=(X - media) / escala,
+            targets=cls._targets(df)[completas],
+        )
+
+    @staticmethod
+    def _targets(df):
+        return np.column_stack([
+            df[t].to_numpy(dtype=np.float64, na_value=np.nan) if t in df.columns else np.full(len(df), np.nan)
+            for t in TARGETS
+        ])
+
+    def _reconstruir(self):
+        self.arbol = KDTree(self.Z) if len(self.Z) else None
+        self.n_arbol = len(self.Z)
+
+    def __len__(self):
+        return len(self.fechas)
+
+    def estandarizar(self, df):
+        """Filas a consultar -> espacio del índice (una feature ausente = valor medio)."""
+        X = df.reindex(columns=self.columnas).to_numpy(dtype=np.float64, na_value=np.nan)
+        Z = (X - self.media) / self.escala
+        return np.nan_to_num(Z, nan=0.0)
+
+    # -----------------------------------------------------------
+    # ACTUALIZACIÓN INCREMENTAL
+    # -----------------------------------------------------------
+    def actualizar(self, df_cola):
+        """
+        Upsert de días (cola del maestro). Los días nuevos van al búfer;
+        si cambian las features de un día que ya está en el árbol, se
+        reconstruye. Salida: (días nuevos, días actualizados).
+        """
+        df_cola = df_cola.sort_values("Fecha")
+        X = df_cola.reindex(columns=self.columnas).to_numpy(dtype=np.float64, na_value=np.nan)
+        completas = ~np.isnan(X).any(axis=1)
+        fechas = df_cola["Fecha"].to_numpy(dtype="datetime64[ns]")[completas]
+        Z = (X[completas] - self.media) / self.escala
+        targets = self._targets(df_cola)[completas]
+
+        posicion = {f: i for i, f in enumerate(self.fechas)}
+        nuevos, actualizados, reconstruir = [], 0, False
+        for j, fecha in enumerate(fechas):
+            i = posicion.get(fecha)
+            if i is None:
+                nuevos.append(j)
+                continue
+            if not np.allclose(self.Z[i], Z[j]):
+                self.Z[i] = Z[j]
+                reconstruir |= i < self.n_arbol
+            self.targets[i] = targets[j]
+            actualizados += 1
+
+        if nuevos:
+            self.fechas = np.concatenate([self.fechas, fechas[nuevos]])
+            self.Z = np.concatenate([self.Z, Z[nuevos]])
+            self.targets = np.concatenate([self.targets, targets[nuevos]])
+        if reconstruir or len(self) - self.n_arbol > max(MIN_BUFER, FRACCION_BUFER * self.n_arbol):
+            self._reconstruir()
+        return len(nuevos), actualizados
+
+    # -----------------------------------------------------------
+    # CONSULTAS
+    # -----------------------------------------------------------
+    def vecinos(self, df_filas, k=10, margen_dias=MARGEN_DIAS):
+        """
+        Entrada: filas del maestro (con Fecha y features).
+        Salida: (indices, distancias), arrays (filas, k) ordenados de más
+        a menos parecido. Sin candidatos suficientes -> índice -1 / dist. inf.
+        """
+        Z = self.estandarizar(df_filas)
+        fechas_q = df_filas["Fecha"].to_numpy(dtype="datetime64[ns]")
+        # Como mucho 2*margen+1 filas caen en la ventana excluida
+        k_ext = min(self.n_arbol, k + 2 * margen_dias + 1)
+
+        if self.arbol is not None and k_ext:
+            dist_arbol, idx_arbol = self.arbol.query(Z, k=k_ext)
+        else:
+            dist_arbol = np.empty((len(Z), 0))
+            idx_arbol = np.empty((len(Z), 0), dtype=np.intp)
+
+        # Búfer: fuerza bruta (son pocas filas)
+        bufer = np.arange(self.n_arbol, len(self))
+        dist_bufer = np.sqrt(((Z[:, None, :] - self.Z[bufer][None, :, :]) ** 2).sum(axis=2))
+        idx = np.concatenate([idx_arbol, np.broadcast_to(bufer, dist_bufer.shape)], axis=1)
+        dist = np.concatenate([dist_arbol, dist_bufer], axis=1)
+
+        margen = np.timedelta64(margen_dias, "D")
+        excluido = np.abs(self.fechas[idx] - fechas_q[:, None]) <= margen
+        dist = np.where(excluido, np.inf, dist)
+
+        orden = np.argsort(dist, axis=1, kind="stable")[:, :k]
+        dist = np.take_along_axis(dist, orden, axis=1)
+        idx = np.where(np.isinf(dist), -1, np.take_along_axis(idx, orden, axis=1))
+        if dist.shape[1] < k:
+            relleno = k - dist.shape[1]
+            dist = np.pad(dist, ((0, 0), (0, relleno)), constant_values=np.inf)
+            idx = np.pad(idx, ((0, 0), (0, relleno)), constant_values=-1)
+        return idx, dist
+
+    def analogos(self, fila, k=10, margen_dias=MARGEN_DIAS):
+        """Tabla de los k días más parecidos a UNA fila y lo que pasó al día siguiente."""
+        idx, dist = self.vecinos(fila.iloc[[0]] if len(fila) > 1 else fila, k, margen_dias)
+        validos = idx[0] >= 0
+        i, d = idx[0][validos], dist[0][validos]
+        return pd.DataFrame({
+            "Fecha": self.fechas[i],
+            "distancia": d,
+            "temp_manana": self.targets[i, 0],
+            "lluvia_manana": self.targets[i, 1],
+        })
+
+    def prevision(self, df_filas, k=20, margen_dias=MARGEN_DIAS):
+        """
+        Previsión base por conjunto de análogos: media (ponderada por 1/distancia)
+        de la temperatura y frecuencia de lluvia del día siguiente de los k análogos.
+        Salida: DataFrame por fila con temp_analogos y prob_lluvia_analogos.
+        """
+        idx, dist = self.vecinos(df_filas, k, margen_dias)
+        targets = self.targets[np.maximum(idx, 0)]                      # (filas, k, 2)
+        pesos = np.where(idx >= 0, 1.0 / (dist + 1e-6), 0.0)[:, :, None]
+        pesos = np.where(np.isnan(targets), 0.0, pesos)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media = (np.nan_to_num(targets) * pesos).sum(axis=1) / pesos.sum(axis=1)
+        return pd.DataFrame({
+            "Fecha": df_filas["Fecha"].to_numpy(),
+            "temp_analogos": media[:, 0],
+            "prob_lluvia_analogos": media[:, 1],
+        }, index=df_filas.index)
+
+
+# -----------------------------------------------------------
+# PERSISTENCIA (Junto a los modelos)
+# -----------------------------------------------------------
+def guardar_indice(indice, ruta=RUTA_INDICE):
+    """Temporal en la misma carpeta + os.replace(): el dashboard nunca lee uno a medias."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    fd, ruta_tmp = tempfile.mkstemp(prefix=".indice_analogos.", suffix=".tmp", dir=os.path.dirname(ruta))
+    os.close(fd)
+    try:
+        joblib.dump(indice, ruta_tmp)
+        os.chmod(ruta_tmp, 0o644)
+        os.replace(ruta_tmp, ruta)
+    except BaseException:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+        raise
+
+
+def cargar_indice(ruta=RUTA_INDICE):
+    """El índice guardado o None si aún no se ha construido."""
+    try:
+        return joblib.load(ruta)
+    except FileNotFoundError:
+        return None
+
+
+def construir_y_guardar(ruta_maestro=RUTA_DATASET_MASTER, ruta=RUTA_INDICE):
+    """Para el pipeline offline: índice completo desde el maestro."""
+    df, _ = leer_maestro(ruta_maestro)
+    indice = IndiceAnalogos.construir(df)
+    guardar_indice(indice, ruta)
+    print(f" Índice de análogos: {len(indice)} días, {len(indice.columnas)} features -> {ruta}")
+    return indice
+
+
+def actualizar_indice_guardado(df_maestro, ruta=RUTA_INDICE):
+    """
+    Para pipeline_mantenimiento: añade la cola nueva del maestro al índice
+    guardado (o lo construye si no existe) y lo vuelve a guardar.
+    """
+    indice = cargar_indice(ruta)
+    if indice is None or list(indice.columnas) != [c for c in FEATURES_ANALOGO if c in df_maestro.columns]:
+        indice = IndiceAnalogos.construir(df_maestro)
+        nuevos, actualizados = len(indice), 0
+    else:
+        desde = indice.fechas[-1] - np.timedelta64(DIAS_REVISION, "D")
+        nuevos, actualizados = indice.actualizar(df_maestro[df_maestro["Fecha"] >= desde])
+    guardar_indice(indice, ruta)
+    return nuevos, actualizados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice de días análogos (k-NN sobre features estandarizadas).")
+    parser.add_argument("--construir", action="store_true", help="Reconstruye el índice desde el maestro")
+    parser.add_argument("--fecha", default=None, help="Día a consultar (AAAA-MM-DD; por defecto el último)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--margen-dias", type=int, default=MARGEN_DIAS)
+    args = parser.parse_args()
+
+    if args.construir:
+        construir_y_guardar()
+
+    indice = cargar_indice()
+    if indice is None:
+        raise SystemExit(" No hay índice: ejecuta con --construir")
+
+    df, _ = leer_maestro(RUTA_DATASET_MASTER)
+    df = df.sort_values("Fecha")
+    fila = df.iloc[[-1]] if args.fecha is None else df[df["Fecha"] == pd.Timestamp(args.fecha)]
+    if fila.empty:
+        raise SystemExit(f" No hay datos para {args.fecha}")
+
+    t0 = time.perf_counter()
+    tabla = indice.analogos(fila, args.k, args.margen_dias)
+    ms = (time.perf_counter() - t0) * 1000
+    base = indice.prevision(fila, margen_dias=args.margen_dias).iloc[0]
+
+    print(f"\n Días más parecidos a {fila['Fecha'].iloc[0].date()} ({len(indice)} días indexados, {ms:.2f} ms)")
+    print(tabla.round({"distancia": 3, "temp_manana": 1}).to_string(index=False))
+    print(f"\n Previsión por análogos: {base['temp_analogos']:.1f} °C | lluvia {base['prob_lluvia_analogos']*100:.0f} %")
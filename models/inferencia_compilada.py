@@ -0,0 +1,280 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import (
+    RandomForestRegressor, RandomForestClassifier, ExtraTreesRegressor, ExtraTreesClassifier,
+)
+
+from data.almacen_maestro import leer_maestro
+from data.esquema import matriz_float32
+from models.backends import predecir_temperatura, probabilidad_lluvia
+
+# =================================================================
+# INFERENCIA COMPILADA (Bosques como arrays planos de NumPy)
+# =================================================================
+# predict() de sklearn con n_jobs=-1 lanza el pool de hilos de joblib y
+# recorre los 200 árboles uno a uno desde Python: para UNA fila casi todo
+# es sobrecoste. Aquí el bosque se aplana una vez en arrays de nodos
+# (hijos, feature, umbral, valor) con todos los árboles concatenados y:
+#   - Se bajan todos los árboles a la vez, un nivel por iteración: el
+#     bucle de Python es de profundidad (~30), no de árboles x nodos.
+#   - Las hojas apuntan a sí mismas, así que no hace falta máscara de
+#     "ya terminado": basta con iterar max_depth veces.
+#   - Mismas reglas que sklearn: X en float32 comparado en double con
+#     umbral, NaN al hijo de missing_go_to_left, probabilidades de hoja
+#     normalizadas y suma secuencial en el orden de los árboles. El
+#     resultado es idéntico al bit al de predict/predict_proba
+#     (con n_jobs=1; con varios hilos sklearn suma en orden variable).
+# Uso: python -m models.inferencia_compilada  (verifica y mide p50/p99)
+
+RUTA_DATASET_MASTER = "data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv"
+BOSQUES = (RandomForestRegressor, RandomForestClassifier, ExtraTreesRegressor, ExtraTreesClassifier)
+
+
+class BosqueCompilado:
+    """
+    Bosque aplanado con la interfaz de sklearn que usan los backends
+    (predict / predict_proba), así pasa por predecir_filas() sin cambios.
+    """
+
+    def __init__(self, izquierda, derecha, feature, umbral, nan_izquierda, valor,
+                 raices, profundidad, n_features_in_, classes_=None):
+        self.izquierda = izquierda
+        self.derecha = derecha
+        self.feature = feature
+        self.umbral = umbral
+        self.nan_izquierda = nan_izquierda
+        self.valor = valor
+        # raices: (árboles,) para un bosque; (bosques, árboles) si se han concatenado varios
+        self.raices = raices
+        self.profundidad = int(profundidad)
+        self.n_features_in_ = int(n_features_in_)
+        self.n_estimators = raices.shape[-1]
+        if classes_ is not None:
+            self.classes_ = classes_
+
+    # -----------------------------------------------------------
+    # CONSTRUCCIÓN / PERSISTENCIA
+    # -----------------------------------------------------------
+    @classmethod
+    def desde_sklearn(cls, modelo):
+        """Aplana un RandomForest/ExtraTrees de sklearn ya entrenado (una sola salida)."""
+        if not isinstance(modelo, BOSQUES):
+            raise ValueError(f"Solo se compilan bosques de sklearn, no {type(modelo).__name__}")
+        if modelo.n_outputs_ != 1:
+            raise ValueError("Solo se compilan bosques de una sola salida")
+        clasificador = hasattr(modelo, "classes_")
+
+        partes = {k: [] for k in ("izq", "der", "feat", "umbral", "nan_izq", "valor")}
+        raices, desplazamiento, profundidad = [], 0, 0
+        for arbol in modelo.estimators_:
+            t = arbol.tree_
+            nodos = t.__getstate__()["nodes"]
+            hoja = nodos["left_child"] == -1
+            propios = np.arange(t.node_count) + desplazamiento
+
+            # Hoja -> se apunta a sí misma por los dos lados
+            partes["izq"].append(np.where(hoja, propios, nodos["left_child"] + desplazamiento))
+            partes["der"].append(np.where(hoja, propios, nodos["right_child"] + desplazamiento))
+            partes["feat"].append(np.where(hoja, 0, nodos["feature"]))
+            partes["umbral"].append(nodos["threshold"])
+            if "missing_go_to_left" in nodos.dtype.names:
+                partes["nan_izq"].append(nodos["missing_go_to_left"].astype(bool))
+            else:
+                partes["nan_izq"].append(np.zeros(t.node_count, dtype=bool))
+
+            valor = t.value[:, 0, :]
+            if clasificador:
+                # Igual que DecisionTreeClassifier.predict_proba
+                valor = valor[:, :modelo.n_classes_]
+                normalizador = valor.sum(axis=1, keepdims=True)
+                normalizador[normalizador == 0.0] = 1.0
+                valor = valor / normalizador
+            partes["valor"].append(valor)
+
+            raices.append(desplazamiento)
+            desplazamiento += t.node_count
+            profundidad = max(profundidad, t.max_depth)
+
+        return cls(
+            izquierda=np.concatenate(partes["izq"]).astype(np.intp),
+            derecha=np.concatenate(partes["der"]).astype(np.intp),
+            feature=np.concatenate(partes["feat"]).astype(np.intp),
+            umbral=np.concatenate(partes["umbral"]).astype(np.float64),
+            nan_izquierda=np.concatenate(partes["nan_izq"]),
+            valor=np.ascontiguousarray(np.concatenate(partes["valor"]), dtype=np.float64),
+            raices=np.asarray(raices, dtype=np.intp),
+            profundidad=profundidad,
+            n_features_in_=modelo.n_features_in_,
+            classes_=modelo.classes_ if clasificador else None,
+        )
+
+    @classmethod
+    def concatenar(cls, bosques, columnas):
+        """
+        Une varios bosques compilados (p.ej. uno por estación) en un solo
+        juego de arrays para predecirlos todos en la misma llamada.
+        Entrada: bosques y la lista de columnas de cada uno.
+        Salida: (bosque con raices (bosques, árboles), columnas unión).
+        Cada fila elige su bosque con grupo= en predict/predict_proba.
+        """
+        if len({b.n_estimators for b in bosques}) != 1:
+            raise ValueError("Solo se concatenan bosques con el mismo número de árboles")
+        clases = [getattr(b, "classes_", None) for b in bosques]
+        if any((c is None) != (clases[0] is None) or (c is not None and not np.array_equal(c, clases[0]))
+               for c in clases):
+            raise ValueError("Los bosques a concatenar deben ser todos regresores o tener las mismas clases")
+
+        union = list(dict.fromkeys(c for cols in columnas for c in cols))
+        posicion = {c: i for i, c in enumerate(union)}
+        partes = {k: [] for k in ("izq", "der", "feat", "umbral", "nan_izq", "valor", "raices")}
+        desplazamiento = 0
+        for bosque, cols in zip(bosques, columnas):
+            mapa = np.array([posicion[c] for c in cols], dtype=np.intp)
+            partes["izq"].append(bosque.izquierda + desplazamiento)
+            partes["der"].append(bosque.derecha + desplazamiento)
+            partes["feat"].append(mapa[bosque.feature])
+            partes["umbral"].append(bosque.umbral)
+            partes["nan_izq"].append(bosque.nan_izquierda)
+            partes["valor"].append(bosque.valor)
+            partes["raices"].append(bosque.raices + desplazamiento)
+            desplazamiento += len(bosque.izquierda)
+
+        unido = cls(
+            izquierda=np.concatenate(partes["izq"]), derecha=np.concatenate(partes["der"]),
+            feature=np.concatenate(partes["feat"]), umbral=np.concatenate(partes["umbral"]),
+            nan_izquierda=np.concatenate(partes["nan_izq"]), valor=np.concatenate(partes["valor"]),
+            raices=np.stack(partes["raices"]), profundidad=max(b.profundidad for b in bosques),
+            n_features_in_=len(union), classes_=clases[0],
+        )
+        return unido, union
+
+    def guardar(self, ruta):
+        """Arrays planos en .npz: se cargan sin sklearn ni joblib."""
+        extra = {"classes_": self.classes_} if hasattr(self, "classes_") else {}
+        np.savez(
+            ruta, izquierda=self.izquierda, derecha=self.derecha, feature=self.feature,
+            umbral=self.umbral, nan_izquierda=self.nan_izquierda, valor=self.valor,
+            raices=self.raices, profundidad=self.profundidad, n_features_in_=self.n_features_in_, **extra,
+        )
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta) as d:
+            return cls(**{k: d[k] for k in d.files})
+
+    # -----------------------------------------------------------
+    # INFERENCIA
+    # -----------------------------------------------------------
+    def hojas(self, X, grupo=None):
+        """
+        (filas, árboles) -> índice global de la hoja a la que cae cada fila en cada árbol.
+        grupo: bosque de cada fila (solo para bosques concatenados).
+        """
+        # sklearn pasa X a float32 y compara ese valor (promocionado a double) con el umbral
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X tiene {X.shape[1]} columnas; el bosque espera {self.n_features_in_}")
+        X = X.astype(np.float64)
+
+        filas = np.arange(len(X))[:, None]
+        if self.raices.ndim == 2:
+            if grupo is None:
+                raise ValueError("Bosques concatenados: hace falta grupo= con el bosque de cada fila")
+            nodos = self.raices[np.asarray(grupo, dtype=np.intp)]
+        else:
+            nodos = np.repeat(self.raices[None, :], len(X), axis=0)
+        for _ in range(self.profundidad):
+            x = X[filas, self.feature[nodos]]
+            a_izquierda = (x <= self.umbral[nodos]) | (np.isnan(x) & self.nan_izquierda[nodos])
+            nodos = np.where(a_izquierda, self.izquierda[nodos], self.derecha[nodos])
+        return nodos
+
+    def _media_arboles(self, X, grupo=None):
+        # cumsum suma en orden (árbol 0, 1, 2...) como el += de sklearn; sum() usaría suma por pares
+        suma = np.cumsum(self.valor[self.hojas(X, grupo)], axis=1)[:, -1]
+        return suma / self.n_estimators
+
+    def predict_proba(self, X, grupo=None):
+        if not hasattr(self, "classes_"):
+            raise AttributeError("predict_proba solo existe para bosques clasificadores")
+        return self._media_arboles(X, grupo)
+
+    def predict(self, X, grupo=None):
+        media = self._media_arboles(X, grupo)
+        if hasattr(self, "classes_"):
+            return self.classes_.take(np.argmax(media, axis=1))
+        return media[:, 0]
+
+
+def compilar(modelo):
+    """El bosque compilado, o el mismo modelo si no es un bosque (hist_gradient_boosting, lineal)."""
+    return BosqueCompilado.desde_sklearn(modelo) if isinstance(modelo, BOSQUES) else modelo
+
+
+# -----------------------------------------------------------
+# VERIFICACIÓN Y BENCHMARK
+# -----------------------------------------------------------
+def _latencias_ms(funcion, X, tam_lote, repeticiones):
+    tiempos = []
+    for i in range(repeticiones):
+        inicio = (i * tam_lote) % max(1, len(X) - tam_lote)
+        lote = X[inicio:inicio + tam_lote]
+        t0 = time.perf_counter()
+        funcion(lote)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return np.percentile(tiempos, 50), np.percentile(tiempos, 99)
+
+
+def benchmark(modelos, ruta_maestro=RUTA_DATASET_MASTER, tamanos=(1, 8), repeticiones=300):
+    """
+    Entrada: tupla de cargar_modelos() (sklearn).
+    Comprueba que la versión compilada da EXACTAMENTE lo mismo en todo el
+    maestro y mide latencia p50/p99 de ambas por tamaño de lote.
+    Salida: DataFrame con una fila por (tarea, tamaño de lote).
+    """
+    df, _ = leer_maestro(ruta_maestro)
+    mod_temp, cols_temp, mod_lluvia, cols_lluvia = modelos
+    filas = []
+    for tarea, modelo, cols, predecir in (
+        ("temperatura", mod_temp, cols_temp, predecir_temperatura),
+        ("lluvia", mod_lluvia, cols_lluvia, probabilidad_lluvia),
+    ):
+        X = matriz_float32(df.reindex(columns=cols, fill_value=0))
+        t0 = time.perf_counter()
+        compilado = compilar(modelo)
+        t_compilar = (time.perf_counter() - t0) * 1000
+
+        identico = np.array_equal(predecir(modelo, X), predecir(compilado, X))
+        for tam in tamanos:
+            p50_sk, p99_sk = _latencias_ms(lambda lote: predecir(modelo, lote), X, tam, repeticiones)
+            p50_c, p99_c = _latencias_ms(lambda lote: predecir(compilado, lote), X, tam, repeticiones)
+            filas.append({
+                "tarea": tarea, "filas_por_llamada": tam, "identico": identico,
+                "sklearn_p50_ms": p50_sk, "sklearn_p99_ms": p99_sk,
+                "compilado_p50_ms": p50_c, "compilado_p99_ms": p99_c,
+                "speedup_p50": p50_sk / p50_c, "speedup_p99": p99_sk / p99_c,
+                "compilar_ms": t_compilar,
+            })
+    return pd.DataFrame(filas)
+
+
+if __name__ == "__main__":
+    from models.prediccion import DIR_MODELOS, cargar_modelos
+
+    parser = argparse.ArgumentParser(description="Verifica y mide la inferencia compilada frente a sklearn.")
+    parser.add_argument("--dir-modelos", default=DIR_MODELOS)
+    parser.add_argument("--tamanos", nargs="+", type=int, default=[1, 8], help="Filas por llamada")
+    parser.add_argument("--repeticiones", type=int, default=300)
+    args = parser.parse_args()
+
+    tabla = benchmark(cargar_modelos(args.dir_modelos), tamanos=args.tamanos, repeticiones=args.repeticiones)
+    print("\n INFERENCIA COMPILADA vs SKLEARN")
+    print("========================================")
+    with pd.option_context("display.width", 200):
+        print(tabla.round(3).to_string(index=False))
+    if not tabla["identico"].all():
+        raise SystemExit(" ❌ La versión compilada NO coincide con sklearn")
@@ -1,71 +1,86 @@
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, confusion_matrix, mean_absolute_error
+from sklearn.metrics import accuracy_score, brier_score_loss, confusion_matrix, mean_absolute_error
 import joblib
+from data.almacen_maestro import leer_maestro
+from data.esquema import matriz_float32
+from models.seleccion_features import cargar_seleccion
+from models.backends import BACKEND_POR_DEFECTO, crear_modelo, separar_X, probabilidad_lluvia
+import sys
 import os
 import random
+from perfil_memoria import perfil
 
 # CONFIGURACIÓN DE RUTAS
 RUTA_DATASET_MASTER = "data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv"
 RUTA_MODELO_LLUVIA_PKL = "data/model_memory/cerebro_meteo_lluvia.pkl"
 RUTA_COLS_LLUVIA_PKL = "data/model_memory/columnas_modelo_lluvia.pkl"
 
-def entrenar_modelo_lluvia():
+def entrenar_modelo_lluvia(backend=BACKEND_POR_DEFECTO):
     """
     Función PRINCIPAL: Carga datos, entrena y guarda el .pkl
     Esta es la única parte que le interesa a la App automática.
     """
     print("\n☔ INICIANDO RE-ENTRENAMIENTO MODELO LLUVIA...")
-    
-    if not os.path.exists(RUTA_DATASET_MASTER):
-        print(f"❌ Error: No encuentro {RUTA_DATASET_MASTER}")
-        return None, None, None # Devolvemos None si falla
-
-    dt = pd.read_csv(RUTA_DATASET_MASTER)
-    dt = dt.dropna(subset=["TARGET_Lluvia_Manana"])
-
-    # 1. Limpieza
-    cols_a_borrar_de_X = [
-        "Fecha", 
-        "TARGET_Temp_Manana",     
-        "TARGET_Lluvia_Manana", 
-        "Dia_Del_Ano",              
-        "Viento_Direccion_Grados", 
-        "Precip_Total_mm" 
-    ]
-    cols_borrar = [c for c in cols_a_borrar_de_X if c in dt.columns]
-    X = dt.drop(columns=cols_borrar)
-    
-    # Limpieza de Nulos en Target
-    dt_clean = dt.dropna(subset=["TARGET_Lluvia_Manana"])
-    X = X.loc[dt_clean.index]
-    y = dt_clean["TARGET_Lluvia_Manana"]
-
-    # 2. Split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.30, random_state=40, stratify=y
-    )
-
-    # 3. Entrenamiento
-    print(f"   🧠 Entrenando Clasificador con {len(X_train)} registros...")
-    modelo = RandomForestClassifier(
-        n_estimators=200,
-        n_jobs=-1,
-        class_weight="balanced",
-        random_state=40
-    )
-    modelo.fit(X_train, y_train)
-
-    # 4. Guardado
-    os.makedirs(os.path.dirname(RUTA_MODELO_LLUVIA_PKL), exist_ok=True)
-    joblib.dump(modelo, RUTA_MODELO_LLUVIA_PKL)
-    
-    cols_entrenamiento = list(X.columns)
-    joblib.dump(cols_entrenamiento, RUTA_COLS_LLUVIA_PKL)
-
-    print("✅ RE-ENTRENAMIENTO LLUVIA FINALIZADO.")
+    memoria = perfil("entreno_lluvia")  # Nulo salvo con METEO_PERFIL_MEMORIA=1
+    try:
+        # Se lanza (no solo print + return): el pipeline offline debe marcar la etapa como fallida
+        if not os.path.exists(RUTA_DATASET_MASTER):
+            raise FileNotFoundError(f"No encuentro {RUTA_DATASET_MASTER}")
+
+        memoria.marca("leer_maestro")
+        dt, _ = leer_maestro(RUTA_DATASET_MASTER)
+        dt = dt.dropna(subset=["TARGET_Lluvia_Manana"])
+
+        memoria.marca("preparar_X")
+        # 1. Limpieza (lista común de columnas prohibidas en models/backends.py)
+        X = separar_X(dt)
+        # Si hay selección de features vigente para estas columnas (models/seleccion_features.py), solo esas
+        seleccion = cargar_seleccion("lluvia", X.columns)
+        if seleccion is not None:
+            X = X[[c for c in seleccion if c in X.columns]]
+            print(f"    Usando selección de features: {X.shape[1]} columnas")
+
+        # Limpieza de Nulos en Target
+        dt_clean = dt.dropna(subset=["TARGET_Lluvia_Manana"])
+        X = X.loc[dt_clean.index]
+        y = dt_clean["TARGET_Lluvia_Manana"]
+
+        # 2. Split
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.30, random_state=40, stratify=y
+        )
+
+        # 3. Entrenamiento
+        memoria.marca("entreno")
+        print(f"   🧠 Entrenando Clasificador '{backend}' con {len(X_train)} registros...")
+        modelo = crear_modelo("lluvia", backend)
+        # Matrices float32 contiguas: el bosque las usa tal cual, sin copia interna
+        modelo.fit(matriz_float32(X_train), y_train.astype("int8"))
+
+        memoria.marca("validacion")
+        # Validación: Brier del modelo frente a la frecuencia climatológica de lluvia
+        if "Frec_Lluvia_Clima_Manana" in dt_clean.columns:
+            y_bin = y_test.astype("int8")
+            clima_test = dt_clean.loc[X_test.index, "Frec_Lluvia_Clima_Manana"]
+            hay = clima_test.notna()
+            brier = brier_score_loss(y_bin, probabilidad_lluvia(modelo, matriz_float32(X_test)))
+            print(f"   Brier del modelo: {brier:.4f} | Brier de la climatología: "
+                  f"{brier_score_loss(y_bin[hay], clima_test[hay]):.4f}")
+
+        # 4. Guardado
+        memoria.marca("guardar")
+        os.makedirs(os.path.dirname(RUTA_MODELO_LLUVIA_PKL), exist_ok=True)
+        joblib.dump(modelo, RUTA_MODELO_LLUVIA_PKL)
+
+        cols_entrenamiento = list(X.columns)
+        joblib.dump(cols_entrenamiento, RUTA_COLS_LLUVIA_PKL)
+
+        print("✅ RE-ENTRENAMIENTO LLUVIA FINALIZADO.")
+    finally:
+        # También en las salidas anticipadas: si no, el perfil queda abierto
+        memoria.fin()
     
     # Devolvemos los datos para poder hacer tests manuales si queremos
     return modelo, X_test, y_test, dt_clean, cols_entrenamiento
@@ -87,8 +102,8 @@ def ejecutar_pruebas_visuales(modelo, dt_completo, cols_entrenamiento):
     for col in cols_entrenamiento:
         X_test_random[col] = fila_random[col] if col in fila_random.columns else 0
 
-    lluvia_predicha = int(modelo.predict(X_test_random)[0])
-    proba_lluvia = float(modelo.predict_proba(X_test_random)[0][1])
+    lluvia_predicha = int(modelo.predict(matriz_float32(X_test_random))[0])
+    proba_lluvia = float(probabilidad_lluvia(modelo, matriz_float32(X_test_random))[0])
 
     print(f"\n🧪 TEST FILA RANDOM (Fecha: {fila_random['Fecha'].values[0]})")
     print(f"   Real: {lluvia_real} | Predicha: {lluvia_predicha} | Prob: {proba_lluvia:.2f}")
@@ -106,7 +121,7 @@ def ejecutar_pruebas_visuales(modelo, dt_completo, cols_entrenamiento):
         for col in cols_entrenamiento:
             X_row[col] = fila[col] if col in fila.columns else 0
             
-        pred = int(modelo.predict(X_row)[0])
+        pred = int(modelo.predict(matriz_float32(X_row))[0])
         y_true.append(real)
         y_pred.append(pred)
 
@@ -127,7 +142,8 @@ def ejecutar_pruebas_visuales(modelo, dt_completo, cols_entrenamiento):
 if __name__ == "__main__":
     # ESTO SOLO SE EJECUTA SI TÚ LE DAS AL PLAY A ESTE ARCHIVO
     # (La App NO ejecutará esto, solo importará la función de arriba)
-    mod, _, _, dt_clean, cols = entrenar_modelo_lluvia()
+    # Opcional: python -m models.modelo_lluvia <backend>
+    mod, _, _, dt_clean, cols = entrenar_modelo_lluvia(*sys.argv[1:2])
     
     if mod is not None:
         ejecutar_pruebas_visuales(mod, dt_clean, cols)
\ No newline at end of file
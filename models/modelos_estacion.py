@@ -0,0 +1,308 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import joblib
+from threadpoolctl import threadpool_limits
+from sklearn.linear_model import LinearRegression, LogisticRegression
+from sklearn.metrics import mean_absolute_error, brier_score_loss
+
+from data import almacen_estaciones as almacen
+from data.almacen_maestro import leer_maestro
+from data.climatologia import actualizar_climatologia, cargar_climatologia
+from data.esquema import matriz_float32
+from data.features_ventana import cargar_espec, contexto_necesario
+from data.global_feature_engineering import generar_features, generar_targets
+from models.backends import BACKEND_POR_DEFECTO, crear_modelo, separar_X, predecir_temperatura, probabilidad_lluvia
+from models.inferencia_compilada import BOSQUES, BosqueCompilado
+
+# =================================================================
+# MODELOS POR ESTACIÓN (Entreno en paralelo + apilado a Barcelona)
+# =================================================================
+# El modelo de ciudad entrena con la MEDIA de D5, X4 y X8, así que se
+# pierde lo propio de cada estación (montaña, centro, entrada sur).
+#   1. Cada estación se convierte en su propio "maestro" con el MISMO
+#      código de features que la ciudad (generar_features + su
+#      climatología de data/climatologia/<est>.npz).
+#   2. Un proceso por estación (ProcessPoolExecutor). Los hilos de cada
+#      bosque se reparten entre procesos para no sobre-suscribir los
+#      núcleos: el coste total escala con los cores, no con las estaciones.
+#   3. Corte temporal: un primer modelo se entrena sin el último 20% de
+#      cada estación. Ese tramo sirve para medirlo y para entrenar el
+#      APILADO, una regresión (lineal para temperatura, logística para
+#      lluvia) que combina las previsiones de las estaciones en la de
+#      Barcelona. El modelo que se guarda se reentrena con TODO el histórico.
+#   4. Inferencia en bloque: los bosques de todas las estaciones se
+#      compilan y se concatenan (models/inferencia_compilada.py), así que
+#      una sola llamada predice todas las estaciones a la vez.
+# Uso: python -m models.modelos_estacion --entrenar --procesos 3
+#      python -m models.modelos_estacion --fecha 2025-12-31
+
+ESTACIONES_ID = ["D5", "X4", "X8"]
+DIR_MODELOS_ESTACION = "data/model_memory/estaciones"
+RUTA_DATASET_MASTER = "data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv"
+TAREAS = ("temperatura", "lluvia")
+TARGETS = {"temperatura": "TARGET_Temp_Manana", "lluvia": "TARGET_Lluvia_Manana"}
+FRACCION_APILADO = 0.2  # Último tramo temporal: validación por estación + entreno del apilado
+# Hasta aquí el lote compilado gana a sklearn (medido: 3 filas 8 ms vs 78 ms; empatan hacia 300)
+MAX_FILAS_COMPILADO = 256
+
+
+def ruta_modelo(dir_modelos, estacion, tarea):
+    return os.path.join(dir_modelos, f"{estacion}_{tarea}.pkl")
+
+
+def ruta_apilado(dir_modelos, tarea):
+    return os.path.join(dir_modelos, f"apilado_{tarea}.pkl")
+
+
+# -----------------------------------------------------------
+# DATASET DE UNA ESTACIÓN (Mismo código de features que la ciudad)
+# -----------------------------------------------------------
+def dataset_estacion(estacion, desde=None):
+    """
+    Entrada: id de la estación (capa clean) y fecha inicial opcional.
+    Salida: DataFrame con 'Fecha', features y targets, como el maestro.
+    """
+    df = almacen.leer_estacion("clean", estacion, desde=desde)
+    # La climatología es una caché local: si no está, se construye desde la capa raw
+    clima = cargar_climatologia(estacion) or actualizar_climatologia(estacion, almacen.leer_estacion("raw", estacion))
+    df = generar_targets(generar_features(df, clima))
+    return df.reset_index()
+
+
+def _error(tarea, y, pred):
+    return mean_absolute_error(y, pred) if tarea == "temperatura" else brier_score_loss(y, pred)
+
+
+def _predecir(tarea, modelo, X):
+    return predecir_temperatura(modelo, X) if tarea == "temperatura" else probabilidad_lluvia(modelo, X)
+
+
+# -----------------------------------------------------------
+# ENTRENO EN PARALELO
+# -----------------------------------------------------------
+def _entrenar_estacion(estacion, tareas, backend, hilos, dir_modelos):
+    """
+    Trabajador (un proceso por estación). Entrena con todo lo anterior al
+    corte temporal para prever el tramo de validación; luego reentrena con
+    el histórico entero y guarda ese modelo y sus columnas.
+    Salida: (filas de informe, previsiones del tramo de validación).
+    """
+    t0 = time.perf_counter()
+    df = dataset_estacion(estacion)
+    corte = df["Fecha"].iloc[int(len(df) * (1 - FRACCION_APILADO))]
+    informe, validacion = [], []
+
+    # Los bosques usan n_jobs=-1: aquí solo los hilos que le tocan a este proceso
+    with threadpool_limits(hilos):
+        for tarea in tareas:
+            dt = df.dropna(subset=[TARGETS[tarea]])
+            X, y = separar_X(dt), dt[TARGETS[tarea]]
+            if tarea == "lluvia":
+                y = y.astype("int8")
+            entreno = (dt["Fecha"] < corte).to_numpy()
+
+            modelo = crear_modelo(tarea, backend)
+            if "n_jobs" in modelo.get_params():
+                modelo.set_params(n_jobs=hilos)
+            modelo.fit(matriz_float32(X[entreno]), y[entreno])
+
+            pred = _predecir(tarea, modelo, matriz_float32(X[~entreno]))
+            informe.append({"estacion": estacion, "tarea": tarea, "filas_entreno": int(entreno.sum()),
+                            "filas_validacion": int((~entreno).sum()), "error": _error(tarea, y[~entreno], pred)})
+            validacion.append(pd.DataFrame({"Fecha": dt.loc[~entreno, "Fecha"].to_numpy(), "estacion": estacion,
+                                            "tarea": tarea, "prevision": pred}))
+
+            # El modelo que se publica no descarta el tramo más reciente
+            modelo.fit(matriz_float32(X), y)
+            joblib.dump(modelo, ruta_modelo(dir_modelos, estacion, tarea))
+            joblib.dump(list(X.columns), ruta_modelo(dir_modelos, estacion, f"columnas_{tarea}"))
+
+    segundos = time.perf_counter() - t0
+    for fila in informe:
+        fila["segundos"] = segundos
+    return informe, pd.concat(validacion, ignore_index=True)
+
+
+def entrenar_apilado(validacion, estaciones, dir_modelos=DIR_MODELOS_ESTACION, ruta_maestro=RUTA_DATASET_MASTER):
+    """
+    Entrada: previsiones de validación de cada estación (entrenar_estaciones).
+    Combina las estaciones en la previsión de Barcelona con el target del
+    maestro de ciudad: primera mitad del tramo para ajustar y segunda para
+    medir frente a la media simple; el apilado final usa el tramo entero.
+    Salida: filas de informe (una por tarea).
+    """
+    maestro, _ = leer_maestro(ruta_maestro)
+    informe = []
+    for tarea in validacion["tarea"].unique():
+        ancho = (validacion[validacion["tarea"] == tarea]
+                 .pivot(index="Fecha", columns="estacion", values="prevision")[estaciones].dropna())
+        datos = ancho.join(maestro.set_index("Fecha")[TARGETS[tarea]], how="inner").dropna()
+        P, y = datos[estaciones].to_numpy(), datos[TARGETS[tarea]].to_numpy()
+        if tarea == "lluvia":
+            y = y.astype("int8")
+        mitad = len(datos) // 2
+
+        def ajustar(P_fit, y_fit):
+            if tarea == "temperatura":
+                return LinearRegression().fit(P_fit, y_fit)
+            return LogisticRegression(max_iter=1000).fit(P_fit, y_fit)
+
+        def combinar(modelo, P_eval):
+            return modelo.predict(P_eval) if tarea == "temperatura" else modelo.predict_proba(P_eval)[:, 1]
+
+        prueba = ajustar(P[:mitad], y[:mitad])
+        informe.append({
+            "estacion": "apilado", "tarea": tarea, "filas_entreno": mitad, "filas_validacion": len(datos) - mitad,
+            "error": _error(tarea, y[mitad:], combinar(prueba, P[mitad:])),
+            "error_media_simple": _error(tarea, y[mitad:], P[mitad:].mean(axis=1)),
+        })
+        joblib.dump({"modelo": ajustar(P, y), "estaciones": list(estaciones)}, ruta_apilado(dir_modelos, tarea))
+    return informe
+
+
+def entrenar_estaciones(estaciones=ESTACIONES_ID, tareas=TAREAS, backend=BACKEND_POR_DEFECTO,
+                        procesos=None, dir_modelos=DIR_MODELOS_ESTACION, apilar=True):
+    """
+    Entrena un modelo por estación y tarea, una estación por proceso.
+    Salida: DataFrame de informe (error de validación y tiempo por estación).
+    """
+    os.makedirs(dir_modelos, exist_ok=True)
+    procesos = min(procesos or os.cpu_count() or 1, len(estaciones))
+    hilos = max(1, (os.cpu_count() or 1) // procesos)
+    print(f"\n🏭 Entrenando {len(estaciones)} estaciones en {procesos} procesos x {hilos} hilos...")
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        futuros = [pool.submit(_entrenar_estacion, est, tareas, backend, hilos, dir_modelos) for est in estaciones]
+        resultados = [f.result() for f in futuros]
+    informe = [fila for filas, _ in resultados for fila in filas]
+    print(f"   Estaciones entrenadas en {time.perf_counter() - t0:.1f} s")
+
+    if apilar:
+        validacion = pd.concat([v for _, v in resultados], ignore_index=True)
+        informe += entrenar_apilado(validacion, list(estaciones), dir_modelos)
+    return pd.DataFrame(informe)
+
+
+# -----------------------------------------------------------
+# INFERENCIA EN BLOQUE
+# -----------------------------------------------------------
+def cargar_modelos_estacion(estaciones=ESTACIONES_ID, dir_modelos=DIR_MODELOS_ESTACION, compilados=True):
+    """
+    Salida: {tarea: {"estaciones", "modelos", "columnas", "lote", "apilado"}}.
+    Si todos los modelos de una tarea son bosques, "lote" es un único
+    bosque compilado con los de todas las estaciones concatenados.
+    """
+    cargados = {}
+    for tarea in TAREAS:
+        if not all(os.path.exists(ruta_modelo(dir_modelos, est, tarea)) for est in estaciones):
+            continue
+        modelos = [joblib.load(ruta_modelo(dir_modelos, est, tarea)) for est in estaciones]
+        columnas = [joblib.load(ruta_modelo(dir_modelos, est, f"columnas_{tarea}")) for est in estaciones]
+        lote = None
+        if compilados and all(isinstance(m, BOSQUES) for m in modelos):
+            lote = BosqueCompilado.concatenar([BosqueCompilado.desde_sklearn(m) for m in modelos], columnas)
+        apilado = joblib.load(ruta_apilado(dir_modelos, tarea)) if os.path.exists(ruta_apilado(dir_modelos, tarea)) else None
+        cargados[tarea] = {"estaciones": list(estaciones), "modelos": modelos, "columnas": columnas,
+                           "lote": lote, "apilado": apilado}
+    return cargados
+
+
+def filas_estaciones(estaciones=ESTACIONES_ID, fechas=None):
+    """
+    Features de cada estación para las fechas pedidas (por defecto su
+    último día). Solo se lee el contexto que necesitan las ventanas.
+    Salida: DataFrame con 'Fecha', 'estacion' y las features.
+    """
+    contexto = pd.Timedelta(days=contexto_necesario(cargar_espec()) + 1)
+    filas = []
+    for est in estaciones:
+        if fechas is None:
+            ultima = almacen.ultima_fecha("clean", est)
+            objetivo = pd.DatetimeIndex([ultima])
+        else:
+            objetivo = pd.DatetimeIndex(fechas)
+        df = dataset_estacion(est, desde=objetivo.min() - contexto)
+        filas.append(df[df["Fecha"].isin(objetivo)].assign(estacion=est))
+    return pd.concat(filas, ignore_index=True)
+
+
+def predecir_estaciones(df_filas, cargados):
+    """
+    Entrada: filas de filas_estaciones() y modelos de cargar_modelos_estacion().
+    Salida: DataFrame por (Fecha, estacion) con temp_media_c y prob_lluvia,
+    más una fila 'barcelona_apilado' por fecha si hay apilado.
+    """
+    salida = df_filas[["Fecha", "estacion"]].reset_index(drop=True)
+    for tarea, nombre in (("temperatura", "temp_media_c"), ("lluvia", "prob_lluvia")):
+        if tarea not in cargados:
+            continue
+        c = cargados[tarea]
+        grupo = salida["estacion"].map({est: i for i, est in enumerate(c["estaciones"])}).to_numpy()
+        if c["lote"] is not None and len(salida) <= MAX_FILAS_COMPILADO:
+            # Una sola pasada para todas las estaciones: cada fila baja por los árboles de la suya
+            bosque, union = c["lote"]
+            X = matriz_float32(df_filas.reindex(columns=union, fill_value=0))
+            media = bosque.predict(X, grupo) if tarea == "temperatura" else bosque.predict_proba(X, grupo)[:, 1]
+        else:
+            media = np.empty(len(salida))
+            for i, (modelo, cols) in enumerate(zip(c["modelos"], c["columnas"])):
+                mascara = grupo == i
+                if mascara.any():
+                    X = matriz_float32(df_filas[mascara].reindex(columns=cols, fill_value=0))
+                    media[mascara] = _predecir(tarea, modelo, X)
+        salida[nombre] = media
+
+    # Apilado: previsión de Barcelona a partir de las de las estaciones (todas las fechas a la vez)
+    ciudad = pd.DataFrame(index=pd.DatetimeIndex(salida["Fecha"].unique(), name="Fecha"))
+    for tarea, nombre in (("temperatura", "temp_media_c"), ("lluvia", "prob_lluvia")):
+        apilado = cargados.get(tarea, {}).get("apilado")
+        if apilado is None or nombre not in salida:
+            continue
+        ancho = salida.pivot(index="Fecha", columns="estacion", values=nombre)
+        P = ancho.reindex(index=ciudad.index, columns=apilado["estaciones"]).to_numpy()
+        completas = ~np.isnan(P).any(axis=1)
+        valores = np.full(len(P), np.nan)
+        if completas.any():
+            modelo = apilado["modelo"]
+            valores[completas] = (modelo.predict(P[completas]) if tarea == "temperatura"
+                                  else modelo.predict_proba(P[completas])[:, 1])
+        ciudad[nombre] = valores
+    if ciudad.columns.empty:
+        return salida
+    ciudad = ciudad.dropna(how="all").reset_index().assign(estacion="barcelona_apilado")
+    return pd.concat([salida, ciudad[salida.columns]], ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Modelos por estación: entreno en paralelo, apilado y previsión.")
+    parser.add_argument("--entrenar", action="store_true", help="Entrenar los modelos (si no, solo predecir)")
+    parser.add_argument("--estaciones", nargs="+", default=ESTACIONES_ID)
+    parser.add_argument("--backend", default=BACKEND_POR_DEFECTO)
+    parser.add_argument("--procesos", type=int, default=None, help="Por defecto, uno por estación (hasta los cores)")
+    parser.add_argument("--sin-apilado", action="store_true")
+    parser.add_argument("--dir-modelos", default=DIR_MODELOS_ESTACION)
+    parser.add_argument("--fecha", nargs="+", default=None, help="Fechas a predecir (defecto: último día)")
+    args = parser.parse_args()
+
+    if args.entrenar:
+        informe = entrenar_estaciones(args.estaciones, backend=args.backend, procesos=args.procesos,
+                                      dir_modelos=args.dir_modelos, apilar=not args.sin_apilado)
+        print("\n INFORME POR ESTACIÓN (error: MAE °C / Brier en el último tramo temporal)")
+        print("========================================")
+        print(informe.round(4).to_string(index=False))
+
+    cargados = cargar_modelos_estacion(args.estaciones, args.dir_modelos)
+    if cargados:
+        t0 = time.perf_counter()
+        filas = filas_estaciones(args.estaciones, args.fecha)
+        t1 = time.perf_counter()
+        prevision = predecir_estaciones(filas, cargados)
+        t2 = time.perf_counter()
+        print(f"\n PREVISIÓN POR ESTACIÓN (features {1000 * (t1 - t0):.0f} ms | modelos {1000 * (t2 - t1):.1f} ms)")
+        print("========================================")
+        print(prevision.round({"temp_media_c": 2, "prob_lluvia": 3}).to_string(index=False))
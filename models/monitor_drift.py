@@ -0,0 +1,228 @@
+import os
+import json
+from datetime import date
+import numpy as np
+import pandas as pd
+from data.almacen_maestro import guardar_json_atomico
+
+# =================================================================
+# MONITOR DE DRIFT (Re-entrenar solo cuando hace falta)
+# =================================================================
+# En vez de re-entrenar todos los lunes, el pipeline:
+#   1. Guarda cada día la predicción para mañana.
+#   2. Cuando llega el dato real de ese día, anota el error.
+#   3. Actualiza de forma incremental (EWMA) la media de las variables
+#      vigiladas y la compara con la del mismo mes en el histórico de
+#      entrenamiento (así el cambio de estación NO cuenta como drift).
+#      La escala es la desviación de la PROPIA EWMA, no la de un día
+#      suelto: σ·sqrt(α/(2-α)), corregida por la autocorrelación de un día
+#      al siguiente (un gráfico de control EWMA para un AR(1)).
+#   4. Re-entrena si el error reciente o el drift pasan de un umbral,
+#      con un mínimo de días entre re-entrenos (y un máximo sin re-entrenar).
+# Todo el estado cabe en un JSON pequeño en data/model_memory/.
+
+RUTA_ESTADO = "data/model_memory/estado_monitor.json"
+
+VARIABLES_VIGILADAS = [
+    "Temp_Media_C",
+    "Humedad_Media_Pct",
+    "Presion_Media_hPa",
+    "Viento_Maximo_kmh",
+    "Precip_Total_mm",
+]
+
+VENTANA_ERROR_DIAS = 14          # Días para el error "reciente"
+MIN_OBSERVACIONES = 5            # No juzgar el error con menos días que esto
+MIN_DIAS_EWMA = 10               # Calentamiento de la EWMA antes de juzgar drift
+UMBRAL_MAE_TEMP = 1.6            # °C (el modelo ronda 1.05 en validación)
+UMBRAL_BRIER_LLUVIA = 0.22       # (el modelo ronda 0.17 en validación)
+ALPHA_EWMA = 0.15                # Peso del día nuevo en la media móvil exponencial
+UMBRAL_DRIFT_Z = 3.0             # En sigmas de la EWMA del mes (en el histórico, ~3% de los días lo pasa alguna variable)
+MAX_AUTOCORRELACION = 0.95       # Tope del AR(1) estimado (con 1 la escala no está definida)
+MIN_DIAS_ENTRE_REENTRENOS = 3    # Tope de frecuencia
+MAX_DIAS_SIN_REENTRENO = 28      # Red de seguridad: como mucho, un re-entreno al mes
+
+
+def _estado_vacio():
+    return {
+        "ultimo_reentreno": None,
+        "referencia_mensual": {},      # variable -> mes -> {"media", "std"}
+        "ewma": {},                    # variable -> media exponencial reciente
+        "dias_ewma": 0,
+        "ultima_fecha_ewma": None,
+        "prediccion_pendiente": None,  # {"fecha_objetivo", "temp", "prob_lluvia"}
+        "historial": [],               # últimos días con predicción vs real
+    }
+
+
+def cargar_estado(ruta=RUTA_ESTADO):
+    if not os.path.exists(ruta):
+        return _estado_vacio()
+    with open(ruta, encoding="utf-8") as f:
+        return {**_estado_vacio(), **json.load(f)}
+
+
+def guardar_estado(estado, ruta=RUTA_ESTADO):
+    guardar_json_atomico(estado, ruta)
+
+
+# -----------------------------------------------------------
+# 1. PREDICCIÓN VS REAL
+# -----------------------------------------------------------
+def registrar_prediccion(estado, fecha_objetivo, temp, prob_lluvia):
+    estado["prediccion_pendiente"] = {
+        "fecha_objetivo": str(fecha_objetivo),
+        "temp": float(temp),
+        "prob_lluvia": float(prob_lluvia),
+    }
+
+
+def registrar_observacion(estado, fila):
+    """
+    Entrada: fila del maestro (Series) con 'Fecha', 'Temp_Media_C' y 'Lluvia_Binaria'.
+    Si había una predicción para esa fecha, guarda predicción vs real.
+    Si el mismo día se procesa dos veces (refresco de la tarde), se sobreescribe.
+    """
+    fecha = str(pd.Timestamp(fila["Fecha"]).date())
+    pendiente = estado.get("prediccion_pendiente")
+    if not pendiente or pendiente["fecha_objetivo"] != fecha:
+        return
+
+    registro = {
+        "fecha": fecha,
+        "temp_pred": pendiente["temp"],
+        "temp_real": float(fila["Temp_Media_C"]),
+        "prob_lluvia": pendiente["prob_lluvia"],
+        "lluvia_real": int(fila["Lluvia_Binaria"]),
+    }
+    historial = [h for h in estado["historial"] if h["fecha"] != fecha]
+    historial.append(registro)
+    estado["historial"] = historial[-VENTANA_ERROR_DIAS:]
+
+
+def errores_recientes(estado):
+    """Salida: (mae_temp, brier_lluvia, n_dias) sobre la ventana reciente."""
+    historial = estado["historial"]
+    if not historial:
+        return None, None, 0
+    h = pd.DataFrame(historial)
+    mae = float((h["temp_pred"] - h["temp_real"]).abs().mean())
+    brier = float(((h["prob_lluvia"] - h["lluvia_real"]) ** 2).mean())
+    return mae, brier, len(h)
+
+
+# -----------------------------------------------------------
+# 2. DISTRIBUCIÓN DE LAS VARIABLES (Incremental)
+# -----------------------------------------------------------
+def actualizar_distribucion(estado, fila):
+    """Media exponencial por variable; solo una actualización por fecha."""
+    fecha = str(pd.Timestamp(fila["Fecha"]).date())
+    if estado["ultima_fecha_ewma"] == fecha:
+        return
+    for var in VARIABLES_VIGILADAS:
+        valor = fila.get(var)
+        if valor is None or pd.isna(valor):
+            continue
+        previo = estado["ewma"].get(var)
+        estado["ewma"][var] = float(valor) if previo is None else (
+            ALPHA_EWMA * float(valor) + (1 - ALPHA_EWMA) * previo
+        )
+    estado["ultima_fecha_ewma"] = fecha
+    estado["dias_ewma"] += 1
+
+
+def std_ewma(std, rho=0.0, alpha=ALPHA_EWMA):
+    """
+    Desviación estacionaria de la EWMA de una serie con desviación 'std' y
+    autocorrelación de un día al siguiente 'rho' (AR(1)). Con rho=0 es la
+    clásica std·sqrt(α/(2-α)); con días correlados la EWMA varía más.
+    """
+    phi = (1 - alpha) * min(max(rho, 0.0), MAX_AUTOCORRELACION)
+    return std * np.sqrt(alpha / (2 - alpha) * (1 + phi) / (1 - phi))
+
+
+def puntuaciones_drift(estado, mes):
+    """z = |EWMA reciente - media histórica del mes| / std de la EWMA en ese mes, por variable."""
+    zs = {}
+    if estado["dias_ewma"] < MIN_DIAS_EWMA:
+        return zs
+    for var, media_reciente in estado["ewma"].items():
+        ref = estado["referencia_mensual"].get(var, {}).get(str(mes))
+        if ref and ref["std"] > 0:
+            # Referencias antiguas sin 'rho': días independientes
+            zs[var] = abs(media_reciente - ref["media"]) / std_ewma(ref["std"], ref.get("rho", 0.0))
+    return zs
+
+
+def marcar_reentreno(estado, df_entreno, hoy=None):
+    """
+    Tras re-entrenar: nueva referencia mensual (lo que el modelo ha visto)
+    y se reinicia la ventana de errores.
+    """
+    fechas = pd.to_datetime(df_entreno["Fecha"])
+    meses = fechas.dt.month
+    # Pares de días consecutivos para la autocorrelación de un día al siguiente
+    consecutivo = fechas.diff().dt.days.eq(1)
+    referencia = {}
+    for var in VARIABLES_VIGILADAS:
+        if var not in df_entreno.columns:
+            continue
+        valores = df_entreno[var].astype("float64")
+        stats = valores.groupby(meses).agg(["mean", "std"])
+        anomalia = valores - valores.groupby(meses).transform("mean")
+        pares = pd.DataFrame({"hoy": anomalia, "ayer": anomalia.shift(1)})[consecutivo]
+        rho = pares.groupby(meses[consecutivo]).apply(lambda p: p["hoy"].corr(p["ayer"]))
+        referencia[var] = {
+            str(mes): {"media": float(fila["mean"]), "std": float(np.nan_to_num(fila["std"])),
+                       "rho": float(np.nan_to_num(rho.get(mes, 0.0)))}
+            for mes, fila in stats.iterrows()
+        }
+    estado["referencia_mensual"] = referencia
+    estado["ultimo_reentreno"] = str(hoy or date.today())
+    estado["historial"] = []
+
+
+# -----------------------------------------------------------
+# 3. DECISIÓN
+# -----------------------------------------------------------
+def decidir_reentreno(estado, hoy=None, modelos_presentes=True):
+    """
+    Salida: (reentrenar: bool, motivos: list[str])
+    """
+    hoy = hoy or date.today()
+    motivos = []
+
+    if not modelos_presentes:
+        return True, ["no hay modelos entrenados"]
+
+    ultimo = estado["ultimo_reentreno"]
+    dias_desde = (hoy - date.fromisoformat(ultimo)).days if ultimo else None
+
+    if dias_desde is None:
+        motivos.append("no consta ningún re-entreno previo")
+    elif dias_desde >= MAX_DIAS_SIN_REENTRENO:
+        motivos.append(f"{dias_desde} días sin re-entrenar (máximo {MAX_DIAS_SIN_REENTRENO})")
+
+    mae, brier, n = errores_recientes(estado)
+    if n >= MIN_OBSERVACIONES:
+        if mae > UMBRAL_MAE_TEMP:
+            motivos.append(f"MAE reciente {mae:.2f} °C > {UMBRAL_MAE_TEMP}")
+        if brier > UMBRAL_BRIER_LLUVIA:
+            motivos.append(f"Brier reciente {brier:.3f} > {UMBRAL_BRIER_LLUVIA}")
+
+    # Mes del último dato ingerido, no el de hoy: si el maestro va con
+    # retraso, comparar con la referencia de otro mes daría falso drift
+    fecha_ewma = estado["ultima_fecha_ewma"]
+    mes = date.fromisoformat(fecha_ewma).month if fecha_ewma else hoy.month
+    for var, z in puntuaciones_drift(estado, mes).items():
+        if z > UMBRAL_DRIFT_Z:
+            motivos.append(f"drift en {var} (z={z:.2f})")
+
+    if not motivos:
+        return False, []
+
+    # Tope de frecuencia (salvo que no haya constancia de re-entreno)
+    if dias_desde is not None and dias_desde < MIN_DIAS_ENTRE_REENTRENOS:
+        return False, [f"{m} [bloqueado: último re-entreno hace {dias_desde} días]" for m in motivos]
+
+    return True, motivos
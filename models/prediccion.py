@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+from functools import lru_cache
+import joblib
+import pandas as pd
+from data.esquema import matriz_float32
+from data.almacen_maestro import guardar_json_atomico, leer_maestro
+from models.backends import predecir_temperatura, probabilidad_lluvia
+from models.inferencia_compilada import compilar
+
+# =================================================================
+# PREDICCIÓN CON LOS MODELOS GUARDADOS (Ruta común fuera de Streamlit)
+# =================================================================
+DIR_MODELOS = "data/model_memory"
+RUTA_MODELO_TEMP = os.path.join(DIR_MODELOS, "cerebro_meteo_temperatura.pkl")
+RUTA_COLS_TEMP = os.path.join(DIR_MODELOS, "columnas_modelo_temperatura.pkl")
+RUTA_MODELO_LLUVIA = os.path.join(DIR_MODELOS, "cerebro_meteo_lluvia.pkl")
+RUTA_COLS_LLUVIA = os.path.join(DIR_MODELOS, "columnas_modelo_lluvia.pkl")
+RUTA_PREDICCION = os.path.join(DIR_MODELOS, "prediccion_manana.json")
+
+UMBRAL_LLUVIA = 0.35  # Umbral personalizable
+
+
+def rutas_modelos(dir_modelos=DIR_MODELOS):
+    """(modelo_temp, cols_temp, modelo_lluvia, cols_lluvia) dentro de dir_modelos."""
+    return tuple(os.path.join(dir_modelos, os.path.basename(r))
+                 for r in (RUTA_MODELO_TEMP, RUTA_COLS_TEMP, RUTA_MODELO_LLUVIA, RUTA_COLS_LLUVIA))
+
+
+def modelos_disponibles(dir_modelos=DIR_MODELOS):
+    return all(os.path.exists(r) for r in rutas_modelos(dir_modelos))
+
+
+def cargar_modelos(dir_modelos=DIR_MODELOS, compilados=False):
+    """
+    Salida: (mod_temp, cols_temp, mod_lluvia, cols_lluvia). Lanza error si falta alguno.
+    compilados=True -> los bosques se aplanan a NumPy (models/inferencia_compilada.py):
+    mismas predicciones, mucha menos latencia por llamada. Solo compensa a
+    quien predice muchas veces con los mismos modelos: para una única
+    predicción, compilar (~80 ms y un pico de memoria) cuesta más que predecir.
+    """
+    mod_temp, cols_temp, mod_lluvia, cols_lluvia = (joblib.load(r) for r in rutas_modelos(dir_modelos))
+    if compilados:
+        mod_temp, mod_lluvia = compilar(mod_temp), compilar(mod_lluvia)
+    return mod_temp, cols_temp, mod_lluvia, cols_lluvia
+
+
+def predecir_filas(df_filas, modelos):
+    """
+    Predicción en bloque: una llamada por modelo para todas las filas.
+    Entrada: filas del maestro (con features) y la tupla de cargar_modelos().
+    Salida: (temperaturas, probabilidades_lluvia) como arrays.
+    """
+    mod_temp, cols_temp, mod_lluvia, cols_lluvia = modelos
+    # Mismo orden de columnas que en el entreno; si falta alguna se rellena con 0
+    X_temp = matriz_float32(df_filas.reindex(columns=cols_temp, fill_value=0))
+    X_lluvia = matriz_float32(df_filas.reindex(columns=cols_lluvia, fill_value=0))
+    return predecir_temperatura(mod_temp, X_temp), probabilidad_lluvia(mod_lluvia, X_lluvia)
+
+
+def reproducir_historico(df_filas, modelos):
+    """
+    Replay de un rango: predicción vs real para cada día, en una sola pasada.
+    Entrada: filas del maestro (cada una predice el día siguiente).
+    Salida: DataFrame por fecha objetivo con temp_pred/temp_real, prob_lluvia/lluvia_real
+            (el real es NaN en la última fila si mañana aún no ha llegado).
+    """
+    temps, probs = predecir_filas(df_filas, modelos)
+    return pd.DataFrame({
+        "Fecha": pd.to_datetime(df_filas["Fecha"]).to_numpy() + pd.Timedelta(days=1),
+        "temp_pred": temps,
+        "temp_real": df_filas["TARGET_Temp_Manana"].to_numpy(dtype="float64", na_value=float("nan")),
+        "prob_lluvia": probs,
+        "lluvia_real": df_filas["TARGET_Lluvia_Manana"].to_numpy(dtype="float64", na_value=float("nan")),
+    })
+
+
+def metricas_replay(replay, umbral=UMBRAL_LLUVIA):
+    """MAE/RMSE de temperatura, Brier y acierto de lluvia sobre los días con dato real."""
+    r = replay.dropna(subset=["temp_real", "lluvia_real"])
+    if r.empty:
+        return None
+    error = r["temp_pred"] - r["temp_real"]
+    return {
+        "dias": len(r),
+        "mae_temp": float(error.abs().mean()),
+        "rmse_temp": float((error ** 2).mean() ** 0.5),
+        "sesgo_temp": float(error.mean()),
+        "brier_lluvia": float(((r["prob_lluvia"] - r["lluvia_real"]) ** 2).mean()),
+        "acierto_lluvia": float(((r["prob_lluvia"] > umbral) == (r["lluvia_real"] == 1)).mean()),
+    }
+
+
+# -----------------------------------------------------------
+# VERSIÓN DE LOS MODELOS
+# -----------------------------------------------------------
+@lru_cache(maxsize=8)
+def _hash_ficheros(rutas, sellos):
+    # 'sellos' (mtime/tamaño) solo sirve de clave: se re-hashea cuando cambian los .pkl
+    h = hashlib.sha256()
+    for ruta in rutas:
+        with open(ruta, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+    return h.hexdigest()[:12]
+
+
+def version_modelos(dir_modelos=DIR_MODELOS):
+    """Hash corto del contenido de modelos + columnas (igual en cualquier máquina)."""
+    rutas = rutas_modelos(dir_modelos)
+    sellos = tuple((os.stat(r).st_mtime_ns, os.stat(r).st_size) for r in rutas)
+    return _hash_ficheros(rutas, sellos)
+
+
+# -----------------------------------------------------------
+# PREDICCIÓN PUBLICADA (La calcula el pipeline, la lee el dashboard)
+# -----------------------------------------------------------
+def calcular_prediccion_manana(df_maestro, modelos, version_dataset=None, dir_modelos=DIR_MODELOS):
+    """
+    Entrada: maestro con la fila del último día ya con features y la tupla
+             de cargar_modelos(dir_modelos) (la versión se calcula de ese directorio).
+    Salida: registro (dict) listo para publicar.
+    """
+    ultima_fila = df_maestro.iloc[[-1]]
+    temp, prob = predecir_filas(ultima_fila, modelos)
+    fecha_datos = pd.Timestamp(ultima_fila["Fecha"].iloc[0]).date()
+
+    return {
+        "fecha_datos": fecha_datos.isoformat(),
+        "fecha_prediccion": (fecha_datos + timedelta(days=1)).isoformat(),
+        "temp_media_c": round(float(temp[0]), 2),
+        "prob_lluvia": round(float(prob[0]), 4),
+        "es_lluvia": bool(prob[0] > UMBRAL_LLUVIA),
+        "version_modelo": version_modelos(dir_modelos),
+        "version_dataset": version_dataset,
+        "generado": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def publicar_prediccion(registro, ruta=RUTA_PREDICCION):
+    guardar_json_atomico(registro, ruta)
+
+
+def leer_prediccion_publicada(ruta=RUTA_PREDICCION):
+    """El registro publicado o None si el pipeline aún no ha publicado nada."""
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def generar_y_publicar(ruta_maestro="data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv",
+                       dir_modelos=DIR_MODELOS):
+    """Para el pipeline offline: re-publica tras re-entrenar o reconstruir el maestro."""
+    df, version = leer_maestro(ruta_maestro)
+    registro = calcular_prediccion_manana(df.sort_values("Fecha"), cargar_modelos(dir_modelos), version, dir_modelos)
+    publicar_prediccion(registro)
+    print(f" Predicción publicada para {registro['fecha_prediccion']} (modelo {registro['version_modelo']})")
+    return registro
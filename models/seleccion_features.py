@@ -0,0 +1,240 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+import joblib
+from joblib import Parallel, delayed
+from sklearn.metrics import mean_absolute_error, brier_score_loss
+
+from data.almacen_maestro import leer_maestro
+from data.esquema import matriz_float32
+from models.backends import BACKEND_POR_DEFECTO, crear_modelo, separar_X, predecir_temperatura, probabilidad_lluvia
+
+# =================================================================
+# SELECCIÓN DE FEATURES POR IMPORTANCIA (Poda de columnas redundantes)
+# =================================================================
+# 1. Se entrena con el 80% más antiguo y se valida con el 20% más reciente.
+# 2. Importancia por permutación AGRUPADA (en paralelo): los pares
+#    seno/coseno se permutan juntos porque solo tienen sentido a la vez.
+# 3. Los grupos que apenas empeoran el error al permutarlos son candidatos
+#    a borrar. Se reentrena quitando cada vez más candidatos y se queda el
+#    recorte más grande que no empeora el error más de la tolerancia.
+# 4. Con --guardar se escribe la selección y se reentrena el modelo real,
+#    que actualiza columnas_modelo_*.pkl con el conjunto reducido.
+#    La selección guarda también las columnas de las que salió: si el
+#    maestro gana o pierde columnas después, los entrenadores la ignoran
+#    (con aviso) en vez de descartar en silencio las features nuevas.
+
+RUTA_DATASET_MASTER = "data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv"
+RUTAS_SELECCION = {
+    "temperatura": "data/model_memory/columnas_seleccionadas_temperatura.pkl",
+    "lluvia": "data/model_memory/columnas_seleccionadas_lluvia.pkl",
+}
+TARGETS = {"temperatura": "TARGET_Temp_Manana", "lluvia": "TARGET_Lluvia_Manana"}
+
+# Variables que se codifican en varias columnas y no se deben separar
+GRUPOS_INSEPARABLES = [
+    ["Dia_Sin", "Dia_Cos"],
+    ["Viento_Dir_Sin", "Viento_Dir_Cos"],
+]
+
+
+def _error(tarea, modelo, X, y):
+    """Métrica a minimizar: MAE (°C) para temperatura, Brier para lluvia."""
+    if tarea == "temperatura":
+        return mean_absolute_error(y, predecir_temperatura(modelo, X))
+    return brier_score_loss(y, probabilidad_lluvia(modelo, X))
+
+
+def _agrupar(columnas):
+    grupos, usadas = [], set()
+    for grupo in GRUPOS_INSEPARABLES:
+        presentes = [c for c in grupo if c in columnas]
+        if presentes:
+            grupos.append(presentes)
+            usadas.update(presentes)
+    grupos += [[c] for c in columnas if c not in usadas]
+    return grupos
+
+
+def _importancia_grupo(tarea, modelo, X_val, y_val, indices, error_base, n_repeticiones, semilla):
+    rng = np.random.default_rng(semilla)
+    subidas = []
+    for _ in range(n_repeticiones):
+        X_perm = X_val.copy()
+        orden = rng.permutation(len(X_perm))
+        X_perm[:, indices] = X_val[orden][:, indices]  # misma permutación para todo el grupo
+        subidas.append(_error(tarea, modelo, X_perm, y_val) - error_base)
+    return float(np.mean(subidas))
+
+
+def importancia_agrupada(tarea, modelo, X_val, y_val, columnas, n_repeticiones=5, n_jobs=-1):
+    """
+    Salida: DataFrame (grupo, columnas, importancia) ordenado de más a menos.
+    importancia = cuánto sube el error de validación al desordenar el grupo.
+    """
+    if hasattr(modelo, "n_jobs"):
+        modelo.set_params(n_jobs=1)  # El paralelismo va por grupos, no dentro del bosque
+
+    error_base = _error(tarea, modelo, X_val, y_val)
+    grupos = _agrupar(columnas)
+    posicion = {c: i for i, c in enumerate(columnas)}
+
+    importancias = Parallel(n_jobs=n_jobs)(
+        delayed(_importancia_grupo)(
+            tarea, modelo, X_val, y_val, [posicion[c] for c in grupo],
+            error_base, n_repeticiones, semilla,
+        )
+        for semilla, grupo in enumerate(grupos)
+    )
+
+    tabla = pd.DataFrame({
+        "grupo": [" + ".join(g) for g in grupos],
+        "columnas": grupos,
+        "importancia": importancias,
+    })
+    return tabla.sort_values("importancia", ascending=False).reset_index(drop=True), error_base
+
+
+def _evaluar(tarea, backend, X_train, y_train, X_val, y_val):
+    modelo = crear_modelo(tarea, backend)
+    t0 = time.perf_counter()
+    modelo.fit(X_train, y_train)
+    t_fit = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    error = _error(tarea, modelo, X_val, y_val)
+    t_pred = time.perf_counter() - t0
+
+    # Tamaño de los árboles (solo para backends basados en bosques)
+    nodos = sum(e.tree_.node_count for e in getattr(modelo, "estimators_", []))
+    return modelo, error, t_fit, t_pred, nodos
+
+
+def seleccionar_features(tarea, backend=BACKEND_POR_DEFECTO, fraccion_validacion=0.2,
+                         umbral_relativo=0.005, tolerancia=0.01):
+    """
+    Entrada:
+      - umbral_relativo: un grupo es candidato a borrar si su importancia
+        es menor que umbral_relativo * error_base.
+      - tolerancia: empeoramiento relativo máximo del error aceptado.
+    Salida: (columnas_recomendadas, informe DataFrame, importancias DataFrame)
+    """
+    print(f"\n SELECCIÓN DE FEATURES ({tarea}, backend '{backend}')")
+    print("========================================")
+
+    dt, _ = leer_maestro(RUTA_DATASET_MASTER)
+    dt = dt.dropna(subset=[TARGETS[tarea]]).sort_values("Fecha").reset_index(drop=True)
+    X_df = separar_X(dt)
+    columnas = list(X_df.columns)
+    X = matriz_float32(X_df)
+    y = dt[TARGETS[tarea]].to_numpy(dtype=np.float32 if tarea == "temperatura" else np.int8)
+
+    # Fold temporal: pasado para entrenar, futuro para validar
+    corte = int(len(X) * (1 - fraccion_validacion))
+    X_train, X_val, y_train, y_val = X[:corte], X[corte:], y[:corte], y[corte:]
+
+    modelo, error_base, t_fit, t_pred, nodos = _evaluar(tarea, backend, X_train, y_train, X_val, y_val)
+    importancias, _ = importancia_agrupada(tarea, modelo, X_val, y_val, columnas)
+
+    informe = [{
+        "prueba": "todas", "n_features": len(columnas), "error": error_base,
+        "entreno_s": t_fit, "prediccion_s": t_pred, "nodos": nodos,
+    }]
+
+    # Candidatos de menos a más importante
+    candidatos = importancias[importancias["importancia"] < umbral_relativo * error_base]
+    candidatos = candidatos.iloc[::-1]["columnas"].tolist()
+    print(f"   Error base: {error_base:.4f} | Grupos candidatos a borrar: {len(candidatos)}")
+
+    mejor = columnas
+    # Probamos a borrar todos los candidatos, luego la mitad, un cuarto...
+    n = len(candidatos)
+    while n > 0:
+        borrar = {c for grupo in candidatos[:n] for c in grupo}
+        reducidas = [c for c in columnas if c not in borrar]
+        idx = [columnas.index(c) for c in reducidas]
+
+        _, error, t_fit, t_pred, nodos = _evaluar(
+            tarea, backend, X_train[:, idx], y_train, X_val[:, idx], y_val
+        )
+        informe.append({
+            "prueba": f"sin {n} grupos", "n_features": len(reducidas), "error": error,
+            "entreno_s": t_fit, "prediccion_s": t_pred, "nodos": nodos,
+        })
+        if error <= error_base * (1 + tolerancia):
+            mejor = reducidas
+            break
+        n //= 2
+
+    informe = pd.DataFrame(informe)
+    print(f"   Recomendación: {len(mejor)} de {len(columnas)} columnas")
+    return mejor, informe, importancias
+
+
+def guardar_seleccion(tarea, columnas, origen):
+    """
+    La leen los entrenadores: a partir de aquí X solo usa estas columnas.
+    origen: todas las columnas de X sobre las que se hizo la selección.
+    """
+    joblib.dump({"columnas": list(columnas), "origen": list(origen)}, RUTAS_SELECCION[tarea])
+    print(f"   Selección guardada en {RUTAS_SELECCION[tarea]}")
+
+
+def cargar_seleccion(tarea, columnas_actuales=None):
+    """
+    Columnas seleccionadas para la tarea (None si nunca se ha hecho selección).
+    Con columnas_actuales (las de X en el maestro de hoy), una selección hecha
+    sobre otro conjunto de columnas se ignora con un aviso: hay que repetirla.
+    """
+    try:
+        guardada = joblib.load(RUTAS_SELECCION[tarea])
+    except FileNotFoundError:
+        return None
+    if isinstance(guardada, list):
+        guardada = {"columnas": guardada, "origen": None}  # Formato antiguo: sin columnas de origen
+
+    if columnas_actuales is not None:
+        origen, actuales = set(guardada["origen"] or ()), set(columnas_actuales)
+        if origen != actuales:
+            if guardada["origen"] is None:
+                motivo = "no guarda sus columnas de origen (formato antiguo)"
+            else:
+                nuevas, quitadas = sorted(actuales - origen), sorted(origen - actuales)
+                motivo = f"se hizo con otras columnas (nuevas: {nuevas}, quitadas: {quitadas})"
+            print(f"   ⚠️ Selección de features de '{tarea}' ignorada: {motivo}. "
+                  f"Repetir con: python -m models.seleccion_features --tareas {tarea} --guardar")
+            return None
+    return guardada["columnas"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poda de features por importancia agrupada.")
+    parser.add_argument("--tareas", nargs="+", default=["temperatura", "lluvia"], choices=list(TARGETS))
+    parser.add_argument("--backend", default=BACKEND_POR_DEFECTO)
+    parser.add_argument("--umbral", type=float, default=0.005)
+    parser.add_argument("--tolerancia", type=float, default=0.01)
+    parser.add_argument("--guardar", action="store_true",
+                        help="Guarda la selección y reentrena (actualiza columnas_modelo_*.pkl)")
+    args = parser.parse_args()
+
+    with pd.option_context("display.width", 200, "display.max_colwidth", 60):
+        for tarea in args.tareas:
+            cols, informe, importancias = seleccionar_features(
+                tarea, args.backend, umbral_relativo=args.umbral, tolerancia=args.tolerancia
+            )
+            print("\n   Importancia por grupo (subida del error al permutar):")
+            print(importancias[["grupo", "importancia"]].to_string(index=False))
+            print("\n   Compromiso precisión / coste:")
+            print(informe.to_string(index=False, float_format="{:.4f}".format))
+            print(f"\n   Columnas recomendadas: {cols}")
+
+            if args.guardar:
+                guardar_seleccion(tarea, cols, [c for grupo in importancias["columnas"] for c in grupo])
+                # Import tardío: los entrenadores importan este módulo
+                if tarea == "temperatura":
+                    from models.modelo_temperatura import entrenar_modelo_temperatura
+                    entrenar_modelo_temperatura(args.backend)
+                else:
+                    from models.modelo_lluvia import entrenar_modelo_lluvia
+                    entrenar_modelo_lluvia(args.backend)
@@ -0,0 +1,341 @@
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+import tracemalloc
+from datetime import datetime
+
+from data.almacen_maestro import guardar_json_atomico
+
+try:
+    import resource  # Solo Unix
+except ImportError:
+    resource = None
+try:
+    import psutil  # Opcional: RSS en Windows
+except ImportError:
+    psutil = None
+
+# =================================================================
+# PERFIL DE MEMORIA (tracemalloc por etapas, opcional)
+# =================================================================
+# Activar con METEO_PERFIL_MEMORIA=1 (o con este script). Desactivado,
+# perfil() devuelve un perfil nulo: marca() y fin() no hacen nada.
+#   - marca("etapa") cierra la etapa anterior y abre la siguiente. En
+#     cada frontera se toma un snapshot de tracemalloc, y por etapa se
+#     guardan el pico de Python (reset_peak), el RSS, los TOP_N lugares
+#     (fichero:línea) que más memoria han dejado retenida y un
+#     inventario de objetos grandes: DataFrames vivos, bosques de
+#     sklearn y figuras de matplotlib abiertas. El inventario hace falta:
+#     los nodos de los árboles se reservan en C y tracemalloc no los ve.
+#   - fin() escribe data/perfiles_memoria/<nombre>_<fecha>.json. Dos
+#     informes (p.ej. de dos versiones) se comparan con --comparar.
+# tracemalloc hace el código 2-4x más lento: solo para diagnosticar.
+# Importarlo es barato (lo importan los entrenos y el dashboard): nada de
+# sklearn ni de models/ a nivel de módulo.
+# Uso: python perfil_memoria.py --entrenar
+#      METEO_PERFIL_MEMORIA=1 python app_prediccion.py
+#      METEO_PERFIL_MEMORIA=1 streamlit run main.py   (panel en la barra lateral)
+#      python perfil_memoria.py --comparar viejo.json nuevo.json
+
+VARIABLE_ENTORNO = "METEO_PERFIL_MEMORIA"
+DIR_INFORMES = "data/perfiles_memoria"
+TOP_N = 15
+FRAMES = int(os.environ.get("METEO_PERFIL_FRAMES", "1"))  # Profundidad de pila por asignación
+MB = 1024 * 1024
+
+# Asignaciones del propio perfilador y de la maquinaria de import: ruido
+FILTROS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "*perfil_memoria.py"),
+    tracemalloc.Filter(False, "<frozen *>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+# Perfiles con una etapa abierta. Se anidan (pipeline -> entreno) y el
+# pico de tracemalloc es global: antes de cada reset_peak se apunta en todos.
+_ABIERTOS = []
+# tracemalloc es de todo el proceso y el dashboard ejecuta cada sesión en
+# su hilo: el candado protege _ABIERTOS y el arranque/parada. Se para
+# cuando termina el último perfil vivo (no quien lo arrancó), así que una
+# sesión no corta el trazado a otra que está a mitad de etapa.
+_CANDADO = threading.RLock()
+_VIVOS = 0
+_ARRANCADO = False  # Lo arrancó un perfil (si venía de fuera, p.ej. -X tracemalloc, no se para)
+
+
+def _reiniciar_pico():
+    pico = tracemalloc.get_traced_memory()[1]
+    for abierto in _ABIERTOS:
+        abierto._pico = max(abierto._pico, pico)
+    tracemalloc.reset_peak()
+
+
+def rss_actual_mb():
+    """RSS del proceso ahora mismo (Linux: /proc/self/statm; si no, psutil)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MB
+    except OSError:
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / MB
+    return pico_rss_mb()
+
+
+def pico_rss_mb():
+    """
+    Pico de RSS del proceso desde que arrancó (ru_maxrss: KB en Linux,
+    bytes en macOS; en Windows, peak_wset de psutil). NaN si no hay forma de medirlo.
+    """
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / MB if sys.platform == "darwin" else pico / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / MB
+    return float("nan")
+
+
+class PicoRSS:
+    """
+    Pico de RSS de un tramo (with PicoRSS() as pico: ...; pico.mb), no de
+    todo el proceso como pico_rss_mb(). En Linux se reinicia la marca del
+    kernel (VmHWM, escribiendo 5 en /proc/self/clear_refs) y se lee al
+    salir: exacto y sin coste. Si no se puede, un hilo muestrea
+    rss_actual_mb() cada 'intervalo' segundos (puede perder picos muy breves).
+    """
+
+    def __init__(self, intervalo=0.01):
+        self.intervalo = intervalo
+        self.mb = float("nan")
+        self._hilo = None
+
+    @staticmethod
+    def _vm_hwm_mb():
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith("VmHWM:"):
+                    return int(linea.split()[1]) / 1024
+        raise OSError("VmHWM no disponible")
+
+    def _muestrear(self):
+        while not self._parar.wait(self.intervalo):
+            self.mb = max(self.mb, rss_actual_mb())
+
+    def __enter__(self):
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            self._vm_hwm_mb()
+            return self
+        except OSError:
+            pass
+        self.mb = rss_actual_mb()
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._hilo is None:
+            self.mb = self._vm_hwm_mb()
+        else:
+            self._parar.set()
+            self._hilo.join()
+            self.mb = max(self.mb, rss_actual_mb())
+        return False
+
+
+def activo():
+    return os.environ.get(VARIABLE_ENTORNO, "") not in ("", "0")
+
+
+def inventario_objetos():
+    """MB aproximados de los objetos que suelen explicar el RSS (recorre gc: solo en modo perfil)."""
+    # Solo los tipos de módulos ya importados: si no se han importado, no hay objetos suyos
+    pd = sys.modules.get("pandas")
+    ensemble = sys.modules.get("sklearn.ensemble")
+    compilada = sys.modules.get("models.inferencia_compilada")
+    dataframes, mb_dataframes, bosques, mb_bosques = 0, 0.0, 0, 0.0
+    for obj in gc.get_objects():
+        if pd is not None and isinstance(obj, pd.DataFrame):
+            dataframes += 1
+            mb_dataframes += obj.memory_usage(index=True, deep=False).sum() / MB
+        elif ensemble is not None and isinstance(obj, ensemble.BaseEnsemble):
+            arboles = [e.tree_ for e in getattr(obj, "estimators_", []) if hasattr(e, "tree_")]
+            if arboles:
+                bosques += 1
+                # Nodo de sklearn = 64 bytes + valores (salidas x clases x 8)
+                mb_bosques += sum(t.node_count * (64 + t.n_outputs * t.max_n_classes * 8) for t in arboles) / MB
+        elif compilada is not None and isinstance(obj, compilada.BosqueCompilado):
+            bosques += 1
+            mb_bosques += sum(a.nbytes for a in (obj.izquierda, obj.derecha, obj.feature,
+                                                 obj.umbral, obj.nan_izquierda, obj.valor)) / MB
+    plt = sys.modules.get("matplotlib.pyplot")
+    return {
+        "dataframes": dataframes, "dataframes_mb": round(mb_dataframes, 2),
+        "bosques": bosques, "bosques_mb": round(mb_bosques, 2),
+        "figuras_abiertas": len(plt.get_fignums()) if plt is not None else 0,
+    }
+
+
+def _lugar(fichero):
+    """Ruta corta: relativa al proyecto o desde site-packages."""
+    if "site-packages" in fichero:
+        return fichero.split("site-packages" + os.sep, 1)[-1]
+    ruta = os.path.relpath(fichero)
+    return fichero if ruta.startswith("..") else ruta
+
+
+def _top(despues, antes, top):
+    diferencias = despues.compare_to(antes, "traceback" if FRAMES > 1 else "lineno")
+    return [{
+        "lugar": " <- ".join(f"{_lugar(f.filename)}:{f.lineno}" for f in d.traceback),
+        "retenido_kb": round(d.size_diff / 1024, 1),
+        "total_kb": round(d.size / 1024, 1),
+        "bloques": d.count_diff,
+    } for d in sorted(diferencias, key=lambda d: d.size_diff, reverse=True)[:top] if d.size_diff > 0]
+
+
+class PerfilMemoria:
+    """Etapas consecutivas de un proceso (entreno, pipeline, una ejecución del dashboard)."""
+
+    def __init__(self, nombre, top=TOP_N):
+        global _VIVOS, _ARRANCADO
+        with _CANDADO:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(FRAMES)
+                _ARRANCADO = True
+            _VIVOS += 1
+        self._vivo = True
+        self.nombre = nombre
+        self.top = top
+        self.inicio = datetime.now()
+        self.etapas = []
+        self._abierta = None
+        self._pico = 0
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(FILTROS)
+
+    def marca(self, etapa):
+        """Frontera entre etapas: cierra la anterior (si hay) y abre 'etapa'."""
+        with _CANDADO:
+            self._cerrar()
+            _reiniciar_pico()
+            self._pico = 0
+            self._abierta = (etapa, time.perf_counter(), self._snapshot(), tracemalloc.get_traced_memory()[0])
+            _ABIERTOS.append(self)
+
+    def _cerrar(self):
+        if self._abierta is None:
+            return
+        with _CANDADO:
+            etapa, t0, antes, actual_antes = self._abierta
+            _ABIERTOS.remove(self)
+            actual, pico = tracemalloc.get_traced_memory()
+            pico = max(pico, self._pico)
+            self.etapas.append({
+                "etapa": etapa,
+                "segundos": round(time.perf_counter() - t0, 3),
+                "python_pico_mb": round(pico / MB, 2),
+                "python_retenido_mb": round((actual - actual_antes) / MB, 2),
+                "python_actual_mb": round(actual / MB, 2),
+                "rss_mb": round(rss_actual_mb(), 1),
+                "objetos": inventario_objetos(),
+                "top": _top(self._snapshot(), antes, self.top),
+            })
+            self._abierta = None
+
+    def informe(self):
+        """Cierra la última etapa (y tracemalloc, si es el último perfil vivo) y devuelve el informe."""
+        global _VIVOS, _ARRANCADO
+        with _CANDADO:
+            self._cerrar()
+            if self._vivo:
+                self._vivo = False
+                _VIVOS -= 1
+                if _VIVOS == 0 and _ARRANCADO and tracemalloc.is_tracing():
+                    tracemalloc.stop()
+                    _ARRANCADO = False
+        return {
+            "nombre": self.nombre,
+            "fecha": self.inicio.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pico_rss_mb": round(pico_rss_mb(), 1),
+            "etapas": self.etapas,
+        }
+
+    def fin(self, dir_informes=DIR_INFORMES, ruta=None):
+        """Cierra la última etapa, escribe el informe JSON y devuelve su ruta."""
+        datos = self.informe()
+        ruta = ruta or os.path.join(dir_informes, f"{self.nombre}_{self.inicio:%Y%m%d_%H%M%S}.json")
+        guardar_json_atomico(datos, ruta)
+        print(f" 🧠 Perfil de memoria: {ruta} (pico RSS {datos['pico_rss_mb']:.0f} MB)")
+        return ruta
+
+
+class PerfilNulo:
+    """Lo que devuelve perfil() con el modo desactivado: no mide nada."""
+
+    def marca(self, etapa):
+        pass
+
+    def informe(self):
+        return None
+
+    def fin(self, dir_informes=DIR_INFORMES, ruta=None):
+        return None
+
+
+def perfil(nombre):
+    return PerfilMemoria(nombre) if activo() else PerfilNulo()
+
+
+# -----------------------------------------------------------
+# COMPARACIÓN ENTRE VERSIONES
+# -----------------------------------------------------------
+def comparar(ruta_a, ruta_b):
+    """Tabla por etapa con pico de Python y RSS de los dos informes."""
+    import pandas as pd
+
+    def cargar(ruta):
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        return pd.DataFrame([{k: e[k] for k in ("etapa", "segundos", "python_pico_mb", "rss_mb")}
+                             for e in datos["etapas"]]).set_index("etapa")
+
+    a, b = cargar(ruta_a), cargar(ruta_b)
+    tabla = pd.concat([a.add_suffix("_a"), b.add_suffix("_b")], axis=1)  # Orden de etapas de 'a
+    tabla["pico_dif_mb"] = tabla["python_pico_mb_b"] - tabla["python_pico_mb_a"]
+    tabla["rss_dif_mb"] = tabla["rss_mb_b"] - tabla["rss_mb_a"]
+    return tabla
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perfil de memoria por etapas (tracemalloc).")
+    parser.add_argument("--entrenar", action="store_true", help="Perfilar entrenar_modelo_temperatura/lluvia")
+    parser.add_argument("--pipeline", action="store_true", help="Perfilar pipeline_mantenimiento (hace scraping)")
+    parser.add_argument("--comparar", nargs=2, metavar=("VIEJO", "NUEVO"), help="Comparar dos informes")
+    args = parser.parse_args()
+
+    if args.comparar:
+        print(comparar(*args.comparar).round(2).to_string())
+    else:
+        os.environ[VARIABLE_ENTORNO] = "1"
+        if args.entrenar:
+            from models.modelo_temperatura import entrenar_modelo_temperatura
+            from models.modelo_lluvia import entrenar_modelo_lluvia
+            entrenar_modelo_temperatura()
+            entrenar_modelo_lluvia()
+        if args.pipeline:
+            from app_prediccion import pipeline_mantenimiento
+            pipeline_mantenimiento()
+        if not (args.entrenar or args.pipeline):
+            parser.print_help()
@@ -0,0 +1,262 @@
+import os
+import json
+import hashlib
+import argparse
+import importlib
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# =================================================================
+# PIPELINE OFFLINE (Reconstrucción completa como grafo de etapas)
+# =================================================================
+# Sustituye a lanzar a mano extracción -> limpieza -> fusión -> entrenos.
+#   - Cada etapa declara sus entradas, salidas, código y dependencias.
+#   - Huella = SHA-256 de (código + entradas + parámetros). Si coincide
+#     con la de la última ejecución y las salidas existen, se salta.
+#   - Las ramas independientes (limpieza por estación, los dos entrenos)
+#     se ejecutan en paralelo en un pool de procesos.
+# Uso: python pipeline_offline.py [--extraer] [--forzar] [--solo etapa ...]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RUTA_ESTADO_ETAPAS = os.path.join("data", "estado_etapas.json")
+ESTACIONES_ID = ["D5", "X4", "X8"]
+
+RUTA_MAESTRO = "data/training_datasets/dataset_entrenamiento_barcelona_MASTER.csv"
+CODIGO_COMUN = ["data/esquema.py", "data/almacen_maestro.py"]
+# Todo lo que importan los entrenadores (y la climatología de la que sale su referencia)
+CODIGO_ENTRENO = CODIGO_COMUN + ["models/backends.py", "models/seleccion_features.py",
+                                 "data/climatologia.py", "perfil_memoria.py"]
+
+
+def _raw(estacion):
+    return f"data/estaciones/raw/{estacion}"
+
+
+def _clean(estacion):
+    return f"data/estaciones/clean/{estacion}"
+
+
+def definir_etapas(extraer=False):
+    """
+    Salida: dict nombre -> etapa. Una etapa es un dict con:
+      modulo/funcion/args (lo que se ejecuta), entradas, salidas,
+      codigo (ficheros .py de los que depende), depende (otras etapas)
+      y params (valores que también forman parte de la huella).
+    """
+    etapas = {}
+
+    for est in ESTACIONES_ID:
+        if extraer:
+            # La fecha de fin cambia cada día: la extracción solo se repite una vez al día
+            ayer = (datetime.now().date() - timedelta(days=1)).isoformat()
+            etapas[f"extraer_{est}"] = {
+                "modulo": "data.dataset_extraction", "funcion": "extraer_estacion",
+                "args": [est], "entradas": [], "salidas": [_raw(est)],
+                "codigo": ["data/dataset_extraction.py", "data/almacen_estaciones.py"], "depende": [],
+                "params": {"estacion": est, "fecha_fin": ayer},
+            }
+
+        etapas[f"limpiar_{est}"] = {
+            "modulo": "data.dataset_cleaning", "funcion": "limpiar_estacion",
+            "args": [est],
+            "entradas": [_raw(est)], "salidas": [_clean(est), f"data/climatologia/{est}.npz"],
+            "codigo": CODIGO_COMUN + ["data/almacen_estaciones.py", "data/climatologia.py", "data/dataset_cleaning.py"],
+            "depende": [f"extraer_{est}"] if extraer else [],
+        }
+
+    etapas["maestro"] = {
+        "modulo": "data.global_feature_engineering", "funcion": "construir_dataset_maestro",
+        "args": [ESTACIONES_ID],
+        "entradas": [_clean(est) for est in ESTACIONES_ID] + ["data/espec_ventanas.json"],
+        "salidas": [RUTA_MAESTRO, "data/training_datasets/origen_maestro.json", "data/climatologia/barcelona.npz"],
+        "codigo": CODIGO_COMUN + ["data/almacen_estaciones.py", "data/climatologia.py",
+                                  "data/features_ventana.py", "data/global_feature_engineering.py"],
+        "depende": [f"limpiar_{est}" for est in ESTACIONES_ID],
+    }
+
+    for tarea in ("temperatura", "lluvia"):
+        etapas[f"entrenar_{tarea}"] = {
+            "modulo": f"models.modelo_{tarea}", "funcion": f"entrenar_modelo_{tarea}",
+            "args": [],
+            # La selección de features es opcional: si existe, cuenta como entrada
+            "entradas": [RUTA_MAESTRO, f"data/model_memory/columnas_seleccionadas_{tarea}.pkl"],
+            "salidas": [
+                f"data/model_memory/cerebro_meteo_{tarea}.pkl",
+                f"data/model_memory/columnas_modelo_{tarea}.pkl",
+            ],
+            "codigo": CODIGO_ENTRENO + [f"models/modelo_{tarea}.py"],
+            "depende": ["maestro"],
+        }
+
+    # La predicción de mañana se publica con el maestro y los modelos definitivos
+    modelos = [f"data/model_memory/{p}_{t}.pkl" for t in ("temperatura", "lluvia")
+               for p in ("cerebro_meteo", "columnas_modelo")]
+    etapas["publicar_prediccion"] = {
+        "modulo": "models.prediccion", "funcion": "generar_y_publicar",
+        "args": [], "entradas": [RUTA_MAESTRO] + modelos,
+        "salidas": ["data/model_memory/prediccion_manana.json"],
+        "codigo": CODIGO_ENTRENO + ["models/prediccion.py", "models/inferencia_compilada.py"],
+        "depende": ["entrenar_temperatura", "entrenar_lluvia"],
+    }
+
+    etapas["indice_analogos"] = {
+        "modulo": "models.indice_analogos", "funcion": "construir_y_guardar",
+        "args": [], "entradas": [RUTA_MAESTRO],
+        "salidas": ["data/model_memory/indice_analogos.pkl"],
+        "codigo": CODIGO_COMUN + ["models/indice_analogos.py"],
+        "depende": ["maestro"],
+    }
+
+    return etapas
+
+
+# -----------------------------------------------------------
+# HUELLAS (Fingerprints)
+# -----------------------------------------------------------
+def _hash_fichero(h, ruta):
+    h.update(ruta.encode())
+    if os.path.isdir(ruta):
+        # Carpeta de particiones (almacén de estaciones): todos sus ficheros
+        for nombre in sorted(os.listdir(ruta)):
+            if not nombre.startswith("."):
+                _hash_fichero(h, os.path.join(ruta, nombre))
+        return
+    if not os.path.exists(ruta):
+        h.update(b"<no existe>")
+        return
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+
+
+def calcular_huella(etapa):
+    h = hashlib.sha256()
+    for ruta in sorted(etapa["codigo"]) + list(etapa["entradas"]):
+        _hash_fichero(h, ruta)
+    h.update(json.dumps([etapa["funcion"], etapa.get("params", {})], sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def cargar_estado_etapas():
+    if not os.path.exists(RUTA_ESTADO_ETAPAS):
+        return {}
+    with open(RUTA_ESTADO_ETAPAS, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def guardar_estado_etapas(estado):
+    ruta_tmp = RUTA_ESTADO_ETAPAS + ".tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f, indent=2, sort_keys=True)
+    os.replace(ruta_tmp, RUTA_ESTADO_ETAPAS)
+
+
+def _ejecutar_etapa(modulo, funcion, args):
+    """Se ejecuta en el proceso hijo. No devuelve nada (los modelos pesan mucho para el pickle)."""
+    getattr(importlib.import_module(modulo), funcion)(*args)
+
+
+def _incluir_dependencias(etapas, seleccion):
+    """Las etapas pedidas con --solo y todo lo que tienen aguas arriba."""
+    pendientes, incluidas = list(seleccion), set()
+    while pendientes:
+        nombre = pendientes.pop()
+        if nombre in incluidas:
+            continue
+        incluidas.add(nombre)
+        pendientes += [d for d in etapas[nombre]["depende"] if d in etapas]
+    return {n: e for n, e in etapas.items() if n in incluidas}
+
+
+# -----------------------------------------------------------
+# PLANIFICADOR
+# -----------------------------------------------------------
+def ejecutar_pipeline(etapas, forzar=False, trabajadores=None):
+    """
+    Ejecuta el grafo respetando dependencias. Cada etapa se evalúa cuando
+    sus dependencias han terminado (sus entradas ya son las definitivas).
+    Salida: dict nombre -> 'al día' | 'ejecutada' | 'fallida' | 'saltada'
+    """
+    estado = cargar_estado_etapas()
+    resultado = {}
+    pendientes = dict(etapas)
+    en_curso = {}
+    t_inicio = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+        while pendientes or en_curso:
+            hubo_cambios = False
+
+            for nombre, etapa in list(pendientes.items()):
+                deps = [d for d in etapa["depende"] if d in etapas]
+                if any(resultado.get(d) in ("fallida", "saltada") for d in deps):
+                    resultado[nombre] = "saltada"
+                    print(f" [SALTADA]   {nombre} (falló una dependencia)")
+                    del pendientes[nombre]
+                    hubo_cambios = True
+                    continue
+                if not all(resultado.get(d) in ("al día", "ejecutada") for d in deps):
+                    continue
+
+                del pendientes[nombre]
+                hubo_cambios = True
+                huella = calcular_huella(etapa)
+                salidas_ok = all(os.path.exists(s) for s in etapa["salidas"])
+
+                if not forzar and salidas_ok and estado.get(nombre) == huella:
+                    resultado[nombre] = "al día"
+                    print(f" [AL DÍA]    {nombre}")
+                    continue
+
+                print(f" [LANZANDO]  {nombre}")
+                futuro = pool.submit(_ejecutar_etapa, etapa["modulo"], etapa["funcion"], etapa["args"])
+                en_curso[futuro] = (nombre, time.perf_counter())
+
+            if hubo_cambios and not en_curso:
+                continue  # Puede haber etapas nuevas listas sin lanzar nada
+            if not en_curso:
+                break
+
+            terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                nombre, t0 = en_curso.pop(futuro)
+                try:
+                    futuro.result()
+                except Exception as e:
+                    resultado[nombre] = "fallida"
+                    print(f" [FALLIDA]   {nombre}: {e}")
+                    continue
+                # Huella DESPUÉS de ejecutar: si la etapa reescribe sus entradas, manda lo último
+                estado[nombre] = calcular_huella(etapas[nombre])
+                guardar_estado_etapas(estado)
+                resultado[nombre] = "ejecutada"
+                print(f" [HECHA]     {nombre} ({time.perf_counter() - t0:.1f} s)")
+
+    print(f"\n Pipeline terminado en {time.perf_counter() - t_inicio:.1f} s")
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstrucción offline: extracción -> limpieza -> maestro -> entrenos.")
+    parser.add_argument("--extraer", action="store_true", help="Incluye la descarga desde Meteocat (red)")
+    parser.add_argument("--forzar", action="store_true", help="Ignora las huellas y lo ejecuta todo")
+    parser.add_argument("--solo", nargs="+", default=None, help="Etapas a ejecutar (más sus dependencias)")
+    parser.add_argument("--trabajadores", type=int, default=None, help="Procesos en paralelo")
+    args = parser.parse_args()
+
+    # Las rutas de los entrenadores son relativas a la raíz del proyecto
+    os.chdir(HERE)
+
+    etapas = definir_etapas(extraer=args.extraer)
+    if args.solo:
+        desconocidas = set(args.solo) - set(etapas)
+        if desconocidas:
+            parser.error(f"Etapas desconocidas: {sorted(desconocidas)}. Disponibles: {sorted(etapas)}")
+        etapas = _incluir_dependencias(etapas, args.solo)
+
+    print(" PIPELINE OFFLINE")
+    print("========================================")
+    resultado = ejecutar_pipeline(etapas, forzar=args.forzar, trabajadores=args.trabajadores)
+    if "fallida" in resultado.values():
+        raise SystemExit(1)
@@ -0,0 +1,165 @@
+import os
+import io
+import argparse
+import tempfile
+import time
+import contextlib
+from datetime import date, timedelta
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import requests
+
+os.environ.setdefault("TQDM_DISABLE", "1")  # Sin barras de progreso por estación
+
+from data import almacen_estaciones, climatologia, dataset_extraction, scraper_prediccion, global_feature_engineering
+from data.dataset_cleaning import limpiar_estacion
+from data.xema_simulado import arrancar_en_segundo_plano
+
+# =================================================================
+# PRUEBA DE CARGA DE LA INGESTA (Contra el servidor XEMA simulado)
+# =================================================================
+# Mide, para 10-100x las estaciones actuales (3):
+#   1. Ingesta diaria: obtener_media_barcelona() con N estaciones (lo que
+#      hace app_prediccion.py cada día).
+#   2. Extracción histórica: extraer_estacion() de N estaciones x D días
+#      en paralelo -> páginas/s.
+#   3. Coste de parseo: parsear_resumen() aislado (sin red), ms/página.
+#   4. Pipeline completo: extracción -> limpieza -> fusión del maestro.
+# Todo se escribe en una carpeta temporal: no toca data/ ni meteo.cat.
+# Uso: python prueba_carga.py --escalas 30 300 --dias 30 --latencia-ms 50
+
+ESTACIONES_ACTUALES = 3
+
+
+def _estaciones(n):
+    return [f"S{i:04d}" for i in range(n)]
+
+
+@contextlib.contextmanager
+def _almacen_temporal():
+    """Redirige el almacén de estaciones, las climatologías y el maestro a una carpeta temporal."""
+    previos = (almacen_estaciones.DIR_ESTACIONES, climatologia.DIR_CLIMATOLOGIA, global_feature_engineering.ARCHIVO_ORIGEN)
+    with tempfile.TemporaryDirectory(prefix="prueba_carga_") as carpeta:
+        almacen_estaciones.DIR_ESTACIONES = Path(carpeta) / "estaciones"
+        climatologia.DIR_CLIMATOLOGIA = Path(carpeta) / "climatologia"
+        global_feature_engineering.ARCHIVO_ORIGEN = Path(carpeta) / "origen_maestro.json"
+        try:
+            yield Path(carpeta)
+        finally:
+            (almacen_estaciones.DIR_ESTACIONES, climatologia.DIR_CLIMATOLOGIA,
+             global_feature_engineering.ARCHIVO_ORIGEN) = previos
+
+
+def _apuntar_a(url_base):
+    # Ambos módulos leen la URL de su constante: se sustituye en los dos
+    scraper_prediccion.URL_BASE = url_base
+    dataset_extraction.URL_BASE = url_base
+    dataset_extraction.TIEMPO_ESPERA = 0  # La pausa de cortesía no aplica al servidor local
+
+
+def medir_parseo(url_base, muestras=200):
+    """ms por página de parsear_resumen(), con las páginas ya descargadas."""
+    hoy = date.today()
+    respuestas = [
+        requests.get(f"{url_base}codi=S{i % 50:04d}&dia={hoy - timedelta(days=i)}T00:00Z", timeout=10)
+        for i in range(muestras)
+    ]
+    paginas = [r.text for r in respuestas if r.status_code == 200]
+    tiempos = []
+    for html in paginas:
+        t0 = time.perf_counter()
+        scraper_prediccion.parsear_resumen(html)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return np.percentile(tiempos, 50), np.percentile(tiempos, 99)
+
+
+def medir_escala(n_estaciones, dias, hilos):
+    """Una fila de resultados para N estaciones."""
+    estaciones = _estaciones(n_estaciones)
+    fin = date.today() - timedelta(days=1)
+    inicio = fin - timedelta(days=dias - 1)
+    fila = {"estaciones": n_estaciones, "x_actual": n_estaciones / ESTACIONES_ACTUALES, "dias": dias}
+
+    with _almacen_temporal() as carpeta, contextlib.redirect_stdout(io.StringIO()):
+        # 1. Ingesta diaria (secuencial, como en app_prediccion.py)
+        t0 = time.perf_counter()
+        scraper_prediccion.obtener_media_barcelona(fin.isoformat(), estaciones)
+        fila["ingesta_diaria_s"] = time.perf_counter() - t0
+
+        # 2. Extracción histórica en paralelo (una estación por hilo)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            list(pool.map(lambda est: dataset_extraction.extraer_estacion(est, inicio, fin), estaciones))
+        t_extraccion = time.perf_counter() - t0
+        fila["extraccion_s"] = t_extraccion
+        fila["paginas_s"] = n_estaciones * dias / t_extraccion
+
+        # 3. Limpieza (incremental desde cero = completa) y fusión
+        t0 = time.perf_counter()
+        for est in estaciones:
+            limpiar_estacion(est)
+        fila["limpieza_s"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        global_feature_engineering.construir_dataset_maestro(estaciones, ruta_salida=carpeta / "maestro.csv")
+        fila["fusion_s"] = time.perf_counter() - t0
+
+        filas_raw = sum(len(almacen_estaciones.leer_estacion("raw", est, columnas=[])) for est in estaciones)
+    fila["filas_raw"] = filas_raw
+    fila["pipeline_total_s"] = fila["extraccion_s"] + fila["limpieza_s"] + fila["fusion_s"]
+    return fila
+
+
+def prueba_carga(escalas=(30, 300), dias=30, hilos=16, latencia_ms=0.0, jitter_ms=0.0,
+                 prob_error=0.0, prob_sense_dades=0.0, prob_sin_tabla=0.0):
+    """
+    Arranca el servidor simulado en segundo plano y mide cada escala.
+    Salida: DataFrame con una fila por número de estaciones.
+    """
+    servidor, url_base = arrancar_en_segundo_plano(
+        puerto=0, latencia_ms=latencia_ms, jitter_ms=jitter_ms, prob_error=prob_error,
+        prob_sense_dades=prob_sense_dades, prob_sin_tabla=prob_sin_tabla,
+    )
+    _apuntar_a(url_base)
+    print(f" Servidor simulado en {url_base}")
+
+    try:
+        p50, p99 = medir_parseo(url_base)
+        print(f" Parseo aislado: p50 {p50:.2f} ms | p99 {p99:.2f} ms por página")
+
+        resultados = []
+        for n in escalas:
+            print(f" Midiendo {n} estaciones x {dias} días ({n / ESTACIONES_ACTUALES:.0f}x)...")
+            fila = medir_escala(n, dias, hilos)
+            fila["parseo_p50_ms"], fila["parseo_p99_ms"] = p50, p99
+            resultados.append(fila)
+    finally:
+        servidor.shutdown()
+
+    return pd.DataFrame(resultados)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga de la ingesta contra el servidor XEMA simulado.")
+    parser.add_argument("--escalas", nargs="+", type=int, default=[30, 300], help="Números de estaciones a probar")
+    parser.add_argument("--dias", type=int, default=30, help="Días de histórico por estación")
+    parser.add_argument("--hilos", type=int, default=16, help="Descargas en paralelo en la extracción")
+    parser.add_argument("--latencia-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--prob-error", type=float, default=0.0)
+    parser.add_argument("--prob-sense-dades", type=float, default=0.0)
+    parser.add_argument("--prob-sin-tabla", type=float, default=0.0)
+    parser.add_argument("--salida", default=None, help="CSV donde guardar la tabla")
+    args = parser.parse_args()
+
+    tabla = prueba_carga(
+        args.escalas, args.dias, args.hilos, args.latencia_ms, args.jitter_ms,
+        args.prob_error, args.prob_sense_dades, args.prob_sin_tabla,
+    )
+    print("\n RESULTADOS")
+    print("========================================")
+    print(tabla.round(3).to_string(index=False))
+    if args.salida:
+        tabla.to_csv(args.salida, index=False)
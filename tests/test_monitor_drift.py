@@ -0,0 +1,63 @@
+import unittest
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from models import monitor_drift as md
+
+# Uso: python -m unittest discover -s tests
+
+
+class TestDecidirReentreno(unittest.TestCase):
+    def _estado(self):
+        estado = md._estado_vacio()
+        estado["ultimo_reentreno"] = "2026-08-15"
+        # Agosto: 25 °C de media; octubre: 19 °C
+        estado["referencia_mensual"] = {"Temp_Media_C": {
+            "8": {"media": 25.0, "std": 2.0},
+            "10": {"media": 19.0, "std": 2.0},
+        }}
+        estado["ewma"] = {"Temp_Media_C": 25.5}
+        estado["dias_ewma"] = md.MIN_DIAS_EWMA
+        estado["ultima_fecha_ewma"] = "2026-08-22"
+        return estado
+
+    def test_drift_con_el_mes_del_ultimo_dato_ingerido(self):
+        # El maestro llega al 22 de agosto y hoy es 19 de octubre: un agosto
+        # normal no es drift aunque esté lejos de la referencia de octubre
+        reentrenar, motivos = md.decidir_reentreno(self._estado(), hoy=date(2026, 8, 25))
+        self.assertFalse(reentrenar, motivos)
+        reentrenar, motivos = md.decidir_reentreno(self._estado(), hoy=date(2026, 10, 19))
+        self.assertFalse(any("drift" in m for m in motivos), motivos)
+
+    def test_drift_real_en_el_mes_ingerido(self):
+        estado = self._estado()
+        estado["ewma"]["Temp_Media_C"] = 30.0
+        reentrenar, motivos = md.decidir_reentreno(estado, hoy=date(2026, 8, 25))
+        self.assertTrue(reentrenar)
+        self.assertTrue(any("drift en Temp_Media_C" in m for m in motivos), motivos)
+
+
+class TestEscalaDrift(unittest.TestCase):
+    def test_std_de_la_ewma(self):
+        # Días independientes: std·sqrt(α/(2-α)), mucho menor que la de un día suelto
+        alpha = md.ALPHA_EWMA
+        self.assertAlmostEqual(md.std_ewma(2.0), 2.0 * (alpha / (2 - alpha)) ** 0.5)
+        # Con días correlados la EWMA varía más: el mismo desvío pesa menos
+        self.assertGreater(md.std_ewma(2.0, rho=0.8), md.std_ewma(2.0))
+
+    def test_referencia_con_autocorrelacion(self):
+        fechas = pd.date_range("2020-01-01", "2023-12-31", freq="D")
+        ruido = np.random.default_rng(0).normal(size=len(fechas))
+        serie = np.zeros(len(fechas))
+        for i in range(1, len(fechas)):  # AR(1) con rho = 0.8
+            serie[i] = 0.8 * serie[i - 1] + ruido[i]
+        estado = md._estado_vacio()
+        md.marcar_reentreno(estado, pd.DataFrame({"Fecha": fechas, "Temp_Media_C": serie}))
+        rho = estado["referencia_mensual"]["Temp_Media_C"]["6"]["rho"]
+        self.assertAlmostEqual(rho, 0.8, delta=0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
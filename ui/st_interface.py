@@ -1,10 +1,19 @@
 import streamlit as st
 import pandas as pd
-import joblib
 import os
+import uuid
 import seaborn as sns
 import matplotlib.pyplot as plt
 from datetime import timedelta
+from data.almacen_maestro import leer_maestro, version_maestro
+from models.prediccion import (
+    leer_prediccion_publicada, modelos_disponibles, version_modelos,
+    cargar_modelos, reproducir_historico, metricas_replay,
+)
+from models.indice_analogos import cargar_indice
+from data.climatologia import Climatologia
+from data.almacen_maestro import guardar_json_atomico
+from perfil_memoria import perfil, DIR_INFORMES
 
 # --- CONFIGURACIÓN DE PÁGINA ---
 st.set_page_config(
@@ -19,116 +28,250 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__)) # Carpeta src/
 ROOT_DIR = os.path.dirname(BASE_DIR) # Carpeta proyecto/
 
 RUTA_DATASET = os.path.join(ROOT_DIR, "data", "training_datasets", "dataset_entrenamiento_barcelona_MASTER.csv")
-RUTA_MODELO_TEMP = os.path.join(ROOT_DIR, "data", "model_memory", "cerebro_meteo_temperatura.pkl")
-RUTA_COLS_TEMP = os.path.join(ROOT_DIR, "data", "model_memory", "columnas_modelo_temperatura.pkl")
-RUTA_MODELO_LLUVIA = os.path.join(ROOT_DIR, "data", "model_memory", "cerebro_meteo_lluvia.pkl")
-RUTA_COLS_LLUVIA = os.path.join(ROOT_DIR, "data", "model_memory", "columnas_modelo_lluvia.pkl")
+DIR_MODELOS = os.path.join(ROOT_DIR, "data", "model_memory")
+RUTA_PREDICCION = os.path.join(DIR_MODELOS, "prediccion_manana.json")
+RUTA_INDICE = os.path.join(DIR_MODELOS, "indice_analogos.pkl")
 
 # --- FUNCIONES DE CARGA (Con Caché para velocidad) ---
-@st.cache_data
-def cargar_datos():
-    if not os.path.exists(RUTA_DATASET):
-        return None
-    df = pd.read_csv(RUTA_DATASET)
-    df['Fecha'] = pd.to_datetime(df['Fecha'])
+# Reintentos si el pipeline publica un snapshot justo entre el stat() y la lectura
+MAX_REINTENTOS_SNAPSHOT = 3
+
+class _SnapshotCambiado(Exception):
+    """El fichero leído no es la versión pedida (no se cachea: las excepciones no se guardan)."""
+    def __init__(self, version_leida):
+        super().__init__(version_leida)
+        self.version_leida = version_leida
+
+def snapshot_actual():
+    """Salida: (DataFrame, versión) del maestro actual, o (None, None) si no existe."""
+    # stat() barato: la caché solo se invalida cuando el pipeline publica un snapshot nuevo
+    version = version_maestro(RUTA_DATASET)
+    for _ in range(MAX_REINTENTOS_SNAPSHOT):
+        if version is None:
+            return None, None
+        try:
+            return _cargar_snapshot(version), version
+        except _SnapshotCambiado as e:
+            version = e.version_leida  # Se vuelve a pedir con la versión que hay ahora
+    raise RuntimeError("El dataset maestro cambia continuamente: no se ha podido leer un snapshot estable")
+
+@st.cache_data(max_entries=2)
+def _cargar_snapshot(version):
+    # 'version' es la clave de caché: si el fichero leído ya es otro, no se guarda con esta clave
+    df, version_leida = leer_maestro(RUTA_DATASET)
+    if version_leida != version:
+        raise _SnapshotCambiado(version_leida)
     return df.sort_values('Fecha')
 
-def cargar_modelos():
-    try:
-        mod_temp = joblib.load(RUTA_MODELO_TEMP)
-        cols_temp = joblib.load(RUTA_COLS_TEMP)
-        mod_lluvia = joblib.load(RUTA_MODELO_LLUVIA)
-        cols_lluvia = joblib.load(RUTA_COLS_LLUVIA)
-        return mod_temp, cols_temp, mod_lluvia, cols_lluvia
-    except Exception as e:
-        st.error(f"Error cargando modelos: {e}")
-        return None, None, None, None
+def cargar_prediccion():
+    # La calcula y publica el pipeline: aquí solo se lee un JSON de unos bytes (sin modelos en memoria)
+    return leer_prediccion_publicada(RUTA_PREDICCION)
+
+@st.cache_resource(max_entries=1)
+def _cargar_modelos(version_modelo):
+    # Solo se deserializan al abrir el replay, y una vez por versión de modelo
+    return cargar_modelos(DIR_MODELOS)
+
+@st.cache_data(max_entries=8)
+def _replay(version_datos, version_modelo, inicio, fin, _df):
+    # Una única inferencia por bloque de fechas; clave = (dataset, modelo, rango).
+    # _df (Streamlit no hashea los argumentos con '_') es el snapshot de exactamente 'version_datos'
+    # La fila del día anterior es la que predice 'inicio'
+    mask = (_df['Fecha'] >= pd.Timestamp(inicio) - timedelta(days=1)) & (_df['Fecha'] < pd.Timestamp(fin))
+    return reproducir_historico(_df.loc[mask], _cargar_modelos(version_modelo))
+
+@st.cache_resource(max_entries=1)
+def _cargar_indice(version_indice):
+    # El pipeline lo reescribe de forma atómica cada día: clave = sello del fichero
+    return cargar_indice(RUTA_INDICE)
+
+@st.cache_resource(max_entries=1)
+def _cargar_clima(version_datos, _df):
+    # El .npz es una caché local que no se versiona: se construye desde el
+    # snapshot del maestro (~0,2 s), una vez por versión; luego cada consulta es un lookup
+    clima = Climatologia()
+    clima.actualizar(_df)
+    return clima
+
+# Ejecuciones que se guardan por sesión en el modo perfil
+MAX_EJECUCIONES_PERFIL = 50
+
+def _cerrar_perfil(memoria):
+    """
+    Modo perfil (METEO_PERFIL_MEMORIA=1): apunta esta ejecución en el
+    historial de la sesión, lo escribe en data/perfiles_memoria/ y lo
+    muestra en la barra lateral. tracemalloc es de todo el proceso: con
+    varias sesiones a la vez, las cifras incluyen lo que hagan las demás.
+    """
+    informe = memoria.informe()
+    if informe is None:
+        return
+    id_sesion = st.session_state.setdefault("id_sesion", uuid.uuid4().hex[:8])
+    historial = st.session_state.setdefault("perfil_memoria", [])
+    historial.append({"ejecucion": len(historial) + 1, "fecha": informe["fecha"], "etapas": informe["etapas"]})
+    del historial[:-MAX_EJECUCIONES_PERFIL]
+    guardar_json_atomico({"sesion": id_sesion, "pico_rss_mb": informe["pico_rss_mb"], "ejecuciones": historial},
+                         os.path.join(DIR_INFORMES, f"dashboard_{id_sesion}.json"))
+
+    with st.sidebar.expander("🧠 Memoria de la sesión", expanded=False):
+        tabla = pd.DataFrame([
+            {"ejecucion": ej["ejecucion"], "etapa": e["etapa"], "pico_py_mb": e["python_pico_mb"],
+             "retenido_mb": e["python_retenido_mb"], "rss_mb": e["rss_mb"],
+             "figuras": e["objetos"]["figuras_abiertas"], "dataframes": e["objetos"]["dataframes"]}
+            for ej in historial for e in ej["etapas"]
+        ])
+        st.line_chart(tabla.groupby("ejecucion")["rss_mb"].max())
+        st.dataframe(tabla.tail(12), use_container_width=True)
+        ultima = historial[-1]["etapas"]
+        st.caption("Más memoria retenida en la última ejecución:")
+        st.dataframe(pd.DataFrame([t for e in ultima for t in e["top"][:3]]), use_container_width=True)
 
 # --- INTERFAZ PRINCIPAL ---
 def interface():
+    memoria = perfil("dashboard")  # Nulo salvo con METEO_PERFIL_MEMORIA=1
+    # st.rerun()/st.stop() lanzan una excepción dentro del script: el perfil se cierra igual
+    try:
+        _pestanas(memoria)
+    finally:
+        _cerrar_perfil(memoria)
+
+def _pestanas(memoria):
     st.title("🌦️ MeteoBCN: Sistema Predictivo Inteligente")
     st.markdown("Dashboard de control para el modelo de predicción meteorológica de Barcelona.")
 
     # Crear Pestañas
-    tab1, tab2 = st.tabs(["🔮 Predicción en Vivo", "📊 Dashboard Analítico"])
+    tab1, tab_replay, tab2 = st.tabs(["🔮 Predicción en Vivo", "🕰️ Replay Histórico", "📊 Dashboard Analítico"])
 
     # ==========================================================================
     # PESTAÑA 1: PREDICCIÓN
     # ==========================================================================
+    memoria.marca("tab_prediccion")
     with tab1:
         st.header("Predicción para Mañana")
         
-        df = cargar_datos()
-        mod_temp, cols_temp, mod_lluvia, cols_lluvia = cargar_modelos()
+        df, version_datos = snapshot_actual()
+        registro = cargar_prediccion()
 
-        if df is None:
-            st.error("❌ No se encuentra el Dataset Maestro. Ejecuta el pipeline primero.")
-        elif mod_temp is None:
-            st.error("❌ No se encuentran los modelos (.pkl).")
+        if registro is None:
+            st.error("❌ No hay predicción publicada. Ejecuta el pipeline (app_prediccion.py) primero.")
         else:
-            # Cogemos la última fila (Datos de Ayer/Hoy)
-            ultima_fila = df.iloc[[-1]].copy()
-            fecha_datos = ultima_fila['Fecha'].values[0]
-            fecha_prediccion = pd.to_datetime(fecha_datos) + timedelta(days=1)
-
-            st.info(f" El modelo está usando los datos registrados el **{pd.to_datetime(fecha_datos).date()}** para predecir el tiempo del **{fecha_prediccion.date()}**.")
-
-            col_btn, col_info = st.columns([1, 4])
-            with col_btn:
-                boton_predecir = st.button(" GENERAR PREDICCIÓN", type="primary", use_container_width=True)
-
-            if boton_predecir:
-                with st.spinner('Analizando patrones climáticos...'):
-                    # 1. Preparar X para Temperatura
-                    X_temp = pd.DataFrame(index=ultima_fila.index)
-                    for col in cols_temp:
-                        X_temp[col] = ultima_fila[col] if col in ultima_fila else 0
-                    
-                    # 2. Preparar X para Lluvia
-                    X_lluvia = pd.DataFrame(index=ultima_fila.index)
-                    for col in cols_lluvia:
-                        X_lluvia[col] = ultima_fila[col] if col in ultima_fila else 0
+            st.info(f" El modelo ha usado los datos registrados el **{registro['fecha_datos']}** para predecir el tiempo del **{registro['fecha_prediccion']}**.")
 
-                    # 3. Predecir
-                    pred_temp = mod_temp.predict(X_temp)[0]
-                    
-                    # Intentar predecir probabilidad si el modelo lo soporta
-                    try:
-                        prob_lluvia = mod_lluvia.predict_proba(X_lluvia)[0][1]
-                    except:
-                        prob_lluvia = mod_lluvia.predict(X_lluvia)[0] # Fallback
-                    
-                    es_lluvia = prob_lluvia > 0.35 # Umbral personalizable
+            if df is not None and str(df['Fecha'].iloc[-1].date()) != registro['fecha_datos']:
+                st.warning("⚠️ El dataset ya tiene datos más nuevos: la predicción se actualizará en la próxima ejecución del pipeline.")
 
-                # --- MOSTRAR RESULTADOS ---
-                st.markdown("---")
-                col_res1, col_res2, col_res3 = st.columns(3)
+            # --- MOSTRAR RESULTADOS ---
+            st.markdown("---")
+            col_res1, col_res2, col_res3 = st.columns(3)
 
-                with col_res1:
-                    st.metric(label="🌡️ Temperatura Esperada", value=f"{pred_temp:.1f} °C")
-                
-                with col_res2:
-                    st.metric(label="💧 Probabilidad de Lluvia", value=f"{prob_lluvia*100:.1f} %")
+            with col_res1:
+                st.metric(label="🌡️ Temperatura Esperada", value=f"{registro['temp_media_c']:.1f} °C")
+            
+            with col_res2:
+                st.metric(label="💧 Probabilidad de Lluvia", value=f"{registro['prob_lluvia']*100:.1f} %")
+
+            with col_res3:
+                if registro['es_lluvia']:
+                    st.markdown("# 🌧️")
+                    st.warning("Se espera lluvia. ¡Coge paraguas!")
+                else:
+                    st.markdown("# ☀️")
+                    st.success("Cielo despejado o poca probabilidad de lluvia.")
+
+            st.caption(f"Modelo {registro['version_modelo']} · publicado {registro['generado']}")
+
+            # Datos técnicos expandibles
+            with st.expander("Ver datos técnicos de entrada (Input del modelo)"):
+                st.json(registro)
+                if df is not None:
+                    st.dataframe(df[df['Fecha'] == pd.Timestamp(registro['fecha_datos'])])
+
+            # --- ¿ES HOY UN DÍA NORMAL? (Climatología del día del año) ---
+            if df is not None:
+                fila_hoy = df[df['Fecha'] == pd.Timestamp(registro['fecha_datos'])]
+                if not fila_hoy.empty:
+                    clima = _cargar_clima(version_datos, df)
+                    st.markdown("---")
+                    st.subheader("📅 ¿Es hoy un día normal?")
+                    st.caption("Comparación con lo habitual para este día del año en el histórico.")
+                    fechas = pd.DatetimeIndex(fila_hoy['Fecha'])
+                    variables = [v for v in ("Temp_Media_C", "Humedad_Media_Pct", "Presion_Media_hPa", "Precip_Total_mm")
+                                 if v in fila_hoy.columns]
+                    for columna, var in zip(st.columns(len(variables)), variables):
+                        valor = fila_hoy[var].to_numpy()
+                        media = clima.valor("media", var, fechas)[0]
+                        pct = clima.percentil(var, fechas, valor)[0]
+                        columna.metric(var, f"{valor[0]:.1f}", f"{valor[0] - media:+.1f} vs media · P{pct * 100:.0f}",
+                                       delta_color="off")
+
+            # --- DÍAS ANÁLOGOS (Explicación + previsión base) ---
+            version_indice = version_maestro(RUTA_INDICE)
+            if df is not None and version_indice is not None:
+                fila_hoy = df[df['Fecha'] == pd.Timestamp(registro['fecha_datos'])]
+                if not fila_hoy.empty:
+                    indice = _cargar_indice(version_indice)
+                    st.markdown("---")
+                    st.subheader("🔎 Días Análogos")
+                    st.caption("Los días del histórico que más se parecieron al de hoy y qué pasó al día siguiente.")
+                    base = indice.prevision(fila_hoy).iloc[0]
+                    col_a1, col_a2 = st.columns(2)
+                    col_a1.metric("🌡️ Previsión por análogos", f"{base['temp_analogos']:.1f} °C",
+                                  f"{base['temp_analogos'] - registro['temp_media_c']:+.1f} vs modelo", delta_color="off")
+                    col_a2.metric("💧 Lluvia en los análogos", f"{base['prob_lluvia_analogos']*100:.0f} %")
+                    st.dataframe(indice.analogos(fila_hoy, k=10), use_container_width=True)
+
+    # ==========================================================================
+    # PESTAÑA REPLAY: PREDICCIÓN VS REAL EN UN RANGO
+    # ==========================================================================
+    memoria.marca("tab_replay")
+    with tab_replay:
+        st.header("Replay de Predicciones")
+        st.caption("Cómo habría predicho el modelo actual cada día del rango. "
+                   "Ojo: los días usados en el entreno dan un error optimista.")
+
+        df, version_datos = snapshot_actual()
+        if df is None or not modelos_disponibles(DIR_MODELOS):
+            st.error("❌ Faltan el dataset o los modelos. Ejecuta el pipeline primero.")
+        else:
+            fecha_max = df['Fecha'].max().date()
+            col_r1, col_r2 = st.columns(2)
+            with col_r1:
+                inicio = st.date_input("Desde", value=fecha_max - timedelta(days=365),
+                                       min_value=df['Fecha'].min().date(), max_value=fecha_max, key="replay_inicio")
+            with col_r2:
+                fin = st.date_input("Hasta", value=fecha_max, min_value=inicio,
+                                    max_value=fecha_max + timedelta(days=1), key="replay_fin")
 
-                with col_res3:
-                    if es_lluvia:
-                        st.markdown("# 🌧️")
-                        st.warning("Se espera lluvia. ¡Coge paraguas!")
-                    else:
-                        st.markdown("# ☀️")
-                        st.success("Cielo despejado o poca probabilidad de lluvia.")
+            replay = _replay(version_datos, version_modelos(DIR_MODELOS), inicio, fin, df)
+            metricas = metricas_replay(replay)
+
+            if metricas is None:
+                st.warning("No hay días con dato real en ese rango.")
+            else:
+                m1, m2, m3, m4, m5 = st.columns(5)
+                m1.metric("Días", metricas['dias'])
+                m2.metric("MAE Temp.", f"{metricas['mae_temp']:.2f} °C")
+                m3.metric("RMSE Temp.", f"{metricas['rmse_temp']:.2f} °C", f"sesgo {metricas['sesgo_temp']:+.2f}")
+                m4.metric("Brier Lluvia", f"{metricas['brier_lluvia']:.3f}")
+                m5.metric("Acierto Lluvia", f"{metricas['acierto_lluvia']*100:.1f} %")
 
-                # Datos técnicos expandibles
-                with st.expander("Ver datos técnicos de entrada (Input del modelo)"):
-                    st.dataframe(ultima_fila)
+            st.subheader("🌡️ Temperatura: Predicha vs Real")
+            st.line_chart(replay.set_index('Fecha')[['temp_pred', 'temp_real']])
+
+            st.subheader("💧 Lluvia: Probabilidad vs Real")
+            st.line_chart(replay.set_index('Fecha')[['prob_lluvia', 'lluvia_real']])
+
+            with st.expander("Ver tabla día a día"):
+                st.dataframe(replay)
 
     # ==========================================================================
     # PESTAÑA 2: GRÁFICOS
     # ==========================================================================
+    memoria.marca("tab_analitico")
     with tab2:
         st.header("Análisis Histórico y Correlaciones")
         
-        df = cargar_datos()
+        df, version_datos = snapshot_actual()
         if df is not None:
             # Filtros laterales dentro de la pestaña
             col_filt1, col_filt2 = st.columns(2)
@@ -151,6 +294,18 @@ def interface():
             st.subheader(" Evolución de la Temperatura")
             st.line_chart(df_filtered.set_index("Fecha")[["Temp_Media_C", "Temp_Maxima_C", "Temp_Minima_C"]])
 
+            # --- GRÁFICO 1b: TEMPERATURA FRENTE A SU BANDA CLIMATOLÓGICA ---
+            clima = _cargar_clima(version_datos, df)
+            fechas = pd.DatetimeIndex(df_filtered['Fecha'])
+            banda = pd.DataFrame({
+                "Temp_Media_C": df_filtered["Temp_Media_C"].to_numpy(),
+                "Clima_P10": clima.valor("p10", "Temp_Media_C", fechas),
+                "Clima_P50": clima.valor("p50", "Temp_Media_C", fechas),
+                "Clima_P90": clima.valor("p90", "Temp_Media_C", fechas),
+            }, index=fechas)
+            st.subheader(" Temperatura vs Climatología (P10 / P50 / P90)")
+            st.line_chart(banda)
+
             # --- GRÁFICO 2: CORRELACIONES ---
             st.subheader(" Mapa de Correlaciones (Heatmap)")
             st.markdown("Este gráfico muestra qué variables influyen más en la temperatura y la lluvia.")
@@ -170,6 +325,7 @@ def interface():
                 corr_matrix = df_filtered[cols_corr].corr()
                 sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', fmt=".2f", linewidths=0.5, ax=ax,annot_kws={"size": 8})
                 st.pyplot(fig, use_container_width=False)
+                plt.close(fig)  # st.pyplot no cierra la figura: sin esto se acumulan en pyplot
                 
             else:
                 st.warning("No hay suficientes datos para calcular correlaciones.")
@@ -211,6 +367,7 @@ def interface():
                     ax_vec.set_ylim(-1.1, 1.1)
                     
                     st.pyplot(fig_vec, use_container_width=False)
+                    plt.close(fig_vec)
                 else:
                     st.warning("Faltan las columnas vectoriales de viento.")
 
@@ -242,4 +399,4 @@ def interface():
                 ax_box.set_xlabel("")
                 
                 st.pyplot(fig_box, use_container_width=False)
-
+                plt.close(fig_box)